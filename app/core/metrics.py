@@ -0,0 +1,290 @@
+"""
+Minimal Prometheus-style metrics.
+
+Recording is a dict lookup and an addition (plus a bisect for histograms),
+with no locks: every writer runs on the process's event loop. Cumulative
+bucket counts and the text exposition are only built when `/metrics` is
+scraped, so an unscraped process pays almost nothing.
+"""
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Latency buckets in seconds, from sub-millisecond Redis calls to slow requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Gauge:
+    """
+    A value that goes up and down, set by whoever owns it (pool utilization
+    is set right before each scrape).
+    """
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = float(value)
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """
+        Observes the duration of the block, in seconds. Works around awaits.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._series.get(labels)
+        return series[1][0] if series else 0.0
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        The Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+MATCHING_STAGE_DURATION = REGISTRY.histogram(
+    "matching_stage_duration_seconds",
+    "Time spent in each stage of match_ride: fetch_ride, geo_search, availability_check, lock, claim, commit.",
+    ("stage",),
+)
+MATCHING_CANDIDATES = REGISTRY.histogram(
+    "matching_candidates", "Candidate drivers per match_ride, after the availability filter.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50),
+)
+MATCHING_LOCK_ATTEMPTS = REGISTRY.counter(
+    "matching_lock_attempts_total", "Driver lock attempts by outcome (acquired or contended).", ("result",)
+)
+MATCHING_RESULTS = REGISTRY.counter(
+    "matching_results_total", "match_ride outcomes: matched, no_driver or closed.", ("result",)
+)
+REDIS_COMMAND_DURATION = REGISTRY.histogram(
+    "redis_command_duration_seconds", "Duration of Redis round trips by operation.", ("operation",)
+)
+NOTIFICATION_DELIVERY_DURATION = REGISTRY.histogram(
+    "notification_delivery_seconds", "Time from queueing a driver offer notification to its delivery."
+)
+NOTIFICATION_BATCH_SIZE = REGISTRY.histogram(
+    "notification_batch_size", "Notifications per push backend call.", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+NOTIFICATIONS = REGISTRY.counter(
+    "notifications_total", "Offer notifications by outcome: delivered, failed, rate_limited or dropped.", ("result",)
+)
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds", "Duration of SQL statements by kind (SELECT, UPDATE, ...).", ("statement",)
+)
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    "db_pool_connections",
+    "Database pool utilization: size, checked_out, checked_in, overflow and max_overflow connections.",
+    ("state",),
+)
+REDIS_POOL_CONNECTIONS = REGISTRY.gauge(
+    "redis_pool_connections", "Redis pool utilization: max_connections, in_use and idle connections.", ("state",)
+)
+
+def record_pool_stats(database: dict, redis: dict):
+    """
+    Copies `pool_stats` and `redis_pool_stats` into the pool gauges.
+    """
+    for gauge, stats in ((DB_POOL_CONNECTIONS, database), (REDIS_POOL_CONNECTIONS, redis)):
+        for state, value in stats.items():
+            if isinstance(value, (int, float)):
+                gauge.set(value, state)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording HTTP_REQUEST_DURATION.
+
+    Requests are labelled with the matched route's path template
+    (`/ride/{ride_id}`), not the raw path, to keep the label set bounded.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            )
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    """
+    Times every statement the engine runs into DB_QUERY_DURATION, labelled
+    by its leading keyword.
+    """
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        keyword = statement.lstrip().split(None, 1)[0].upper()
+        DB_QUERY_DURATION.observe(time.perf_counter() - context.metrics_started, keyword)
+    return engine
+
+async def serve_metrics(
+    port: int, host: str = "0.0.0.0", on_scrape: Optional[Callable[[], None]] = None
+) -> asyncio.AbstractServer:
+    """
+    Serves `GET /metrics` for processes without the API, such as the
+    matching workers. `on_scrape` runs before each render, e.g. to update
+    gauges. Close the returned server to stop.
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # Skip the headers; the scrape has no body
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                if on_scrape:
+                    on_scrape()
+                status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+                body = REGISTRY.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,36 @@
+from typing import Optional
+from fastapi import Request
+from redis.asyncio import ConnectionPool, Redis
+from app.core.config import Settings, get_settings
+
+def create_redis_pool(settings: Optional[Settings] = None, url: Optional[str] = None) -> ConnectionPool:
+    """
+    Creates a Redis connection pool shared by every client of a process.
+    """
+    settings = settings or get_settings()
+    return ConnectionPool.from_url(
+        url or settings.redis_url,
+        max_connections=settings.redis_max_connections,
+        socket_timeout=settings.redis_socket_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+    )
+
+def create_redis(url: Optional[str] = None) -> Redis:
+    """
+    Creates a client over its own pool, for scripts and workers. Closing
+    the client closes the pool.
+    """
+    return Redis.from_pool(create_redis_pool(url=url))
+
+def redis_pool_stats(pool: ConnectionPool) -> dict:
+    """
+    Utilization of a Redis connection pool.
+    """
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": len(pool._in_use_connections),
+        "idle": len(pool._available_connections),
+    }
+
+async def get_redis(request: Request):
+    yield request.app.state.redis
@@ -1,10 +1,71 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers import ride
+from fastapi.responses import PlainTextResponse
+from redis.asyncio import Redis
+from app.core.config import get_settings
+from app.core.metrics import REGISTRY, MetricsMiddleware, instrument_engine, record_pool_stats
+from app.db.base import create_engine, create_session_factory, pool_stats
+from app.db.redis import create_redis_pool, redis_pool_stats
+from app.routers import ride, location, driver, history
+from app.services.fare_estimator import get_fare_estimator
+from app.services.location_buffer import LocationWriteBuffer
+from app.services.location_service import LocationService
+from app.services.ride_events import RideEventHub
+from app.services.surge_pricing import SurgeMapUpdater, SurgePricingService
 
-app = FastAPI(title="Uber Clone API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One engine and one Redis connection pool per process, shared by every
+    # request through get_db / get_redis
+    app.state.engine = instrument_engine(create_engine())
+    app.state.session_factory = create_session_factory(app.state.engine)
+    app.state.redis_pool = create_redis_pool()
+    app.state.redis = Redis.from_pool(app.state.redis_pool)
+
+    # Keep this process's copy of the surge map fresh, so fare estimates
+    # read it from memory. The map itself is computed by the surge pricer.
+    surge_updater = SurgeMapUpdater(
+        SurgePricingService(app.state.redis, LocationService(app.state.redis), app.state.session_factory),
+        on_update=get_fare_estimator().set_surge_map,
+    )
+    # One pub/sub connection feeds every ride event stream of this process
+    app.state.ride_event_hub = RideEventHub(app.state.redis)
+    # Coalesces this process's driver pings; stopping it flushes the rest
+    settings = get_settings()
+    app.state.location_buffer = LocationWriteBuffer(
+        LocationService(app.state.redis),
+        flush_interval=settings.location_flush_interval,
+        max_pending=settings.location_max_pending,
+    )
+    try:
+        async with surge_updater, app.state.ride_event_hub, app.state.location_buffer:
+            yield
+    finally:
+        await app.state.redis.aclose()
+        await app.state.engine.dispose()
+
+app = FastAPI(title="Uber Clone API", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(ride.router)
+app.include_router(location.router)
+app.include_router(driver.router)
+app.include_router(history.router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+@app.get("/health/pools")
+async def pool_health():
+    return {
+        "database": pool_stats(app.state.engine),
+        "redis": redis_pool_stats(app.state.redis_pool),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # The pools only exist once the lifespan has run
+    if hasattr(app.state, "engine"):
+        record_pool_stats(pool_stats(app.state.engine), redis_pool_stats(app.state.redis_pool))
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Enum, Index, text
 from sqlalchemy.orm import relationship
 import enum
 from datetime import datetime
@@ -44,6 +44,15 @@ class DriverProfile(Base):
     
     user = relationship("User", back_populates="driver_profile")
 
+    __table_args__ = (
+        # Only available drivers: the availability reconcile and the matching
+        # fallback read this small slice, not the whole fleet
+        Index(
+            "ix_driver_profiles_available", "user_id",
+            postgresql_where=text("is_available"), sqlite_where=text("is_available = 1"),
+        ),
+    )
+
 class Ride(Base):
     __tablename__ = "rides"
 
@@ -62,6 +71,64 @@ class Ride(Base):
     
     estimated_fare = Column(Float, nullable=True)
     estimated_time = Column(Integer, nullable=True) # in seconds
+    match_radius_km = Column(Float, nullable=True) # search radius that found the driver
     
     rider = relationship("User", foreign_keys=[rider_id], back_populates="rides_as_rider")
     driver = relationship("User", foreign_keys=[driver_id], back_populates="rides_as_driver")
+
+    __table_args__ = (
+        # Open requests (surge demand) are a tiny, hot slice of the table
+        Index(
+            "ix_rides_requested_created_at", "created_at",
+            postgresql_where=text("status = 'REQUESTED'"), sqlite_where=text("status = 'REQUESTED'"),
+        ),
+        # Finished rides waiting for the archiver, oldest first
+        Index(
+            "ix_rides_finished_updated_at", "updated_at",
+            postgresql_where=text("status IN ('COMPLETED', 'CANCELLED')"),
+            sqlite_where=text("status IN ('COMPLETED', 'CANCELLED')"),
+        ),
+        # Ride history, newest first, with the ID as a tie-breaker
+        Index("ix_rides_rider_id_created_at", "rider_id", "created_at", "id"),
+        Index(
+            "ix_rides_driver_id_created_at", "driver_id", "created_at", "id",
+            postgresql_where=text("driver_id IS NOT NULL"), sqlite_where=text("driver_id IS NOT NULL"),
+        ),
+    )
+
+
+class ArchivedRide(Base):
+    """
+    A completed or cancelled ride, moved out of `rides` by the archiver.
+
+    Same columns as `Ride`, so rows are copied with one INSERT ... SELECT.
+    On Postgres the table is range-partitioned by month of `created_at`;
+    the partition key has to be part of the primary key.
+    """
+    __tablename__ = "rides_archive"
+
+    id = Column(Integer, primary_key=True)
+    rider_id = Column(Integer, nullable=False)
+    driver_id = Column(Integer, nullable=True)
+
+    source_lat = Column(Float, nullable=False)
+    source_long = Column(Float, nullable=False)
+    dest_lat = Column(Float, nullable=False)
+    dest_long = Column(Float, nullable=False)
+
+    status = Column(Enum(RideStatus))
+    created_at = Column(DateTime, primary_key=True)
+    updated_at = Column(DateTime)
+
+    estimated_fare = Column(Float, nullable=True)
+    estimated_time = Column(Integer, nullable=True) # in seconds
+    match_radius_km = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_rides_archive_rider_id_created_at", "rider_id", "created_at", "id"),
+        Index(
+            "ix_rides_archive_driver_id_created_at", "driver_id", "created_at", "id",
+            postgresql_where=text("driver_id IS NOT NULL"), sqlite_where=text("driver_id IS NOT NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
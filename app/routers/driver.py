@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis.asyncio import Redis
+from app.db.base import get_db
+from app.db.redis import get_redis
+from app.schemas.driver import DriverAvailabilityInput
+from app.services.availability_service import AvailabilityService
+
+router = APIRouter(prefix="/driver", tags=["drivers"])
+
+@router.patch("/availability")
+async def update_driver_availability(
+    input: DriverAvailabilityInput,
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+):
+    """
+    Marks a driver as available (online) or unavailable. Written through
+    to Postgres and the Redis availability mirror used by matching.
+    """
+    updated = await AvailabilityService(redis).set_availability(db, input.driver_id, input.available)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Driver profile not found")
+    return {"status": "ok", "available": input.available}
@@ -0,0 +1,43 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import get_db
+from app.schemas.ride import RideHistoryPage
+from app.services.ride_history import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, RideHistory, decode_cursor, stream_page
+
+router = APIRouter(tags=["rides"])
+
+async def ride_history(db: AsyncSession, owner: str, user_id: int, limit: int, cursor: Optional[str]):
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    page = await RideHistory(db).page(owner, user_id, limit, before)
+    return StreamingResponse(stream_page(page), media_type="application/json")
+
+@router.get("/riders/{rider_id}/rides", response_model=RideHistoryPage)
+async def rider_rides(
+    rider_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    The rider's rides, newest first. Pass `next_cursor` back as `cursor`
+    for the next page; it is null on the last page.
+    """
+    return await ride_history(db, "rider", rider_id, limit, cursor)
+
+@router.get("/drivers/{driver_id}/rides", response_model=RideHistoryPage)
+async def driver_rides(
+    driver_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    The rides the driver was assigned, newest first, paginated like the
+    rider history.
+    """
+    return await ride_history(db, "driver", driver_id, limit, cursor)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+from redis.asyncio import Redis
+from app.db.redis import get_redis
+from app.schemas.location import LocationBatchUpdate, LocationBatchResponse
+from app.services.location_buffer import LocationWriteBuffer, get_location_buffer
+from app.services.ride_events import RideEventPublisher
+
+router = APIRouter(prefix="/location", tags=["location"])
+
+@router.patch("/update/batch", response_model=LocationBatchResponse)
+async def update_locations_batch(
+    batch: LocationBatchUpdate,
+    redis: Redis = Depends(get_redis),
+    location_buffer: LocationWriteBuffer = Depends(get_location_buffer),
+):
+    """
+    Ingests many driver pings at once, e.g. from a gateway aggregator.
+
+    Pings go through the process's write-behind buffer: the geo index is
+    written once per driver per flush interval, however often they ping.
+    """
+    pings = [(update.driver_id, update.lat, update.long) for update in batch.updates]
+    updated = await location_buffer.add_many(pings)
+    # Riders following an active ride see their driver move
+    await RideEventPublisher(redis).driver_positions(pings)
+    return {"status": "ok", "updated": updated}
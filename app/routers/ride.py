@@ -1,71 +1,204 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+import logging
+from contextlib import AsyncExitStack
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.core.metrics import REDIS_COMMAND_DURATION
 from app.db.base import get_db
-from app.models.models import Ride, RideStatus, DriverProfile
-from app.schemas.ride import RideRequestCreate, RideResponse, DriverAcceptInput
+from app.db.redis import get_redis
+from app.models.models import ArchivedRide, Ride, RideStatus
+from app.schemas.ride import (
+    RideRequestCreate, RideResponse, DriverAcceptInput, FareEstimateRequest, FareEstimateResponse
+)
+from app.services.availability_service import AvailabilityService
+from app.services.fare_estimator import FareEstimator, get_fare_estimator
+from app.services.offer_service import RideOfferService
+from app.services.ride_assignment import AssignmentResult, assign_driver
+from app.services.ride_cache import CachedRide, RideCache, etag_matches
+from app.services.ride_events import (
+    FINAL_STATUSES, KEEPALIVE_INTERVAL, RideEventHub, RideEventPublisher, get_ride_event_hub, sse_message
+)
+from app.services.ride_queue import RideRequestQueue
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ride", tags=["rides"])
 
+FINAL_STATUS_VALUES = {final.value for final in FINAL_STATUSES}
+
+ACCEPT_ERRORS = {
+    AssignmentResult.RIDE_NOT_FOUND: (404, "Ride not found"),
+    AssignmentResult.DRIVER_NOT_FOUND: (404, "Driver profile not found"),
+    AssignmentResult.RIDE_NOT_REQUESTED: (400, "Ride is already matched or completed"),
+    AssignmentResult.DRIVER_NOT_AVAILABLE: (400, "Driver is not available"),
+}
+
+@router.post("/fair-estimate", response_model=FareEstimateResponse)
+async def fare_estimate(
+    estimate_in: FareEstimateRequest,
+    estimator: FareEstimator = Depends(get_fare_estimator),
+):
+    estimate = estimator.estimate(
+        (estimate_in.source_lat, estimate_in.source_long), (estimate_in.dest_lat, estimate_in.dest_long)
+    )
+    return FareEstimateResponse(
+        distance_km=estimate.distance_km,
+        estimated_fare=estimate.fare,
+        estimated_time=estimate.duration_s,
+        surge_multiplier=estimate.surge_multiplier,
+    )
+
 @router.post("/request", response_model=RideResponse, status_code=status.HTTP_201_CREATED)
-async def create_ride_request(ride_in: RideRequestCreate, db: AsyncSession = Depends(get_db)):
+async def create_ride_request(
+    ride_in: RideRequestCreate,
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    estimator: FareEstimator = Depends(get_fare_estimator),
+):
+    estimate = estimator.estimate((ride_in.source_lat, ride_in.source_long), (ride_in.dest_lat, ride_in.dest_long))
     ride = Ride(
         rider_id=ride_in.rider_id,
         source_lat=ride_in.source_lat,
         source_long=ride_in.source_long,
         dest_lat=ride_in.dest_lat,
         dest_long=ride_in.dest_long,
-        status=RideStatus.REQUESTED
+        status=RideStatus.REQUESTED,
+        estimated_fare=estimate.fare,
+        estimated_time=estimate.duration_s,
     )
     db.add(ride)
     await db.commit()
     await db.refresh(ride)
+    # The rider starts polling right away; have the first poll hit the cache
+    await RideCache(redis).put(ride)
     
-    # In a real system, this would trigger the Matching Service asynchronously.
-    # For now, we just return the created ride.
+    # Hand the ride to the matching workers through the regional queue.
+    # The ride is already persisted, so a queue outage must not fail the
+    # request; the ride simply stays REQUESTED.
+    try:
+        with REDIS_COMMAND_DURATION.time("enqueue_ride"):
+            await RideRequestQueue(redis).enqueue(ride.id, ride.source_lat, ride.source_long)
+    except RedisError:
+        logger.warning(f"Failed to enqueue ride {ride.id} for matching", exc_info=True)
     
     return ride
 
+async def load_ride(db: AsyncSession, redis: Redis, ride_id: int) -> CachedRide:
+    """
+    The ride's serialized response, from the ride cache or else from
+    Postgres (hot table, then archive). Raises 404 if there is no such ride.
+    """
+    cache = RideCache(redis)
+    cached = await cache.get(ride_id)
+    if cached is None:
+        result = await db.execute(select(Ride).where(Ride.id == ride_id))
+        ride = result.scalars().first()
+        if not ride:
+            # Finished rides are eventually moved to the archive
+            result = await db.execute(select(ArchivedRide).where(ArchivedRide.id == ride_id))
+            ride = result.scalars().first()
+        if not ride:
+            raise HTTPException(status_code=404, detail="Ride not found")
+        cached = await cache.put(ride)
+    return cached
+
 @router.get("/{ride_id}", response_model=RideResponse)
-async def get_ride_status(ride_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Ride).where(Ride.id == ride_id))
-    ride = result.scalars().first()
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
-    return ride
+async def get_ride_status(
+    ride_id: int,
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    if_none_match: Optional[str] = Header(None),
+):
+    # Riders poll this while waiting for a match. Polls are served from the
+    # ride cache, and a poll that already has the current ETag gets a 304
+    # without touching Postgres.
+    cached = await load_ride(db, redis, ride_id)
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cached.etag})
+    return Response(content=cached.body, media_type="application/json", headers={"ETag": cached.etag})
+
+async def stream_ride_events(snapshot: CachedRide, queue: asyncio.Queue, subscription: AsyncExitStack):
+    async with subscription:
+        yield sse_message("ride", snapshot.body.decode())
+        if json.loads(snapshot.body)["status"] in FINAL_STATUS_VALUES:
+            return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield sse_message(event["type"], json.dumps(event))
+            if event["type"] == "status" and event["status"] in FINAL_STATUS_VALUES:
+                return
+
+@router.get("/{ride_id}/events")
+async def ride_events(
+    ride_id: int,
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    hub: RideEventHub = Depends(get_ride_event_hub),
+):
+    """
+    Server-sent events for one ride, replacing status polling. The stream
+    opens with a `ride` event holding the current ride, then sends
+    `status` events on every transition and `position` events with the
+    assigned driver's location, and closes once the ride is completed or
+    cancelled.
+    """
+    # Subscribe before reading the snapshot, so no transition falls between
+    subscription = AsyncExitStack()
+    queue = await subscription.enter_async_context(hub.listen(ride_id))
+    try:
+        snapshot = await load_ride(db, redis, ride_id)
+    except BaseException:
+        await subscription.aclose()
+        raise
+    # The stream may stay open for minutes; don't hold a pooled connection
+    await db.close()
+    return StreamingResponse(
+        stream_ride_events(snapshot, queue, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 @router.patch("/driver/accept")
-async def driver_accept_ride(input: DriverAcceptInput, db: AsyncSession = Depends(get_db)):
-    # 1. Fetch Ride
-    result = await db.execute(select(Ride).where(Ride.id == input.ride_id))
-    ride = result.scalars().first()
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
-    
+async def driver_accept_ride(
+    input: DriverAcceptInput,
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+):
     if not input.accept:
-        # In this MVP, denial just returns OK. 
-        # In a real system, the matching loop would continue.
+        result = await db.execute(select(Ride.id).where(Ride.id == input.ride_id))
+        if result.scalar() is None:
+            raise HTTPException(status_code=404, detail="Ride not found")
+        # Free the driver and let the offer loop move on without waiting
+        # for the offer to time out
+        try:
+            await RideOfferService(redis).decline(input.ride_id, input.driver_id)
+        except RedisError:
+            logger.warning(f"Failed to record declined offer for ride {input.ride_id}", exc_info=True)
         return {"status": "denied"}
 
-    # 2. Fetch Driver Profile
-    result = await db.execute(select(DriverProfile).where(DriverProfile.user_id == input.driver_id))
-    profile = result.scalars().first()
-    if not profile:
-        raise HTTPException(status_code=404, detail="Driver profile not found")
-    
-    if profile.user_id == ride.driver_id and ride.status == RideStatus.MATCHED:
-        return {"status": "accepted"}
-
-    if ride.status != RideStatus.REQUESTED:
-        raise HTTPException(status_code=400, detail="Ride is already matched or completed")
-    
-    if not profile.is_available:
-         raise HTTPException(status_code=400, detail="Driver is not available")
+    # With the ride offered to several drivers at once, only the first accept
+    # flips it out of REQUESTED; the others fail on the conditional UPDATE
+    outcome = await assign_driver(db, input.ride_id, input.driver_id)
+    if outcome in ACCEPT_ERRORS:
+        status_code, detail = ACCEPT_ERRORS[outcome]
+        raise HTTPException(status_code=status_code, detail=detail)
 
-    # 3. Update Status
-    ride.status = RideStatus.MATCHED
-    ride.driver_id = input.driver_id
-    profile.is_available = False
-    
-    await db.commit()
+    if outcome == AssignmentResult.ASSIGNED:
+        await RideCache(redis).invalidate(input.ride_id)
+        await RideEventPublisher(redis).ride_matched(input.ride_id, input.driver_id)
+        await AvailabilityService(redis).mirror(input.driver_id, False)
+        try:
+            await RideOfferService(redis).accepted(input.ride_id, input.driver_id)
+        except RedisError:
+            logger.warning(f"Failed to release offers for ride {input.ride_id}", exc_info=True)
     return {"status": "accepted"}
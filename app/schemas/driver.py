@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+class DriverAvailabilityInput(BaseModel):
+    driver_id: int
+    available: bool
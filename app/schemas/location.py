@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+# Upper bound on pings accepted in a single batch request from a gateway.
+MAX_BATCH_UPDATES = 1000
+
+class LocationUpdate(BaseModel):
+    driver_id: int
+    lat: float = Field(ge=-85.05112878, le=85.05112878)
+    long: float = Field(ge=-180.0, le=180.0)
+
+class LocationBatchUpdate(BaseModel):
+    updates: List[LocationUpdate] = Field(min_length=1, max_length=MAX_BATCH_UPDATES)
+
+class LocationBatchResponse(BaseModel):
+    status: str
+    updated: int
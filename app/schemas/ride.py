@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional
 from datetime import datetime
 
 class RideRequestCreate(BaseModel):
@@ -9,6 +9,18 @@ class RideRequestCreate(BaseModel):
     dest_lat: float
     dest_long: float
 
+class FareEstimateRequest(BaseModel):
+    source_lat: float = Field(ge=-85.05112878, le=85.05112878)
+    source_long: float = Field(ge=-180.0, le=180.0)
+    dest_lat: float = Field(ge=-85.05112878, le=85.05112878)
+    dest_long: float = Field(ge=-180.0, le=180.0)
+
+class FareEstimateResponse(BaseModel):
+    distance_km: float
+    estimated_fare: float
+    estimated_time: int # in seconds
+    surge_multiplier: float = 1.0
+
 class RideResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -22,6 +34,11 @@ class RideResponse(BaseModel):
     status: str
     created_at: datetime
     estimated_fare: Optional[float] = None
+    estimated_time: Optional[int] = None
+
+class RideHistoryPage(BaseModel):
+    rides: List[RideResponse]
+    next_cursor: Optional[str] = None # pass back as `cursor` for the next page
 
 class DriverAcceptInput(BaseModel):
     ride_id: int
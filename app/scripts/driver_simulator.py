@@ -1,58 +1,223 @@
 import typer
 import asyncio
-import random
-from redis.asyncio import Redis
-from app.services.location_service import LocationService
+import math
+import time
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from app.db.redis import create_redis
+from app.services.location_service import LocationService, DEFAULT_BATCH_SIZE
 import os
 
-async def simulate(driver_ids: list[int], interval: float, redis_url: str, iterations: int = None):
+# San Francisco center
+BASE_LAT = 37.7749
+BASE_LONG = -122.4194
+CITY_RADIUS_KM = 10.0
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Street speed limits in m/s (30, 50 and 80 km/h) and how common each is
+SPEED_LIMITS = np.array([8.3, 13.9, 22.2])
+SPEED_LIMIT_WEIGHTS = np.array([0.6, 0.3, 0.1])
+ACCELERATION_NOISE = 1.5 # m/s^2
+TURN_RATE = 0.05 # turns per second at intersections
+HOTSPOT_PULL_RATE = 0.02 # chance per second to head for the driver's hotspot
+HOTSPOT_SHARE = 0.7 # drivers that start near a hotspot, the rest anywhere
+DEFAULT_WRITERS = 4
+REPORT_INTERVAL = 5.0 # seconds between progress lines
+
+class DriverFleet:
+    """
+    Vectorized motion model for many simulated drivers.
+
+    Drivers follow a grid of streets (headings are multiples of 90 degrees),
+    turn at random, accelerate and brake within their street's speed limit,
+    and drift towards a hotspot assigned to them. Drivers that reach the
+    city edge turn back.
+    """
+    def __init__(
+        self,
+        driver_ids: Sequence[int],
+        center: Tuple[float, float] = (BASE_LAT, BASE_LONG),
+        radius_km: float = CITY_RADIUS_KM,
+        hotspots: int = 5,
+        seed: Optional[int] = None,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.driver_ids = np.asarray(driver_ids)
+        n = len(self.driver_ids)
+
+        center = np.asarray(center, dtype=float)
+        self.cos_lat = math.cos(math.radians(center[0]))
+        radius_lat = radius_km * 1000 / METERS_PER_DEGREE_LAT
+        radius_long = radius_lat / self.cos_lat
+        self.lower = np.array([center[0] - radius_lat, center[1] - radius_long])
+        self.upper = np.array([center[0] + radius_lat, center[1] + radius_long])
+
+        hotspot_count = max(1, hotspots)
+        self.hotspots = self.rng.uniform(
+            center - (self.upper - self.lower) / 4, center + (self.upper - self.lower) / 4, size=(hotspot_count, 2)
+        )
+        self.hotspot_of = self.rng.integers(0, hotspot_count, n)
+
+        near_hotspot = self.rng.random(n) < HOTSPOT_SHARE
+        self.positions = self.rng.uniform(self.lower, self.upper, size=(n, 2))
+        self.positions[near_hotspot] = self.hotspots[self.hotspot_of[near_hotspot]] + self.rng.normal(
+            0, radius_lat / 10, size=(int(near_hotspot.sum()), 2)
+        )
+        np.clip(self.positions, self.lower, self.upper, out=self.positions)
+
+        self.headings = self.rng.integers(0, 4, n) * (math.pi / 2)
+        self.speed_limits = self.rng.choice(SPEED_LIMITS, size=n, p=SPEED_LIMIT_WEIGHTS)
+        self.speeds = self.rng.uniform(0, 1, n) * self.speed_limits
+
+    def __len__(self):
+        return len(self.driver_ids)
+
+    def step(self, dt: float):
+        """
+        Advances every driver by `dt` seconds.
+        """
+        n = len(self)
+        self.speeds = np.clip(
+            self.speeds + self.rng.normal(0, ACCELERATION_NOISE, n) * dt, 0, self.speed_limits
+        )
+
+        turning = self.rng.random(n) < TURN_RATE * dt
+        self.headings[turning] += self.rng.choice([-math.pi / 2, math.pi / 2], int(turning.sum()))
+
+        # Head along the street axis that closes most of the gap to the hotspot
+        pulled = self.rng.random(n) < HOTSPOT_PULL_RATE * dt
+        if pulled.any():
+            gap = self.hotspots[self.hotspot_of[pulled]] - self.positions[pulled]
+            gap_m = gap * [METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LAT * self.cos_lat]
+            north_south = np.abs(gap_m[:, 0]) >= np.abs(gap_m[:, 1])
+            self.headings[pulled] = np.where(
+                north_south,
+                np.where(gap_m[:, 0] >= 0, 0.0, math.pi),
+                np.where(gap_m[:, 1] >= 0, math.pi / 2, 3 * math.pi / 2),
+            )
+
+        meters = self.speeds * dt
+        self.positions[:, 1] += meters * np.sin(self.headings) / (
+            METERS_PER_DEGREE_LAT * np.cos(np.radians(self.positions[:, 0]))
+        )
+        self.positions[:, 0] += meters * np.cos(self.headings) / METERS_PER_DEGREE_LAT
+
+        # Turn around at the city edge
+        outside = (self.positions < self.lower) | (self.positions > self.upper)
+        bounced = outside.any(axis=1)
+        self.headings[bounced] += math.pi
+        np.clip(self.positions, self.lower, self.upper, out=self.positions)
+
+    def pings(self, indices: np.ndarray) -> List[Tuple[int, float, float]]:
+        """
+        Current (driver_id, lat, long) of the given drivers.
+        """
+        return list(zip(
+            self.driver_ids[indices].tolist(),
+            self.positions[indices, 0].tolist(),
+            self.positions[indices, 1].tolist(),
+        ))
+
+class SimulationStats:
+    def __init__(self, target_rate: float):
+        self.target_rate = target_rate
+        self.updates = 0
+        self.ticks = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def achieved_rate(self) -> float:
+        return self.updates / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.updates} updates in {self.elapsed:.1f}s: "
+            f"{self.achieved_rate:.0f} updates/s (target {self.target_rate:.0f}/s)"
+        )
+
+async def simulate(
+    driver_ids: list[int],
+    interval: float,
+    redis_url: str,
+    iterations: int = None,
+    rate: Optional[float] = None,
+    writers: int = DEFAULT_WRITERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    hotspots: int = 5,
+    seed: Optional[int] = None,
+) -> SimulationStats:
     """
     Simulates driver movement and updates locations in Redis.
+
+    Every tick moves the whole fleet, then `writers` concurrent tasks each
+    write their share of the positions with batched, pipelined GEOADDs.
+    With `rate` (updates/s), the tick interval is derived from it so every
+    driver reports once per tick.
     """
-    redis_client = Redis.from_url(redis_url)
+    if rate:
+        interval = len(driver_ids) / rate
+    redis_client = create_redis(redis_url)
     location_service = LocationService(redis_client)
-    
-    # Starting points (e.g., San Francisco center)
-    base_lat = 37.7749
-    base_long = -122.4194
-    
-    # Initialize locations
-    driver_locs = {did: (base_lat + random.uniform(-0.01, 0.01), 
-                         base_long + random.uniform(-0.01, 0.01)) 
-                   for did in driver_ids}
-    
-    typer.echo(f"Starting simulation for drivers: {driver_ids}")
-    
-    count = 0
+    fleet = DriverFleet(driver_ids, hotspots=hotspots, seed=seed)
+    shards = [shard for shard in np.array_split(np.arange(len(fleet)), max(1, writers)) if len(shard)]
+    stats = SimulationStats(target_rate=len(fleet) / interval if interval > 0 else float("inf"))
+
+    async def write(shard: np.ndarray) -> int:
+        return await location_service.update_locations_bulk(fleet.pings(shard), batch_size=batch_size)
+
+    typer.echo(
+        f"Starting simulation for {len(fleet)} drivers with {len(shards)} writers, "
+        f"target {stats.target_rate:.0f} updates/s"
+    )
+
+    last_step = time.monotonic()
+    last_report = last_step
     try:
-        while iterations is None or count < iterations:
-            for did in driver_ids:
-                # Move slightly
-                lat, lon = driver_locs[did]
-                lat += random.uniform(-0.0005, 0.0005)
-                lon += random.uniform(-0.0005, 0.0005)
-                driver_locs[did] = (lat, lon)
-                
-                await location_service.update_location(did, lat, lon)
-                typer.echo(f"Driver {did}: {lat:.6f}, {lon:.6f}")
-            
-            count += 1
-            if iterations is None or count < iterations:
-                await asyncio.sleep(interval)
+        while iterations is None or stats.ticks < iterations:
+            tick_started = time.monotonic()
+            fleet.step(tick_started - last_step if stats.ticks else interval)
+            last_step = tick_started
+
+            written = await asyncio.gather(*(write(shard) for shard in shards))
+            stats.updates += sum(written)
+            stats.ticks += 1
+
+            now = time.monotonic()
+            if now - last_report >= REPORT_INTERVAL:
+                typer.echo(stats.summary())
+                last_report = now
+            if iterations is None or stats.ticks < iterations:
+                await asyncio.sleep(max(0.0, interval - (now - tick_started)))
     except asyncio.CancelledError:
         typer.echo("Simulation stopped.")
     finally:
+        typer.echo(stats.summary())
         await redis_client.aclose()
+    return stats
 
 def main(
-    driver_ids: str = typer.Option("1,2,3", help="Comma-separated list of driver IDs"),
+    driver_ids: str = typer.Option(None, help="Comma-separated list of driver IDs"),
+    drivers: int = typer.Option(3, help="Number of drivers, with IDs starting at --first-id (ignored with --driver-ids)"),
+    first_id: int = typer.Option(1, help="ID of the first simulated driver"),
     interval: float = typer.Option(5.0, help="Update interval in seconds"),
+    rate: float = typer.Option(None, help="Target updates/s across all drivers (overrides --interval)"),
+    writers: int = typer.Option(DEFAULT_WRITERS, help="Concurrent Redis writer tasks"),
+    batch_size: int = typer.Option(DEFAULT_BATCH_SIZE, help="Pings per pipelined write"),
+    hotspots: int = typer.Option(5, help="Number of demand hotspots drivers gravitate to"),
+    seed: int = typer.Option(None, help="Random seed"),
     redis_url: str = typer.Option("redis://localhost:6379", help="Redis URL"),
     iterations: int = typer.Option(None, help="Number of iterations to run (None for infinite)")
 ):
     url = os.getenv("REDIS_URL", redis_url)
-    ids = [int(i.strip()) for i in driver_ids.split(",")]
-    asyncio.run(simulate(ids, interval, url, iterations))
+    if driver_ids:
+        ids = [int(i.strip()) for i in driver_ids.split(",")]
+    else:
+        ids = list(range(first_id, first_id + drivers))
+    asyncio.run(simulate(ids, interval, url, iterations, rate, writers, batch_size, hotspots, seed))
 
 if __name__ == "__main__":
     typer.run(main)
@@ -0,0 +1,124 @@
+import typer
+import asyncio
+import logging
+import math
+import os
+from contextlib import AsyncExitStack
+from typing import Optional
+import httpx
+from app.core.metrics import instrument_engine, record_pool_stats, serve_metrics
+from app.db.base import create_engine, create_session_factory, pool_stats
+from app.db.redis import create_redis, redis_pool_stats
+from app.services.batch_matching import DEFAULT_MAX_BATCH_SIZE, BatchMatchingService, BatchMatchingWorker
+from app.services.location_service import LocationService
+from app.services.matching_service import DEFAULT_MAX_CANDIDATES, MatchingService
+from app.services.matching_worker import DEFAULT_RECLAIM_IDLE_MS, MATCHING_MODES, MatchingWorkerPool
+from app.services.notification_service import HttpPushBackend, NotificationDispatcher
+from app.services.offer_service import DEFAULT_OFFER_FANOUT, DEFAULT_OFFER_TIMEOUT
+from app.services.ride_queue import RideRequestQueue
+
+async def run(
+    redis_url: str, concurrency: int, max_attempts: int, retry_delay: float,
+    batch_window: float, max_batch_size: int, mode: str, fanout: int, offer_timeout: float,
+    metrics_port: Optional[int] = None, push_gateway: Optional[str] = None,
+):
+    """
+    Runs a matching worker pool, or the batch matcher, until interrupted.
+    """
+    redis_client = create_redis(redis_url)
+    # The worker's own engine, timed into db_query_duration_seconds like the API's
+    engine = instrument_engine(create_engine())
+    session_factory = create_session_factory(engine)
+    queue = RideRequestQueue(redis_client)
+    resources = AsyncExitStack()
+    if batch_window > 0:
+        # Surge mode: each region's queued rides are matched together
+        worker = BatchMatchingWorker(
+            queue,
+            service_factory=lambda db: BatchMatchingService(db, LocationService(redis_client), redis_client),
+            session_factory=session_factory,
+            window=batch_window,
+            max_batch_size=max_batch_size,
+            max_attempts=max_attempts,
+        )
+        typer.echo(f"Starting the batch matcher with {batch_window}s windows")
+    else:
+        reclaim_idle_ms = DEFAULT_RECLAIM_IDLE_MS
+        if mode == "offer":
+            # An offer loop holds its queue entry for one timeout per round;
+            # it must not look orphaned to the reclaimer meanwhile
+            rounds = math.ceil(DEFAULT_MAX_CANDIDATES / fanout)
+            reclaim_idle_ms = max(reclaim_idle_ms, int(2 * rounds * offer_timeout * 1000))
+        notifier = None
+        if mode == "offer" and push_gateway:
+            # Offers reach drivers' phones through the push gateway, batched
+            # and retried off the offer loop
+            client = await resources.enter_async_context(httpx.AsyncClient(base_url=push_gateway))
+            dispatcher = await resources.enter_async_context(NotificationDispatcher(HttpPushBackend(client)))
+            notifier = dispatcher.notify_offer
+            typer.echo(f"Pushing offers through {push_gateway}")
+        worker = MatchingWorkerPool(
+            queue,
+            service_factory=lambda db: MatchingService(
+                db, LocationService(redis_client), redis_client,
+                offer_fanout=fanout, offer_timeout=offer_timeout, offer_notifier=notifier,
+            ),
+            session_factory=session_factory,
+            concurrency=concurrency,
+            max_attempts=max_attempts,
+            retry_delay=retry_delay,
+            reclaim_idle_ms=reclaim_idle_ms,
+            mode=mode,
+        )
+        typer.echo(f"Starting {concurrency} matching workers in {mode} mode as {worker.name}")
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = await serve_metrics(
+            metrics_port,
+            on_scrape=lambda: record_pool_stats(pool_stats(engine), redis_pool_stats(redis_client.connection_pool)),
+        )
+        typer.echo(f"Serving /metrics on port {metrics_port}")
+    await worker.start()
+    try:
+        while True:
+            await asyncio.sleep(10)
+            typer.echo(f"Stats: {worker.stats()}")
+    except asyncio.CancelledError:
+        typer.echo("Matching workers stopped.")
+    finally:
+        await worker.stop()
+        await resources.aclose()
+        if metrics_server:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        await redis_client.aclose()
+        await engine.dispose()
+
+def main(
+    redis_url: str = typer.Option("redis://localhost:6379", help="Redis URL"),
+    concurrency: int = typer.Option(8, help="Number of concurrent matching workers"),
+    max_attempts: int = typer.Option(5, help="Matching attempts per ride before dead-lettering"),
+    retry_delay: float = typer.Option(2.0, help="Initial retry backoff in seconds"),
+    batch_window: float = typer.Option(
+        0.0, help="Match each region's rides together in windows of this many seconds (0: one ride at a time)"
+    ),
+    max_batch_size: int = typer.Option(DEFAULT_MAX_BATCH_SIZE, help="Rides per batch window at most"),
+    mode: str = typer.Option(
+        "match", help=f"One of {', '.join(MATCHING_MODES)}: assign the nearest driver, or offer to drivers who accept"
+    ),
+    fanout: int = typer.Option(DEFAULT_OFFER_FANOUT, help="Drivers offered a ride at once in offer mode"),
+    offer_timeout: float = typer.Option(DEFAULT_OFFER_TIMEOUT, help="Seconds drivers have to accept an offer"),
+    metrics_port: int = typer.Option(None, help="Serve Prometheus metrics on this port at /metrics"),
+    push_gateway: str = typer.Option(None, help="Push gateway URL to notify offered drivers through, in offer mode"),
+):
+    logging.basicConfig(level=logging.INFO)
+    if mode not in MATCHING_MODES:
+        raise typer.BadParameter(f"must be one of {', '.join(MATCHING_MODES)}", param_hint="--mode")
+    url = os.getenv("REDIS_URL", redis_url)
+    asyncio.run(run(
+        url, concurrency, max_attempts, retry_delay, batch_window, max_batch_size, mode, fanout, offer_timeout,
+        metrics_port, push_gateway,
+    ))
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,22 @@
+import typer
+import logging
+import uvicorn
+from app.services.notification_service import DEFAULT_STUB_LATENCY, StubPushBackend, create_push_stub_app
+
+def main(
+    host: str = typer.Option("0.0.0.0", help="Interface to listen on"),
+    port: int = typer.Option(8090, help="Port to listen on"),
+    latency: float = typer.Option(DEFAULT_STUB_LATENCY, help="Median seconds per batched push call"),
+    failure_rate: float = typer.Option(0.0, help="Probability that a single notification fails"),
+    seed: int = typer.Option(None, help="Random seed"),
+):
+    """
+    Serves a stand-in push gateway for `matching_worker --push-gateway`.
+    """
+    logging.basicConfig(level=logging.INFO)
+    # A long-running server keeps no history of what it delivered
+    stub = StubPushBackend(latency, failure_rate=failure_rate, seed=seed, keep_delivered=0)
+    uvicorn.run(create_push_stub_app(stub), host=host, port=port)
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,22 @@
+import asyncio
+import os
+
+from app.db.base import AsyncSessionLocal
+from app.db.redis import create_redis
+from app.services.availability_service import AvailabilityService
+
+async def main():
+    """
+    Rebuilds the Redis availability mirror from Postgres.
+    """
+    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+    redis_client = create_redis(redis_url)
+
+    async with AsyncSessionLocal() as db:
+        count = await AvailabilityService(redis_client).reconcile(db)
+        print(f"Availability mirror rebuilt: {count} available drivers")
+
+    await redis_client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
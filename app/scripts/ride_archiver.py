@@ -0,0 +1,37 @@
+import typer
+import asyncio
+import logging
+from app.services.ride_archiver import (
+    DEFAULT_ARCHIVE_AFTER, DEFAULT_ARCHIVE_BATCH_SIZE, DEFAULT_ARCHIVE_INTERVAL, RideArchiver
+)
+
+async def run(archive_after: float, batch_size: int, interval: float, once: bool):
+    """
+    Moves finished rides to the archive, once or until interrupted.
+    """
+    archiver = RideArchiver(archive_after=archive_after, batch_size=batch_size, interval=interval)
+    if once:
+        typer.echo(f"Archived {await archiver.archive()} rides")
+        return
+
+    typer.echo(f"Archiving rides finished over {archive_after}s ago every {interval}s")
+    await archiver.start()
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    except asyncio.CancelledError:
+        typer.echo(f"Ride archiver stopped after archiving {archiver.archived} rides.")
+    finally:
+        await archiver.stop()
+
+def main(
+    archive_after: float = typer.Option(DEFAULT_ARCHIVE_AFTER, help="Seconds a finished ride stays in the hot table"),
+    batch_size: int = typer.Option(DEFAULT_ARCHIVE_BATCH_SIZE, help="Rides moved per transaction"),
+    interval: float = typer.Option(DEFAULT_ARCHIVE_INTERVAL, help="Seconds between archive passes"),
+    once: bool = typer.Option(False, help="Archive everything eligible, then exit"),
+):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(archive_after, batch_size, interval, once))
+
+if __name__ == "__main__":
+    typer.run(main)
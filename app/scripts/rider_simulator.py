@@ -0,0 +1,479 @@
+import typer
+import asyncio
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, get_db
+from app.db.redis import get_redis
+from app.main import app
+from app.models.models import DriverProfile, Ride, RideStatus, User, UserRole
+from app.scripts.driver_simulator import BASE_LAT, BASE_LONG, CITY_RADIUS_KM, METERS_PER_DEGREE_LAT, DriverFleet
+from app.services.availability_service import AvailabilityService
+from app.services.geo_sharding import haversine_matrix
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+from app.services.matching_worker import MATCHING_MODES, MatchingWorkerPool
+from app.services.notification_service import (
+    DEFAULT_DRIVER_BURST, DEFAULT_DRIVER_RATE, DEFAULT_RETRY_DELAY, DEFAULT_STUB_LATENCY,
+    DriverRateLimiter, NotificationDispatcher, StubPushBackend,
+)
+from app.services.offer_service import DEFAULT_OFFER_TIMEOUT
+from app.services.ride_cache import RideCache
+from app.services.ride_events import RideEventPublisher
+from app.services.ride_queue import RideRequestQueue
+
+cli = typer.Typer(help="Rider demand generator and end-to-end matching replay.")
+
+DEFAULT_GRID_KM = 0.2 # pickups and drop-offs snap to a grid of this pitch
+TRIP_SPEED = 8.0 # m/s, average speed of a trip from pickup to drop-off
+DRIVER_RESPONSE_DELAY = 2.0 # mean seconds before an offered driver accepts
+WORKLOAD_VERSION = 1
+
+class RideEvent(NamedTuple):
+    at: float # seconds from the start of the workload
+    source_lat: float
+    source_long: float
+    dest_lat: float
+    dest_long: float
+
+class Surge(NamedTuple):
+    start: float # seconds from the start of the workload
+    duration: float
+    multiplier: float # peak demand relative to the base rate
+    lat: float
+    long: float
+    radius_km: float = 1.5
+
+def parse_surge(spec: str) -> Surge:
+    """
+    Parses "start:duration:multiplier[:lat:long[:radius_km]]".
+    """
+    parts = [float(part) for part in spec.split(":")]
+    if len(parts) not in (3, 5, 6):
+        raise typer.BadParameter(f"Invalid surge {spec!r}; expected start:duration:multiplier[:lat:long[:radius_km]]")
+    if len(parts) == 3:
+        parts += [BASE_LAT, BASE_LONG]
+    return Surge(*parts)
+
+def surge_intensity(surge: Surge, t: np.ndarray) -> np.ndarray:
+    """
+    Extra demand (as a multiple of the base rate) a surge adds at times `t`:
+    a raised-cosine bump that peaks halfway through the surge.
+    """
+    phase = (t - surge.start) / surge.duration
+    inside = (phase >= 0) & (phase <= 1)
+    return np.where(inside, (surge.multiplier - 1) * 0.5 * (1 - np.cos(2 * math.pi * phase)), 0.0)
+
+def generate_workload(
+    duration: float,
+    rate: float,
+    surges: Sequence[Surge] = (),
+    seed: Optional[int] = None,
+    center: Tuple[float, float] = (BASE_LAT, BASE_LONG),
+    radius_km: float = CITY_RADIUS_KM,
+    grid_km: float = DEFAULT_GRID_KM,
+) -> List[RideEvent]:
+    """
+    Generates ride requests over `duration` seconds.
+
+    Arrivals are a Poisson process with `rate` requests/s, plus surges that
+    raise demand around a point for a while (a non-homogeneous Poisson
+    process, sampled by thinning). Background pickups are spread over the
+    city, surge pickups concentrate around the surge center, and every
+    point snaps to the city grid.
+    """
+    rng = np.random.default_rng(seed)
+    peak = rate * (1 + sum(max(surge.multiplier - 1, 0) for surge in surges))
+    if peak <= 0 or duration <= 0:
+        return []
+
+    # Candidate arrivals at the peak rate, thinned to the actual intensity
+    times = np.cumsum(rng.exponential(1 / peak, size=int(peak * duration * 1.2) + 10))
+    while times[-1] < duration:
+        times = np.concatenate([times, times[-1] + np.cumsum(rng.exponential(1 / peak, size=len(times)))])
+    times = times[times < duration]
+    extra = np.array([surge_intensity(surge, times) for surge in surges]).reshape(len(surges), len(times))
+    intensity = rate * (1 + extra.sum(axis=0))
+    times = times[rng.random(len(times)) * peak < intensity]
+
+    # Attribute each arrival to the background or to one of the surges, in
+    # proportion to their share of the intensity at that moment
+    weights = np.vstack([np.ones(len(times))] + [surge_intensity(surge, times) for surge in surges])
+    cumulative = np.cumsum(weights / weights.sum(axis=0), axis=0)
+    origin = np.minimum((rng.random(len(times)) > cumulative).sum(axis=0), len(surges))
+
+    cos_lat = math.cos(math.radians(center[0]))
+    km_per_lat = METERS_PER_DEGREE_LAT / 1000
+    sources = np.empty((len(times), 2))
+    background = origin == 0
+    sources[background] = rng.uniform(-radius_km, radius_km, size=(int(background.sum()), 2))
+    for index, surge in enumerate(surges, start=1):
+        chosen = origin == index
+        offset = np.array([(surge.lat - center[0]) * km_per_lat, (surge.long - center[1]) * km_per_lat * cos_lat])
+        sources[chosen] = offset + rng.normal(0, surge.radius_km / 2, size=(int(chosen.sum()), 2))
+    # Trips of a few km in a random direction
+    trip_km = rng.gamma(2.0, 2.0, size=len(times))
+    angle = rng.uniform(0, 2 * math.pi, size=len(times))
+    destinations = sources + np.column_stack([trip_km * np.cos(angle), trip_km * np.sin(angle)])
+
+    def to_grid(points_km: np.ndarray) -> np.ndarray:
+        snapped = np.clip(np.round(points_km / grid_km) * grid_km, -radius_km, radius_km)
+        return np.column_stack([
+            center[0] + snapped[:, 0] / km_per_lat,
+            center[1] + snapped[:, 1] / (km_per_lat * cos_lat),
+        ])
+
+    sources, destinations = to_grid(sources), to_grid(destinations)
+    return [
+        RideEvent(round(float(t), 6), *(round(float(value), 6) for value in (*source, *destination)))
+        for t, source, destination in zip(times, sources, destinations)
+    ]
+
+def save_workload(path: str, events: Sequence[RideEvent], meta: Optional[dict] = None):
+    """
+    Records a workload as JSON lines: a header, then one event per line.
+    """
+    with open(path, "w") as f:
+        f.write(json.dumps({"version": WORKLOAD_VERSION, "events": len(events), **(meta or {})}) + "\n")
+        for event in events:
+            f.write(json.dumps(list(event)) + "\n")
+
+def load_workload(path: str) -> List[RideEvent]:
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get("version") != WORKLOAD_VERSION:
+            raise ValueError(f"Unsupported workload version {header.get('version')}")
+        return [RideEvent(*json.loads(line)) for line in f if line.strip()]
+
+class RecordingMatcher:
+    """
+    Wraps MatchingService to note when each ride got its driver.
+    """
+    def __init__(self, service: MatchingService, matched_at: Dict[int, Tuple[float, int]]):
+        self.service = service
+        self.matched_at = matched_at
+
+    async def match_ride(self, ride_id: int):
+        return self._record(ride_id, await self.service.match_ride(ride_id))
+
+    async def offer_ride(self, ride_id: int):
+        return self._record(ride_id, await self.service.offer_ride(ride_id))
+
+    def _record(self, ride_id: int, driver_id: Optional[int]) -> Optional[int]:
+        if driver_id is not None:
+            self.matched_at[ride_id] = (time.monotonic(), driver_id)
+        return driver_id
+
+def percentiles(values: Sequence[float]) -> dict:
+    if not len(values):
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+async def run_workload(
+    events: Sequence[RideEvent],
+    drivers: int = 500,
+    speed: float = 1.0,
+    concurrency: int = 8,
+    drain: float = 10.0,
+    radius_km: float = CITY_RADIUS_KM,
+    seed: Optional[int] = None,
+    mode: str = "match",
+) -> dict:
+    """
+    Replays `events` through the real pipeline, in-process: POST
+    /ride/request, the regional queue, MatchingWorkerPool, then trip
+    completion. A simulated fleet keeps driving and reporting positions
+    meanwhile. SQLite and fakeredis stand in for Postgres and Redis.
+
+    In "match" mode the workers assign drivers directly. In "offer" mode
+    they offer rides instead, through a NotificationDispatcher over the stub
+    push backend. Every driver whose push is delivered answers with PATCH
+    /ride/driver/accept after a random delay, so accepts race as in
+    production.
+
+    Drivers roam a city of `radius_km`, which should match the radius the
+    workload was generated for. Workload time runs `speed` times faster
+    than the wall clock; matching latencies are reported in wall-clock
+    seconds.
+    """
+    # fakeredis is a test dependency; only the replay needs it
+    from fakeredis import FakeAsyncRedis
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "replay.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    redis_client = FakeAsyncRedis()
+    location_service = LocationService(redis_client)
+    availability_service = AvailabilityService(redis_client)
+    ride_cache = RideCache(redis_client)
+    ride_events = RideEventPublisher(redis_client)
+
+    async with session_factory() as db:
+        rider = User(email="replay_rider@example.com", hashed_password="pw")
+        driver_users = [
+            User(email=f"replay_driver{i}@example.com", hashed_password="pw", role=UserRole.DRIVER)
+            for i in range(drivers)
+        ]
+        db.add_all([rider, *driver_users])
+        await db.commit()
+        db.add_all([
+            DriverProfile(user_id=user.id, license_plate=f"R-{i}", car_model="Replay", is_available=True)
+            for i, user in enumerate(driver_users)
+        ])
+        await db.commit()
+        await availability_service.reconcile(db)
+        rider_id = rider.id
+
+    fleet = DriverFleet([user.id for user in driver_users], radius_km=radius_km, seed=seed)
+    index_of = {driver_id: index for index, driver_id in enumerate(fleet.driver_ids.tolist())}
+    await location_service.update_locations_bulk(fleet.pings(np.arange(len(fleet))))
+
+    async def _get_db():
+        async with session_factory() as session:
+            yield session
+    async def _get_redis():
+        yield redis_client
+    app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[get_redis] = _get_redis
+
+    requested_at: Dict[int, float] = {}
+    sources: Dict[int, Tuple[float, float]] = {}
+    matched_at: Dict[int, Tuple[float, int]] = {}
+    pickup_km: Dict[int, float] = {}
+    background = set()
+    responding = set() # drivers answering an offer
+
+    def spawn(coroutine, tasks: set = background):
+        task = asyncio.create_task(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def drive():
+        # Keep the fleet moving in workload time
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(1.0 / speed)
+            now = time.monotonic()
+            fleet.step((now - last) * speed)
+            last = now
+            await location_service.update_locations_bulk(fleet.pings(np.arange(len(fleet))))
+
+    rng = np.random.default_rng(seed)
+    accepts = {"accepted": 0, "rejected": 0}
+    completed = []
+
+    async def respond(client: AsyncClient, ride_id: int, driver_id: int):
+        await asyncio.sleep(rng.exponential(DRIVER_RESPONSE_DELAY) / speed)
+        response = await client.patch(
+            "/ride/driver/accept", json={"ride_id": ride_id, "driver_id": driver_id, "accept": True}
+        )
+        # Drivers offered the same ride race; all but the first get a 400
+        accepts["accepted" if response.status_code == 200 else "rejected"] += 1
+
+    async def trip(client: AsyncClient, ride_id: int, driver_id: int, event: RideEvent):
+        trip_km = float(haversine_matrix([event[1:3]], [event[3:5]])[0, 0])
+        await asyncio.sleep((pickup_km[ride_id] + trip_km) * 1000 / TRIP_SPEED / speed)
+        # Drop off: the driver is free again where the trip ended
+        index = index_of[driver_id]
+        fleet.positions[index] = event.dest_lat, event.dest_long
+        async with session_factory() as db:
+            await db.execute(update(Ride).where(Ride.id == ride_id).values(status=RideStatus.COMPLETED))
+            await availability_service.set_availability(db, driver_id, True)
+        await ride_cache.invalidate(ride_id)
+        await ride_events.status_changed(ride_id, RideStatus.COMPLETED, driver_id)
+        completed.append(ride_id)
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://replay")
+    # Push latency, retries and rate limits run in workload time too
+    dispatcher = NotificationDispatcher(
+        StubPushBackend(
+            DEFAULT_STUB_LATENCY / speed, seed=seed,
+            on_delivered=lambda notification: spawn(
+                respond(client, notification.ride_id, notification.driver_id), responding
+            ),
+        ),
+        flush_interval=0.01 / speed,
+        retry_delay=DEFAULT_RETRY_DELAY / speed,
+        rate_limiter=DriverRateLimiter(DEFAULT_DRIVER_RATE * speed, DEFAULT_DRIVER_BURST),
+    )
+
+    def service_factory(db: AsyncSession):
+        return RecordingMatcher(
+            MatchingService(
+                db, location_service, redis_client,
+                availability_service=availability_service,
+                offer_timeout=DEFAULT_OFFER_TIMEOUT / speed,
+                offer_notifier=dispatcher.notify_offer,
+            ),
+            matched_at,
+        )
+
+    pool = MatchingWorkerPool(
+        RideRequestQueue(redis_client),
+        service_factory=service_factory,
+        session_factory=session_factory,
+        concurrency=concurrency,
+        retry_delay=max(0.05, 2.0 / speed),
+        mode=mode,
+    )
+    events_by_ride: Dict[int, RideEvent] = {}
+    seen_matches = set()
+
+    async def follow_matches(client: AsyncClient):
+        while True:
+            for ride_id in matched_at.keys() - seen_matches:
+                if ride_id not in sources:
+                    # Matched before its POST returned; pick it up next pass
+                    continue
+                seen_matches.add(ride_id)
+                _, driver_id = matched_at[ride_id]
+                driver_position = fleet.positions[index_of[driver_id]]
+                pickup_km[ride_id] = float(haversine_matrix([sources[ride_id]], [driver_position])[0, 0])
+                spawn(trip(client, ride_id, driver_id, events_by_ride[ride_id]))
+            await asyncio.sleep(0.01)
+
+    try:
+        async with client, dispatcher:
+            spawn(drive())
+            spawn(follow_matches(client))
+            async with pool:
+                started = time.monotonic()
+                for event in events:
+                    delay = started + event.at / speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    sent = time.monotonic()
+                    response = await client.post("/ride/request", json={
+                        "rider_id": rider_id,
+                        "source_lat": event.source_lat,
+                        "source_long": event.source_long,
+                        "dest_lat": event.dest_lat,
+                        "dest_long": event.dest_long,
+                    })
+                    ride_id = response.json()["id"]
+                    requested_at[ride_id] = sent
+                    sources[ride_id] = (event.source_lat, event.source_long)
+                    events_by_ride[ride_id] = event
+
+                # Let outstanding rides match, retry or dead-letter
+                deadline = time.monotonic() + drain
+                while time.monotonic() < deadline:
+                    if len(matched_at) + pool.dead_lettered >= len(requested_at):
+                        break
+                    await asyncio.sleep(0.05)
+                # A ride counts as matched as soon as its winner's accept is
+                # recorded; let that and the losers' requests return
+                if responding:
+                    await asyncio.wait(responding, timeout=max(deadline - time.monotonic(), 1.0))
+            tasks = background | responding
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        app.dependency_overrides.clear()
+        await redis_client.aclose()
+        await engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    time_to_match = [
+        matched_at[ride_id][0] - requested_at[ride_id] for ride_id in matched_at if ride_id in requested_at
+    ]
+    return {
+        "requested": len(requested_at),
+        "matched": len(matched_at),
+        "match_rate": len(matched_at) / len(requested_at) if requested_at else 0.0,
+        "dead_lettered": pool.dead_lettered,
+        "completed": len(completed),
+        **({"accepts": accepts, "notifications": dispatcher.stats} if mode == "offer" else {}),
+        "time_to_match_s": percentiles(time_to_match),
+        "pickup_km": percentiles(list(pickup_km.values())),
+    }
+
+def print_report(report: dict):
+    typer.echo(
+        f"Requested {report['requested']}, matched {report['matched']} "
+        f"({report['match_rate']:.1%}), dead-lettered {report['dead_lettered']}, completed {report['completed']}"
+    )
+    if "accepts" in report:
+        typer.echo(f"Accepts: {report['accepts']['accepted']} won, {report['accepts']['rejected']} lost the race")
+        typer.echo(f"Notifications: {report['notifications']}")
+    for name, unit in (("time_to_match_s", "s"), ("pickup_km", "km")):
+        values = report[name]
+        if values["p50"] is None:
+            continue
+        typer.echo(
+            f"{name:<16} p50 {values['p50']:.3f}{unit}  p95 {values['p95']:.3f}{unit}  p99 {values['p99']:.3f}{unit}"
+        )
+
+@cli.command()
+def generate(
+    output: str = typer.Argument(..., help="Workload file to write"),
+    duration: float = typer.Option(300.0, help="Workload length in seconds"),
+    rate: float = typer.Option(1.0, help="Base ride requests per second"),
+    surge: List[str] = typer.Option([], help="start:duration:multiplier[:lat:long[:radius_km]]"),
+    radius_km: float = typer.Option(CITY_RADIUS_KM, help="City radius in km"),
+    seed: int = typer.Option(None, help="Random seed"),
+):
+    """
+    Generates a ride request workload and records it to a file.
+    """
+    events = generate_workload(duration, rate, [parse_surge(spec) for spec in surge], seed, radius_km=radius_km)
+    save_workload(
+        output, events, {"duration": duration, "rate": rate, "surges": surge, "radius_km": radius_km, "seed": seed}
+    )
+    typer.echo(f"Recorded {len(events)} ride requests to {output}")
+
+@cli.command()
+def run(
+    workload: str = typer.Option(None, help="Replay this recorded workload instead of generating one"),
+    record: str = typer.Option(None, help="Record the generated workload to this file"),
+    duration: float = typer.Option(60.0, help="Workload length in seconds"),
+    rate: float = typer.Option(1.0, help="Base ride requests per second"),
+    surge: List[str] = typer.Option([], help="start:duration:multiplier[:lat:long[:radius_km]]"),
+    drivers: int = typer.Option(500, help="Simulated drivers"),
+    speed: float = typer.Option(10.0, help="How many times faster than real time to replay"),
+    concurrency: int = typer.Option(8, help="Matching workers"),
+    mode: str = typer.Option("match", help=f"Worker mode, one of {', '.join(MATCHING_MODES)}"),
+    drain: float = typer.Option(10.0, help="Seconds to wait for outstanding rides after the last request"),
+    radius_km: float = typer.Option(CITY_RADIUS_KM, help="City radius in km"),
+    seed: int = typer.Option(None, help="Random seed"),
+    output: str = typer.Option(None, help="Write the report as JSON to this path"),
+):
+    """
+    Runs a workload through request -> match (or offer -> accept) -> trip
+    and reports time-to-match, match rate and pickup distance.
+    """
+    if mode not in MATCHING_MODES:
+        raise typer.BadParameter(f"must be one of {', '.join(MATCHING_MODES)}", param_hint="--mode")
+    if workload:
+        events = load_workload(workload)
+    else:
+        events = generate_workload(duration, rate, [parse_surge(spec) for spec in surge], seed, radius_km=radius_km)
+        if record:
+            meta = {"duration": duration, "rate": rate, "surges": surge, "radius_km": radius_km, "seed": seed}
+            save_workload(record, events, meta)
+    typer.echo(f"Replaying {len(events)} ride requests at {speed}x against {drivers} drivers")
+
+    logging.disable(logging.WARNING)
+    report = asyncio.run(run_workload(events, drivers, speed, concurrency, drain, radius_km, seed, mode))
+    print_report(report)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,44 @@
+import typer
+import asyncio
+import logging
+import os
+from app.db.redis import create_redis
+from app.services.location_service import DEFAULT_FRESHNESS_SECONDS, LocationService
+from app.services.stale_driver_sweeper import DEFAULT_SWEEP_INTERVAL, StaleDriverSweeper
+
+async def run(redis_url: str, interval: float, max_age: float, once: bool):
+    """
+    Evicts drivers who stopped pinging from the geo index, once or until
+    interrupted.
+    """
+    redis_client = create_redis(redis_url)
+    sweeper = StaleDriverSweeper(LocationService(redis_client), interval=interval, max_age_seconds=max_age)
+    try:
+        if once:
+            typer.echo(f"Evicted {await sweeper.sweep()} stale drivers")
+            return
+
+        typer.echo(f"Evicting drivers silent for over {max_age}s every {interval}s")
+        await sweeper.start()
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            typer.echo(f"Stale driver sweeper stopped after evicting {sweeper.evicted} drivers.")
+        finally:
+            await sweeper.stop()
+    finally:
+        await redis_client.aclose()
+
+def main(
+    redis_url: str = typer.Option("redis://localhost:6379", help="Redis URL"),
+    interval: float = typer.Option(DEFAULT_SWEEP_INTERVAL, help="Seconds between eviction passes"),
+    max_age: float = typer.Option(DEFAULT_FRESHNESS_SECONDS, help="Seconds without a ping before a driver is evicted"),
+    once: bool = typer.Option(False, help="Run a single eviction pass, then exit"),
+):
+    logging.basicConfig(level=logging.INFO)
+    url = os.getenv("REDIS_URL", redis_url)
+    asyncio.run(run(url, interval, max_age, once))
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,47 @@
+import typer
+import asyncio
+import logging
+import os
+from app.db.redis import create_redis
+from app.services.location_service import LocationService
+from app.services.surge_pricing import (
+    DEFAULT_DEMAND_WINDOW, DEFAULT_RECOMPUTE_INTERVAL, DEFAULT_SURGE_RADIUS_KM, SurgeMapUpdater, SurgePricingService
+)
+
+async def run(redis_url: str, interval: float, radius_km: float, demand_window: float):
+    """
+    Recomputes and publishes the surge map until interrupted.
+    """
+    redis_client = create_redis(redis_url)
+    service = SurgePricingService(
+        redis_client, LocationService(redis_client), radius_km=radius_km, demand_window=demand_window
+    )
+
+    def report(surge_map):
+        peak = max(surge_map.multipliers.values(), default=1.0)
+        typer.echo(f"Published surge map: {len(surge_map.multipliers)} surging cells, peak {peak:.1f}x")
+
+    updater = SurgeMapUpdater(service, on_update=report, interval=interval, recompute=True)
+    typer.echo(f"Recomputing surge every {interval}s over {service.grid.shape[0] * service.grid.shape[1]} cells")
+    await updater.start()
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    except asyncio.CancelledError:
+        typer.echo("Surge pricer stopped.")
+    finally:
+        await updater.stop()
+        await redis_client.aclose()
+
+def main(
+    redis_url: str = typer.Option("redis://localhost:6379", help="Redis URL"),
+    interval: float = typer.Option(DEFAULT_RECOMPUTE_INTERVAL, help="Seconds between recomputes"),
+    radius_km: float = typer.Option(DEFAULT_SURGE_RADIUS_KM, help="Radius of the city grid in km"),
+    demand_window: float = typer.Option(DEFAULT_DEMAND_WINDOW, help="Seconds of ride requests counted as demand"),
+):
+    logging.basicConfig(level=logging.INFO)
+    url = os.getenv("REDIS_URL", redis_url)
+    asyncio.run(run(url, interval, radius_km, demand_window))
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,9 +1,9 @@
 import asyncio
 import os
 from sqlalchemy import select, delete
-from redis.asyncio import Redis
 
 from app.db.base import AsyncSessionLocal, engine
+from app.db.redis import create_redis
 from app.models.models import User, DriverProfile, Ride, UserRole, RideStatus
 from app.services.location_service import LocationService
 from app.services.matching_service import MatchingService
@@ -55,7 +55,7 @@ async def main():
         print(f"Created Driver: {driver.id} (Available)")
         
         # 4. Update Driver Location in Redis
-        redis_client = Redis.from_url(redis_url)
+        redis_client = create_redis(redis_url)
         location_service = LocationService(redis_client)
         
         # San Francisco location
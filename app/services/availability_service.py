@@ -0,0 +1,95 @@
+import logging
+from typing import Iterable, List
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import DriverProfile
+
+logger = logging.getLogger(__name__)
+
+# Driver IDs written per SADD while rebuilding the mirror
+RECONCILE_CHUNK_SIZE = 1000
+
+class AvailabilityService:
+    """
+    Mirrors `DriverProfile.is_available` into a Redis set next to the geo
+    index, so matching can filter candidates without querying Postgres.
+
+    Postgres stays the source of truth:
+    - `set_availability` writes through: DB commit first, then the mirror.
+    - Mirror writes are best-effort. A stale "available" entry only costs a
+      failed final DB check in matching, and `reconcile` rebuilds the whole
+      set from Postgres.
+    """
+    def __init__(self, redis_client: Redis):
+        self.redis = redis_client
+        self.key = "available_drivers"
+
+    async def set_availability(self, db: AsyncSession, driver_id: int, available: bool) -> bool:
+        """
+        Updates a driver's availability in Postgres, then in the mirror.
+        Returns False if the driver has no profile.
+        """
+        result = await db.execute(
+            update(DriverProfile)
+            .where(DriverProfile.user_id == driver_id)
+            .values(is_available=available)
+        )
+        if result.rowcount == 0:
+            await db.rollback()
+            return False
+        await db.commit()
+        await self.mirror(driver_id, available)
+        return True
+
+    async def mirror(self, driver_id: int, available: bool):
+        """
+        Records an availability change that has already been committed to
+        Postgres. Failures are logged, not raised; reconciliation repairs them.
+        """
+        try:
+            if available:
+                await self.redis.sadd(self.key, str(driver_id))
+            else:
+                await self.redis.srem(self.key, str(driver_id))
+        except RedisError:
+            logger.warning(f"Failed to mirror availability for driver {driver_id}", exc_info=True)
+
+    async def filter_available(self, driver_ids: Iterable[int]) -> List[int]:
+        """
+        Returns the subset of `driver_ids` marked available, in the same
+        order, using a single SMISMEMBER round trip.
+        """
+        driver_ids = list(driver_ids)
+        if not driver_ids:
+            return []
+        flags = await self.redis.smismember(self.key, [str(driver_id) for driver_id in driver_ids])
+        return [driver_id for driver_id, flag in zip(driver_ids, flags) if flag]
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """
+        Rebuilds the mirror from Postgres. Returns the number of available
+        drivers.
+
+        The new set is built under a temporary key and swapped in with
+        RENAME, so readers never observe a half-built set.
+        """
+        result = await db.execute(
+            select(DriverProfile.user_id).where(DriverProfile.is_available == True)
+        )
+        driver_ids = [str(driver_id) for driver_id in result.scalars().all()]
+
+        if not driver_ids:
+            await self.redis.delete(self.key)
+            return 0
+
+        temp_key = f"{self.key}:rebuild"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(temp_key)
+        for start in range(0, len(driver_ids), RECONCILE_CHUNK_SIZE):
+            pipe.sadd(temp_key, *driver_ids[start:start + RECONCILE_CHUNK_SIZE])
+        pipe.rename(temp_key, self.key)
+        await pipe.execute()
+        logger.info(f"Reconciled availability mirror with {len(driver_ids)} available drivers")
+        return len(driver_ids)
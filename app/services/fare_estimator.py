@@ -0,0 +1,153 @@
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+import numpy as np
+from app.services.geo_sharding import covering_cells, geohash_decode, geohash_encode, haversine_matrix
+from app.services.surge_pricing import EMPTY_SURGE_MAP, SurgeMap
+
+# San Francisco, the area the cost grid is precomputed for
+DEFAULT_CENTER = (37.7749, -122.4194)
+DEFAULT_GRID_RADIUS_KM = 15.0
+# Precision 6 cells are ~1.2km x 0.6km; ~1600 of them cover the default area
+DEFAULT_GRID_PRECISION = 6
+# Streets are not straight lines; road distance over great-circle distance
+ROAD_FACTOR = 1.3
+BASE_SPEED_KMH = 30.0
+# Traffic by hour of day, as a fraction of BASE_SPEED_KMH
+SPEED_FACTORS = (
+    1.4, 1.4, 1.5, 1.5, 1.4, 1.2, 0.9, 0.6, 0.55, 0.7, 0.85, 0.85,
+    0.8, 0.85, 0.85, 0.8, 0.7, 0.55, 0.6, 0.8, 1.0, 1.1, 1.2, 1.3,
+)
+
+BASE_FARE = 2.50
+PER_KM = 1.20
+PER_MINUTE = 0.30
+MINIMUM_FARE = 7.00
+
+# Points are quantized to ~100m before they key the cache
+CACHE_QUANTUM_DEGREES = 0.001
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 300.0 # seconds
+
+class FareEstimate(NamedTuple):
+    distance_km: float
+    duration_s: int
+    fare: float
+    surge_multiplier: float = 1.0
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire `ttl` seconds after being stored.
+    """
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+class CostGrid:
+    """
+    Precomputed road distances between every pair of geohash cells around
+    a city.
+
+    Distances are great-circle distances between cell centers scaled by
+    ROAD_FACTOR, held in one float32 matrix so a lookup is two dict probes
+    and an index. Trips within one cell, or with an end outside the grid,
+    fall back to the point-to-point distance.
+    """
+    def __init__(
+        self,
+        center: Tuple[float, float] = DEFAULT_CENTER,
+        radius_km: float = DEFAULT_GRID_RADIUS_KM,
+        precision: int = DEFAULT_GRID_PRECISION,
+    ):
+        self.precision = precision
+        cells = covering_cells(center[0], center[1], radius_km, precision)
+        self.index: Dict[str, int] = {cell: i for i, cell in enumerate(cells)}
+        centers = np.array([geohash_decode(cell) for cell in cells])
+        self.distances_km = (haversine_matrix(centers, centers) * ROAD_FACTOR).astype(np.float32)
+
+    def __len__(self):
+        return len(self.index)
+
+    def distance_km(self, source: Tuple[float, float], destination: Tuple[float, float]) -> float:
+        """
+        Road distance in km between two points.
+        """
+        i = self.index.get(geohash_encode(source[0], source[1], self.precision))
+        j = self.index.get(geohash_encode(destination[0], destination[1], self.precision))
+        if i is None or j is None or i == j:
+            return float(haversine_matrix([source], [destination])[0, 0]) * ROAD_FACTOR
+        return float(self.distances_km[i, j])
+
+class FareEstimator:
+    """
+    Prices trips from the local cost grid, without a mapping service.
+
+    Travel time is road distance over a time-of-day speed; the fare is a
+    base fare plus per-km and per-minute rates, with a minimum, times the
+    pickup cell's surge multiplier. Estimates are cached by quantized
+    endpoints and hour, so repeated estimates for popular routes skip the
+    grid entirely. Surge is applied after the cache from `surge_map`, which
+    a SurgeMapUpdater replaces as new maps are published.
+    """
+    def __init__(self, grid: CostGrid, cache: Optional[TTLCache] = None, surge_map: SurgeMap = EMPTY_SURGE_MAP):
+        self.grid = grid
+        self.cache = cache or TTLCache()
+        self.surge_map = surge_map
+
+    def set_surge_map(self, surge_map: SurgeMap):
+        self.surge_map = surge_map
+
+    def estimate(
+        self, source: Tuple[float, float], destination: Tuple[float, float], at: Optional[datetime] = None
+    ) -> FareEstimate:
+        hour = (at or datetime.now()).hour
+        key = (
+            round(source[0] / CACHE_QUANTUM_DEGREES), round(source[1] / CACHE_QUANTUM_DEGREES),
+            round(destination[0] / CACHE_QUANTUM_DEGREES), round(destination[1] / CACHE_QUANTUM_DEGREES),
+            hour,
+        )
+        estimate = self.cache.get(key)
+        if estimate is None:
+            distance_km = self.grid.distance_km(source, destination)
+            duration_s = math.ceil(distance_km / (BASE_SPEED_KMH * SPEED_FACTORS[hour]) * 3600)
+            fare = max(MINIMUM_FARE, BASE_FARE + PER_KM * distance_km + PER_MINUTE * duration_s / 60)
+            estimate = FareEstimate(round(distance_km, 3), duration_s, round(fare, 2))
+            self.cache.set(key, estimate)
+
+        multiplier = self.surge_map.multiplier_for(source[0], source[1])
+        if multiplier != 1.0:
+            estimate = estimate._replace(fare=round(estimate.fare * multiplier, 2), surge_multiplier=multiplier)
+        return estimate
+
+@lru_cache(maxsize=None)
+def get_fare_estimator() -> FareEstimator:
+    """
+    Process-wide estimator. The grid is built on first use.
+    """
+    return FareEstimator(CostGrid())
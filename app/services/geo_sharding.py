@@ -0,0 +1,156 @@
+import bisect
+import hashlib
+import math
+from typing import Generic, List, Optional, Sequence, TypeVar
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_KM_PER_DEGREE_LAT = 111.32
+EARTH_RADIUS_KM = 6371.0
+
+T = TypeVar("T")
+
+def geohash_encode(lat: float, long: float, precision: int) -> str:
+    """
+    Encodes a point as a geohash string of `precision` characters.
+    """
+    lat_range = [-90.0, 90.0]
+    long_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        value, bounds = (long, long_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def geohash_decode(geohash: str):
+    """
+    Returns the (lat, long) center of a geohash cell.
+    """
+    lat_range = [-90.0, 90.0]
+    long_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bounds = long_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if (bits >> shift) & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (long_range[0] + long_range[1]) / 2
+
+def geohash_cell_size(precision: int):
+    """
+    Returns the (height, width) in degrees of a geohash cell.
+    """
+    total_bits = 5 * precision
+    long_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << long_bits)
+
+def covering_cells(lat: float, long: float, radius_km: float, precision: int) -> List[str]:
+    """
+    Returns every geohash cell intersecting the bounding box of a circle.
+
+    A search that sits well inside one region touches a single cell; one that
+    straddles a boundary also returns the neighbouring cells it overlaps.
+    """
+    cell_height, cell_width = geohash_cell_size(precision)
+    delta_lat = radius_km / _KM_PER_DEGREE_LAT
+    # Clamp cos() near the poles so the box width stays finite
+    delta_long = radius_km / (_KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+
+    lat_rows = int(180.0 / cell_height)
+    long_cols = int(360.0 / cell_width)
+    min_row = max(0, int((lat - delta_lat + 90.0) // cell_height))
+    max_row = min(lat_rows - 1, int((lat + delta_lat + 90.0) // cell_height))
+    min_col = int((long - delta_long + 180.0) // cell_width)
+    max_col = int((long + delta_long + 180.0) // cell_width)
+    # A box wider than the globe covers every column exactly once
+    if max_col - min_col + 1 >= long_cols:
+        min_col, max_col = 0, long_cols - 1
+
+    cells = []
+    for row in range(min_row, max_row + 1):
+        cell_lat = -90.0 + (row + 0.5) * cell_height
+        for col in range(min_col, max_col + 1):
+            # Wrap around the antimeridian
+            cell_long = -180.0 + ((col % long_cols) + 0.5) * cell_width
+            cells.append(geohash_encode(cell_lat, cell_long, precision))
+    return list(dict.fromkeys(cells))
+
+def haversine_matrix(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in km between every origin and destination.
+
+    Both inputs are (n, 2) arrays of (lat, long) in degrees; the result is
+    an (len(origins), len(destinations)) matrix.
+    """
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1 = origins[:, 0][:, None]
+    long1 = origins[:, 1][:, None]
+    lat2 = destinations[:, 0][None, :]
+    long2 = destinations[:, 1][None, :]
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class ConsistentHashRing(Generic[T]):
+    """
+    Maps keys onto nodes so that adding or removing a node only moves the
+    keys that node owned.
+
+    Each node is placed on the ring `replicas` times (virtual nodes) to keep
+    the key distribution even with only a handful of physical nodes. Nodes
+    are placed by name (their index unless `names` is given), so names must
+    stay stable across restarts for keys to stay put.
+    """
+    def __init__(
+        self, nodes: Sequence[T], replicas: int = 100, names: Optional[Sequence[str]] = None
+    ):
+        if not nodes:
+            raise ValueError("ConsistentHashRing needs at least one node")
+        if names is not None and len(names) != len(nodes):
+            raise ValueError("names must match nodes one to one")
+        self.nodes = list(nodes)
+        self.replicas = replicas
+        names = names or [str(index) for index in range(len(self.nodes))]
+        self._ring = sorted(
+            (self._hash(f"{name}:{replica}"), index)
+            for index, name in enumerate(names)
+            for replica in range(replicas)
+        )
+        self._positions = [position for position, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def get_node(self, key: str) -> T:
+        """
+        Returns the node responsible for `key`.
+        """
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        index = bisect.bisect(self._positions, self._hash(key)) % len(self._ring)
+        return self.nodes[self._ring[index][1]]
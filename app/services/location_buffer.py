@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import Request
+from app.services.location_service import LocationPing, LocationService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 1.0 # seconds
+DEFAULT_MAX_PENDING = 10000 # distinct drivers buffered before a forced flush
+
+class LocationWriteBuffer:
+    """
+    In-process write-behind buffer in front of LocationService.
+
+    Only the latest position per driver is kept between flushes, so retried
+    or bursty pings for the same driver cost a single Redis write. Buffered
+    positions are written with `update_locations_bulk` on a timer, or as soon
+    as `max_pending` distinct drivers are waiting.
+
+    Reads are unaffected: `find_nearby_drivers` still queries Redis, which
+    lags the newest ping by at most one flush interval.
+    """
+    def __init__(
+        self,
+        location_service: LocationService,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.location_service = location_service
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, Tuple[float, float]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.received = 0
+        self.written = 0
+        self.dropped = 0 # pings superseded by a newer ping before being written
+
+    async def add(self, driver_id: int, lat: float, long: float):
+        """
+        Buffers a ping, replacing any unflushed ping for the same driver.
+        """
+        if driver_id in self._pending:
+            self.dropped += 1
+        self._pending[driver_id] = (lat, long)
+        self.received += 1
+
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+    async def add_many(self, pings: Iterable[LocationPing]) -> int:
+        """
+        Buffers (driver_id, lat, long) pings. Returns the number accepted.
+        """
+        accepted = 0
+        for driver_id, lat, long in pings:
+            await self.add(driver_id, lat, long)
+            accepted += 1
+        return accepted
+
+    async def flush(self) -> int:
+        """
+        Writes all buffered positions to Redis. Returns the number written.
+        """
+        # Flushes are serialized so an older snapshot can never land in Redis
+        # after a newer one.
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            # Swap before awaiting: pings arriving during the write go into
+            # the next batch instead of racing with this one.
+            batch, self._pending = self._pending, {}
+            try:
+                written = await self.location_service.update_locations_bulk(
+                    (driver_id, lat, long) for driver_id, (lat, long) in batch.items()
+                )
+            except Exception:
+                # Put back whatever hasn't been superseded meanwhile.
+                for driver_id, position in batch.items():
+                    self._pending.setdefault(driver_id, position)
+                raise
+            self.written += written
+            return written
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        """
+        Returns counters describing how much write traffic was coalesced.
+        """
+        return {
+            "received": self.received,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": self.pending,
+        }
+
+    async def start(self):
+        """
+        Starts the background flush loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the flush loop and writes any remaining positions.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush buffered driver locations")
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+def get_location_buffer(request: Request) -> LocationWriteBuffer:
+    return request.app.state.location_buffer
@@ -1,16 +1,433 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import (
+    Any, AsyncIterable, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+)
 from redis.asyncio import Redis
+from app.core.metrics import REDIS_COMMAND_DURATION
+from app.services.geo_sharding import ConsistentHashRing, covering_cells, geohash_encode
+
+# A single driver ping: (driver_id, latitude, longitude)
+LocationPing = Tuple[int, float, float]
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 0.05 # seconds
+# Members per GEOADD command. Keeping commands bounded lets Redis interleave
+# other clients' commands between the chunks of one large pipeline.
+MAX_GEOADD_MEMBERS = 250
+# Radii tried, in order, by the expanding-ring search
+DEFAULT_SEARCH_RADII_KM = (0.5, 1.0, 2.0, 5.0, 10.0)
+# Geohash length of a region when sharding is enabled (~39km x 20km cells)
+DEFAULT_REGION_PRECISION = 4
+# Drivers not seen for this long are hidden from searches and evicted.
+# Six missed 5-second pings is a crashed app, not a tunnel.
+DEFAULT_FRESHNESS_SECONDS = 30
+# How long a driver's region directory entry outlives its last ping
+REGION_DIRECTORY_TTL = 3600 # seconds
+# Stale members removed per key per eviction round
+EVICTION_BATCH_SIZE = 1000
+# Members read per key per round when scanning every driver's position
+SCAN_CHUNK_SIZE = 5000
+
+class NearbyDriver(NamedTuple):
+    driver_id: int
+    distance_km: float
+    coordinates: Tuple[float, float] # (lat, long)
+
+class NearbySearch(NamedTuple):
+    drivers: List[NearbyDriver]
+    radius_km: float # radius of the ring that produced `drivers`
+
+class _NodePipelines:
+    """
+    Collects commands into one pipeline per Redis node and runs all of the
+    pipelines concurrently, so a fan-out costs one round trip overall.
+    The round trip is timed under `operation`.
+    """
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._pipelines: Dict[int, Any] = {}
+        self._tags: Dict[int, List[Any]] = {}
+
+    def add(self, client: Redis, tag: Any, command: Callable[[Any], Any]):
+        node = id(client)
+        if node not in self._pipelines:
+            self._pipelines[node] = client.pipeline(transaction=False)
+            self._tags[node] = []
+        command(self._pipelines[node])
+        self._tags[node].append(tag)
+
+    async def execute(self) -> List[Tuple[Any, Any]]:
+        """
+        Returns (tag, result) pairs for every queued command.
+        """
+        nodes = list(self._pipelines)
+        if not nodes:
+            return []
+        with REDIS_COMMAND_DURATION.time(self.operation):
+            results = await asyncio.gather(*(self._pipelines[node].execute() for node in nodes))
+        return [
+            (tag, result)
+            for node, node_results in zip(nodes, results)
+            for tag, result in zip(self._tags[node], node_results)
+        ]
 
 class LocationService:
-    def __init__(self, redis_client: Redis):
+    def __init__(
+        self,
+        redis_client: Redis,
+        shard_clients: Optional[Sequence[Redis]] = None,
+        region_precision: Optional[int] = None,
+        freshness_seconds: Optional[float] = DEFAULT_FRESHNESS_SECONDS,
+    ):
+        """
+        By default every driver lives in the single `driver_locations` key.
+        Each geo key has a companion `<key>:seen` sorted set scored by the
+        driver's last ping time. Searches skip drivers older than
+        `freshness_seconds` (None disables the filter).
+
+        Setting `region_precision` partitions drivers into one key per geohash
+        region (`driver_locations:<geohash>`), and `shard_clients` spreads
+        those keys over several Redis nodes through a consistent-hash ring.
+        Passing `shard_clients` alone enables DEFAULT_REGION_PRECISION.
+        """
         self.redis = redis_client
         self.geo_key = "driver_locations"
+        if shard_clients and region_precision is None:
+            region_precision = DEFAULT_REGION_PRECISION
+        self.region_precision = region_precision
+        self.freshness_seconds = freshness_seconds
+        self.ring = ConsistentHashRing(list(shard_clients) if shard_clients else [redis_client])
+
+    @property
+    def sharded(self) -> bool:
+        return self.region_precision is not None
+
+    def region_key(self, lat: float, long: float) -> str:
+        """
+        Returns the geo key holding drivers located at (lat, long).
+        """
+        if not self.sharded:
+            return self.geo_key
+        return f"{self.geo_key}:{geohash_encode(lat, long, self.region_precision)}"
+
+    def _search_keys(self, lat: float, long: float, radius_km: float) -> List[str]:
+        if not self.sharded:
+            return [self.geo_key]
+        return [
+            f"{self.geo_key}:{cell}"
+            for cell in covering_cells(lat, long, radius_km, self.region_precision)
+        ]
+
+    @staticmethod
+    def seen_key(geo_key: str) -> str:
+        """
+        Returns the last-seen sorted set stored alongside `geo_key`.
+        """
+        return f"{geo_key}:seen"
+
+    async def _geo_keys(self) -> List[str]:
+        if not self.sharded:
+            return [self.geo_key]
+        keys = []
+        for client in self.ring.nodes:
+            async for seen in client.scan_iter(match=self.seen_key(f"{self.geo_key}:*")):
+                seen = seen.decode() if isinstance(seen, bytes) else seen
+                keys.append(seen[:-len(":seen")])
+        return keys
+
+    def _client_for(self, key: str) -> Redis:
+        return self.ring.get_node(key)
+
+    @staticmethod
+    def _region_directory_key(driver_id: int) -> str:
+        return f"driver_region:{driver_id}"
 
     async def update_location(self, driver_id: int, lat: float, long: float):
         """
         Updates the driver's location in Redis using GEOADD.
         Redis expects: (longitude, latitude, member)
         """
-        await self.redis.geoadd(self.geo_key, (long, lat, str(driver_id)))
+        await self._write_batch([(driver_id, lat, long)])
+
+    async def update_locations_bulk(
+        self,
+        locations: Union[Iterable[LocationPing], AsyncIterable[LocationPing]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ) -> int:
+        """
+        Updates many driver locations using multi-member GEOADD calls.
+
+        Pings are buffered and written over a non-transactional pipeline
+        whenever `batch_size` pings have accumulated. For async streams, a
+        partial batch is also flushed once `flush_interval` seconds have
+        passed since its first ping, so a slow stream never holds pings back.
+        Returns the number of pings written.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        if hasattr(locations, "__aiter__"):
+            return await self._update_from_stream(locations, batch_size, flush_interval)
+
+        written = 0
+        batch: List[LocationPing] = []
+        for ping in locations:
+            batch.append(ping)
+            if len(batch) >= batch_size:
+                written += await self._write_batch(batch)
+                batch = []
+        written += await self._write_batch(batch)
+        return written
+
+    async def _update_from_stream(
+        self, stream: AsyncIterable[LocationPing], batch_size: int, flush_interval: float
+    ) -> int:
+        loop = asyncio.get_running_loop()
+        iterator = stream.__aiter__()
+        written = 0
+        batch: List[LocationPing] = []
+        deadline = None
+        # The pending __anext__ is kept across flush timeouts instead of being
+        # cancelled, which would otherwise close an async generator.
+        pending = asyncio.ensure_future(iterator.__anext__())
+        try:
+            while True:
+                timeout = None if not batch else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    written += await self._write_batch(batch)
+                    batch = []
+                    continue
+
+                try:
+                    ping = pending.result()
+                except StopAsyncIteration:
+                    break
+
+                if not batch:
+                    deadline = loop.time() + flush_interval
+                batch.append(ping)
+                if len(batch) >= batch_size:
+                    written += await self._write_batch(batch)
+                    batch = []
+                pending = asyncio.ensure_future(iterator.__anext__())
+        finally:
+            if not pending.done():
+                pending.cancel()
+
+        written += await self._write_batch(batch)
+        return written
+
+    async def _write_batch(self, batch: List[LocationPing]) -> int:
+        if not batch:
+            return 0
+
+        by_key: Dict[str, List[LocationPing]] = defaultdict(list)
+        for ping in batch:
+            by_key[self.region_key(ping[1], ping[2])].append(ping)
+
+        now = time.time()
+        group = _NodePipelines("geo_write")
+        for key, pings in by_key.items():
+            client = self._client_for(key)
+            for start in range(0, len(pings), MAX_GEOADD_MEMBERS):
+                values = []
+                seen = {}
+                for driver_id, lat, long in pings[start:start + MAX_GEOADD_MEMBERS]:
+                    values.extend((long, lat, str(driver_id)))
+                    seen[str(driver_id)] = now
+                group.add(client, None, lambda pipe, key=key, values=values: pipe.geoadd(key, values))
+                group.add(client, None, lambda pipe, key=key, seen=seen: pipe.zadd(self.seen_key(key), seen))
+
+        if self.sharded:
+            # Track each driver's current region so a driver crossing into a
+            # new region can be removed from the old one. SET ... GET returns
+            # the previous region in the same round trip as the GEOADDs.
+            for driver_id, lat, long in batch:
+                directory_key = self._region_directory_key(driver_id)
+                region = self.region_key(lat, long)
+                group.add(
+                    self._client_for(directory_key),
+                    (driver_id, region),
+                    lambda pipe, k=directory_key, v=region: pipe.set(
+                        k, v, ex=REGION_DIRECTORY_TTL, get=True
+                    ),
+                )
+
+        results = await group.execute()
+
+        if self.sharded:
+            removals = _NodePipelines("region_cleanup")
+            for tag, previous in results:
+                if tag is None or previous is None:
+                    continue
+                driver_id, region = tag
+                previous = previous.decode() if isinstance(previous, bytes) else previous
+                if previous != region:
+                    client = self._client_for(previous)
+                    member = str(driver_id)
+                    removals.add(client, None, lambda pipe, k=previous, m=member: pipe.zrem(k, m))
+                    removals.add(
+                        client, None, lambda pipe, k=self.seen_key(previous), m=member: pipe.zrem(k, m)
+                    )
+            await removals.execute()
+
+        return len(batch)
+
+    async def _search(self, lat: float, long: float, radius_km: float, **options) -> List[Any]:
+        """
+        Runs GEOSEARCH against every region key the circle overlaps, in
+        parallel across nodes, and returns the concatenated raw results of
+        drivers seen within the freshness window.
+
+        With a `count`, stale members must not use up the nearest-K slots
+        and hide fresh drivers behind them. A key whose page came back full
+        but short of `count` fresh members is searched again, past the
+        stale ones, until it has `count` fresh members or runs out.
+        """
+        count = options.pop("count", None)
+        fetch = {key: count for key in self._search_keys(lat, long, radius_km)}
+        fresh: Dict[str, List[Any]] = {}
+        while fetch:
+            group = _NodePipelines("geo_search")
+            for key, limit in fetch.items():
+                group.add(
+                    self._client_for(key),
+                    key,
+                    lambda pipe, key=key, limit=limit: pipe.geosearch(
+                        name=key, latitude=lat, longitude=long, radius=radius_km, unit="km",
+                        count=limit, **options
+                    ),
+                )
+            results = [(key, entries) for key, entries in await group.execute() if entries]
+            kept = await self._fresh_entries(results)
+
+            refetch = {}
+            for key, entries in results:
+                fresh[key] = kept[key]
+                # Every member of a short page was returned: nothing is left
+                if count is None or len(entries) < fetch[key] or len(kept[key]) >= count:
+                    continue
+                refetch[key] = count + len(entries) - len(kept[key])
+            fetch = refetch
+        return [entry for entries in fresh.values() for entry in entries]
+
+    async def _fresh_entries(self, results: List[Tuple[str, List[Any]]]) -> Dict[str, List[Any]]:
+        """
+        Drops drivers not seen within the freshness window from GEOSEARCH
+        results, looking up last-seen times for just those members in one
+        round trip.
+        """
+        if self.freshness_seconds is None or not results:
+            return dict(results)
+
+        def member_of(entry):
+            return entry[0] if isinstance(entry, list) else entry
+
+        seen_group = _NodePipelines("last_seen")
+        for key, entries in results:
+            members = [member_of(entry) for entry in entries]
+            seen_group.add(
+                self._client_for(key),
+                key,
+                lambda pipe, key=key, members=members: pipe.zmscore(self.seen_key(key), members),
+            )
+        last_seen = dict(await seen_group.execute())
+
+        cutoff = time.time() - self.freshness_seconds
+        # Members without a last-seen score predate it and count as stale
+        return {
+            key: [entry for entry, seen in zip(entries, last_seen[key]) if seen is not None and seen >= cutoff]
+            for key, entries in results
+        }
+
+    async def evict_stale_drivers(self, max_age_seconds: Optional[float] = None) -> int:
+        """
+        Removes drivers whose last ping is older than `max_age_seconds`
+        (defaults to the freshness window) from every geo key, in bulk.
+        Returns the number of drivers evicted.
+        """
+        max_age_seconds = max_age_seconds if max_age_seconds is not None else self.freshness_seconds
+        if max_age_seconds is None:
+            raise ValueError("max_age_seconds is required when freshness_seconds is None")
+        cutoff = time.time() - max_age_seconds
+
+        keys = await self._geo_keys()
+        evicted = 0
+        while keys:
+            lookups = _NodePipelines("evict_lookup")
+            for key in keys:
+                lookups.add(
+                    self._client_for(key),
+                    key,
+                    lambda pipe, key=key: pipe.zrangebyscore(
+                        self.seen_key(key), "-inf", cutoff, start=0, num=EVICTION_BATCH_SIZE
+                    ),
+                )
+
+            keys = []
+            removals = _NodePipelines("evict")
+            for key, members in await lookups.execute():
+                if not members:
+                    continue
+                # A driver that pings between the lookup and the removal is
+                # dropped until its next ping, a few seconds later.
+                client = self._client_for(key)
+                removals.add(client, None, lambda pipe, key=key, members=members: pipe.zrem(key, *members))
+                removals.add(
+                    client, None, lambda pipe, key=key, members=members: pipe.zrem(self.seen_key(key), *members)
+                )
+                evicted += len(members)
+                if len(members) == EVICTION_BATCH_SIZE:
+                    keys.append(key)
+            await removals.execute()
+        return evicted
+
+    async def iter_positions(self, chunk_size: int = SCAN_CHUNK_SIZE) -> AsyncIterable[List[LocationPing]]:
+        """
+        Yields the position of every indexed driver seen within the
+        freshness window, `chunk_size` members per geo key at a time, for
+        bulk aggregation.
+
+        Members are paged by rank with ZRANGE and resolved with GEOPOS, so
+        no single command walks a whole city. Drivers added or removed
+        between pages may shift a member across a page boundary, to be
+        skipped or seen twice; callers aggregating counts tolerate that.
+        """
+        for key in await self._geo_keys():
+            client = self._client_for(key)
+            start = 0
+            while True:
+                with REDIS_COMMAND_DURATION.time("scan_positions"):
+                    members = await client.zrange(key, start, start + chunk_size - 1)
+                    if members:
+                        pipe = client.pipeline(transaction=False)
+                        pipe.geopos(key, *members)
+                        if self.freshness_seconds is not None:
+                            pipe.zmscore(self.seen_key(key), members)
+                        positions, *last_seen = await pipe.execute()
+                if not members:
+                    break
+                # Same rule as the matching searches: unseen or silent
+                # drivers are not counted
+                if last_seen:
+                    cutoff = time.time() - self.freshness_seconds
+                    fresh = [seen is not None and seen >= cutoff for seen in last_seen[0]]
+                else:
+                    fresh = [True] * len(members)
+                pings = [
+                    (int(member), position[1], position[0])
+                    for member, position, is_fresh in zip(members, positions, fresh)
+                    if position is not None and is_fresh
+                ]
+                if pings:
+                    yield pings
+                if len(members) < chunk_size:
+                    break
+                start += chunk_size
 
     async def find_nearby_drivers(self, lat: float, long: float, radius_km: float):
         """
@@ -19,11 +436,55 @@ class LocationService:
         """
         # Note: Redis-py's geosearch returns a list of members.
         # We assume basic return; for more details like distance, we'd add withdist=True
-        members = await self.redis.geosearch(
-            name=self.geo_key,
-            latitude=lat,
-            longitude=long,
-            radius=radius_km,
-            unit="km"
+        members = await self._search(lat, long, radius_km)
+        # A driver caught mid-move between regions may briefly appear twice
+        return list(dict.fromkeys(int(member) for member in members))
+
+    async def find_nearest_drivers(
+        self, lat: float, long: float, radius_km: float, count: int
+    ) -> List[NearbyDriver]:
+        """
+        Finds the `count` drivers closest to a point within `radius_km`.
+        Returns NearbyDriver entries sorted by ascending distance.
+
+        Redis applies the ordering and the limit server-side (ASC + COUNT),
+        so a dense area never ships thousands of IDs to the caller. When the
+        circle spans several regions, each region returns its own nearest
+        `count` and the results are merged here.
+        """
+        results = await self._search(
+            lat, long, radius_km, sort="ASC", count=count, withdist=True, withcoord=True
         )
-        return [int(member) for member in members]
+        nearest: Dict[int, NearbyDriver] = {}
+        for member, distance, coords in results:
+            driver = NearbyDriver(int(member), distance, (coords[1], coords[0]))
+            if driver.driver_id not in nearest or distance < nearest[driver.driver_id].distance_km:
+                nearest[driver.driver_id] = driver
+        return sorted(nearest.values(), key=lambda driver: driver.distance_km)[:count]
+
+    async def find_nearest_drivers_expanding(
+        self,
+        lat: float,
+        long: float,
+        count: int,
+        min_results: int = 1,
+        radii_km: Sequence[float] = DEFAULT_SEARCH_RADII_KM,
+    ) -> NearbySearch:
+        """
+        Expanding-ring variant of `find_nearest_drivers`.
+
+        Searches each radius in `radii_km` in turn, stopping at the first ring
+        holding at least `min_results` drivers. Dense areas are answered by a
+        small, cheap search; sparse areas widen up to the last radius instead
+        of coming back empty. Returns the drivers (closest first, at most
+        `count`) along with the radius that was used.
+        """
+        if not radii_km:
+            raise ValueError("radii_km must contain at least one radius")
+
+        drivers: List[NearbyDriver] = []
+        for radius_km in radii_km:
+            drivers = await self.find_nearest_drivers(lat, long, radius_km, count)
+            if len(drivers) >= min_results:
+                break
+        return NearbySearch(drivers, radius_km)
@@ -1,27 +1,143 @@
 import logging
 import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
-from app.services.location_service import LocationService
+from app.services.location_service import LocationService, DEFAULT_SEARCH_RADII_KM
+from app.services.availability_service import AvailabilityService
+from app.services.offer_service import DEFAULT_OFFER_FANOUT, DEFAULT_OFFER_TIMEOUT, RideOfferService
+from app.services.ride_assignment import AssignmentResult, assign_driver
+from app.services.ride_cache import RideCache
+from app.services.ride_events import RideEventPublisher
+from app.core.metrics import MATCHING_CANDIDATES, MATCHING_LOCK_ATTEMPTS, MATCHING_RESULTS, MATCHING_STAGE_DURATION
 from redis.asyncio import Redis
 
 logger = logging.getLogger(__name__)
 
+# Closest drivers tried per ride. Drivers further down the list are almost
+# never reached, so there's no point loading them.
+DEFAULT_MAX_CANDIDATES = 20
+# Stop widening the search once this many candidates are in range
+DEFAULT_MIN_CANDIDATES = 3
+
+# Assignment failures that mean the driver, not the ride, was the problem;
+# matching moves on to the next candidate
+DRIVER_REJECTIONS = (AssignmentResult.DRIVER_NOT_AVAILABLE, AssignmentResult.DRIVER_NOT_FOUND)
+
+# Server-side find-lock-claim. Walks each search radius closest first, skips
+# stale, unavailable, excluded or already-locked drivers, and locks the first
+# eligible one, all inside a single EVALSHA. Up to `count` fresh drivers are
+# considered per radius; stale ones don't use up the count.
+#
+# KEYS: geo key, last-seen key, available-drivers set
+# ARGV: long, lat, count, freshness cutoff (-1 disables), lock ttl,
+#       lock value, lock key prefix, check availability (1/0),
+#       number of radii, radii..., excluded driver ids...
+# Returns {driver_id, radius} or nil.
+#
+# Lock keys are built inside the script, so the geo index, the availability
+# set and the locks must all live on the same (unsharded) Redis node.
+CLAIM_DRIVER_SCRIPT = """
+local count = tonumber(ARGV[3])
+local cutoff = tonumber(ARGV[4])
+local check_available = ARGV[8] == '1'
+local radius_count = tonumber(ARGV[9])
+local excluded = {}
+for i = 10 + radius_count, #ARGV do
+    excluded[ARGV[i]] = true
+end
+local stale = {}
+
+for r = 1, radius_count do
+    local radius = ARGV[9 + r]
+    local fetch = count
+    while true do
+        local members = redis.call('GEOSEARCH', KEYS[1], 'FROMLONLAT', ARGV[1], ARGV[2],
+            'BYRADIUS', radius, 'km', 'ASC', 'COUNT', fetch)
+        local skipped = 0
+        for _, member in ipairs(members) do
+            if not excluded[member] and not stale[member] and cutoff >= 0 then
+                local seen = redis.call('ZSCORE', KEYS[2], member)
+                stale[member] = not seen or tonumber(seen) < cutoff
+            end
+            if stale[member] then
+                skipped = skipped + 1
+            elseif not excluded[member] then
+                local eligible = true
+                if check_available then
+                    eligible = redis.call('SISMEMBER', KEYS[3], member) == 1
+                end
+                if eligible and redis.call('SET', ARGV[7] .. member, ARGV[6], 'EX', ARGV[5], 'NX') then
+                    return {member, radius}
+                end
+                excluded[member] = true
+            end
+        end
+        -- Stale members don't count towards `count`: a full page with
+        -- fewer fresh members is searched again, past the stale ones
+        if #members < fetch or #members - skipped >= count then
+            break
+        end
+        fetch = count + skipped
+    end
+end
+return nil
+"""
+
 class MatchingService:
     """
     Service responsible for pairing available drivers with ride requests.
     
     The matching process involves:
-    1. Finding nearby drivers using geospatial search.
-    2. Sequentially attempting to match drivers, using distributed locks to prevent race conditions.
-    3. Updating both the Ride and DriverProfile statuses upon a successful match.
+    1. Finding the nearest drivers using an expanding-ring geospatial search,
+       closest first.
+    2. Dropping unavailable candidates in one step: from the Redis
+       availability mirror when one is configured, otherwise with a single
+       batched DB query.
+    3. Sequentially attempting to match drivers, using distributed locks to prevent race conditions.
+    4. Updating both the Ride and DriverProfile statuses upon a successful match,
+       with the same conditional UPDATEs as the accept endpoint (`assign_driver`).
+
+    With `use_claim_script`, steps 1-3 run server-side in one Lua call
+    (CLAIM_DRIVER_SCRIPT) that returns an already-locked driver, so a ride
+    costs O(1) Redis round trips instead of O(candidates).
+
+    `offer_ride` is the alternative where drivers must accept: the ride is
+    offered to the `offer_fanout` nearest candidates at once, and the first
+    `PATCH /ride/driver/accept` wins. `offer_fanout=1` gives the design's
+    one-by-one notification loop.
     """
-    def __init__(self, db: AsyncSession, location_service: LocationService, redis_client: Redis):
+    def __init__(
+        self,
+        db: AsyncSession,
+        location_service: LocationService,
+        redis_client: Redis,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES,
+        min_candidates: int = DEFAULT_MIN_CANDIDATES,
+        search_radii_km: Sequence[float] = DEFAULT_SEARCH_RADII_KM,
+        availability_service: Optional[AvailabilityService] = None,
+        use_claim_script: bool = False,
+        offer_fanout: int = DEFAULT_OFFER_FANOUT,
+        offer_timeout: float = DEFAULT_OFFER_TIMEOUT,
+        offer_notifier: Optional[Callable[[int, List[int]], Awaitable[None]]] = None,
+    ):
         self.db = db
         self.location_service = location_service
         self.redis = redis_client
         self.lock_ttl = 10 # seconds
+        self.max_candidates = max_candidates
+        self.min_candidates = min_candidates
+        self.search_radii_km = search_radii_km
+        self.availability_service = availability_service
+        self.use_claim_script = use_claim_script
+        self._claim_script = None
+        self.offer_fanout = offer_fanout
+        self.offers = RideOfferService(redis_client, offer_timeout)
+        # Called with (ride_id, driver_ids) after each round of offers, e.g.
+        # NotificationDispatcher.notify_offer
+        self.offer_notifier = offer_notifier
 
     async def match_ride(self, ride_id: int):
         """
@@ -30,51 +146,63 @@ class MatchingService:
         logger.info(f"Starting matching for ride {ride_id}")
         
         # 1. Fetch Ride
-        result = await self.db.execute(select(Ride).where(Ride.id == ride_id))
-        ride = result.scalars().first()
+        with MATCHING_STAGE_DURATION.time("fetch_ride"):
+            result = await self.db.execute(select(Ride).where(Ride.id == ride_id))
+            ride = result.scalars().first()
         if not ride or ride.status != RideStatus.REQUESTED:
             logger.error(f"Ride {ride_id} not found or not in REQUESTED status")
+            MATCHING_RESULTS.inc("closed")
             return None
 
-        # 2. Find nearby drivers
-        # Using a fixed radius of 5km for MVP
-        candidate_ids = await self.location_service.find_nearby_drivers(
-            ride.source_lat, ride.source_long, radius_km=5.0
+        if self.use_claim_script and not self.location_service.sharded:
+            return await self._match_with_claim_script(ride)
+
+        # 2. Find the nearest drivers, closest first, widening the radius
+        # only as far as needed
+        with MATCHING_STAGE_DURATION.time("geo_search"):
+            search = await self.location_service.find_nearest_drivers_expanding(
+                ride.source_lat,
+                ride.source_long,
+                count=self.max_candidates,
+                min_results=self.min_candidates,
+                radii_km=self.search_radii_km,
+            )
+        logger.info(
+            f"Found {len(search.drivers)} candidate drivers for ride {ride_id} "
+            f"within {search.radius_km}km"
         )
-        logger.info(f"Found {len(candidate_ids)} candidate drivers for ride {ride_id}")
+
+        # 3. Keep only available drivers, still closest first
+        with MATCHING_STAGE_DURATION.time("availability_check"):
+            candidate_ids = await self._available_candidates(
+                [candidate.driver_id for candidate in search.drivers]
+            )
+        MATCHING_CANDIDATES.observe(len(candidate_ids))
 
         for driver_id in candidate_ids:
-            # 3. Try to lock driver in Redis
+            # 4. Try to lock driver in Redis
             lock_key = f"lock:driver:{driver_id}"
             # NX=True means only set if not exists
-            locked = await self.redis.set(lock_key, "locked", ex=self.lock_ttl, nx=True)
+            with MATCHING_STAGE_DURATION.time("lock"):
+                locked = await self.redis.set(lock_key, "locked", ex=self.lock_ttl, nx=True)
             
             if not locked:
                 logger.info(f"Driver {driver_id} is currently being matched with another ride (locked)")
+                MATCHING_LOCK_ATTEMPTS.inc("contended")
                 continue
+            MATCHING_LOCK_ATTEMPTS.inc("acquired")
 
             try:
-                # 4. Check if driver is available in DB
-                result = await self.db.execute(
-                    select(DriverProfile).where(
-                        DriverProfile.user_id == driver_id,
-                        DriverProfile.is_available == True
-                    )
-                )
-                profile = result.scalars().first()
-                
-                if profile:
-                    # 5. MATCH FOUND!
-                    logger.info(f"Matching ride {ride_id} with driver {driver_id}")
-                    
-                    ride.status = RideStatus.MATCHED
-                    ride.driver_id = driver_id
-                    profile.is_available = False
-                    
-                    await self.db.commit()
+                with MATCHING_STAGE_DURATION.time("commit"):
+                    outcome = await self._commit_match(ride_id, driver_id, search.radius_km)
+                if outcome == AssignmentResult.ASSIGNED:
+                    MATCHING_RESULTS.inc("matched")
                     return driver_id
-                else:
-                    logger.info(f"Driver {driver_id} is not available in database")
+                if outcome not in DRIVER_REJECTIONS:
+                    # Someone else (e.g. an accepted offer) took the ride
+                    logger.info(f"Ride {ride_id} is no longer open for matching")
+                    MATCHING_RESULTS.inc("closed")
+                    return None
             finally:
                 # Release lock if we didn't match (or even if we did, 
                 # but in real system we might keep it until acceptance)
@@ -83,4 +211,150 @@ class MatchingService:
                 await self.redis.delete(lock_key)
 
         logger.warning(f"No available drivers found for ride {ride_id}")
+        MATCHING_RESULTS.inc("no_driver")
+        return None
+
+    async def offer_ride(self, ride_id: int) -> Optional[int]:
+        """
+        Offers the ride to the nearest available drivers, `offer_fanout` at a
+        time, until one accepts. Returns the accepting driver, or None once
+        no candidates are left.
+        """
+        while True:
+            # Re-read every round: an accept may have landed while we waited
+            result = await self.db.execute(
+                select(Ride.status, Ride.driver_id, Ride.source_lat, Ride.source_long)
+                .where(Ride.id == ride_id)
+            )
+            ride = result.first()
+            if not ride or ride.status != RideStatus.REQUESTED:
+                return ride.driver_id if ride and ride.status == RideStatus.MATCHED else None
+
+            search = await self.location_service.find_nearest_drivers_expanding(
+                ride.source_lat,
+                ride.source_long,
+                count=self.max_candidates,
+                min_results=self.min_candidates,
+                radii_km=self.search_radii_km,
+            )
+            already_offered = set(await self.offers.offered(ride_id))
+            candidate_ids = await self._available_candidates([
+                candidate.driver_id
+                for candidate in search.drivers
+                if candidate.driver_id not in already_offered
+            ])
+            # Nothing to write: end the read transaction, so the pooled
+            # connection isn't left idle in transaction while drivers decide
+            await self.db.commit()
+            offered = await self.offers.send(ride_id, candidate_ids, self.offer_fanout)
+            if not offered:
+                logger.warning(f"No drivers left to offer ride {ride_id}")
+                return None
+
+            logger.info(f"Offered ride {ride_id} to drivers {offered}")
+            if self.offer_notifier:
+                await self.offer_notifier(ride_id, offered)
+
+            winner = await self.offers.wait_for_acceptance(ride_id, offered)
+            if winner is not None:
+                return winner
+            # Nobody accepted in time; free this round's drivers for other rides
+            await self.offers.release(ride_id, offered)
+
+    async def _match_with_claim_script(self, ride: Ride):
+        """
+        Matching loop where each attempt is a single CLAIM_DRIVER_SCRIPT call.
+        """
+        if self._claim_script is None:
+            self._claim_script = self.redis.register_script(CLAIM_DRIVER_SCRIPT)
+
+        # A failed assignment rolls back the session and expires `ride`
+        ride_id, lat, long = ride.id, ride.source_lat, ride.source_long
+        freshness = self.location_service.freshness_seconds
+        cutoff = time.time() - freshness if freshness is not None else -1
+        geo_key = self.location_service.geo_key
+        rejected: List[int] = []
+
+        # Only a stale availability mirror makes a claimed driver fail the DB
+        # check, so this normally runs once.
+        for _ in range(self.max_candidates):
+            with MATCHING_STAGE_DURATION.time("claim"):
+                claim = await self._claim_script(
+                    keys=[
+                        geo_key,
+                        self.location_service.seen_key(geo_key),
+                        self.availability_service.key if self.availability_service else "available_drivers",
+                    ],
+                    args=[
+                        long,
+                        lat,
+                        self.max_candidates,
+                        cutoff,
+                        self.lock_ttl,
+                        "locked",
+                        "lock:driver:",
+                        1 if self.availability_service else 0,
+                        len(self.search_radii_km),
+                        *self.search_radii_km,
+                        *rejected,
+                    ],
+                )
+            if claim is None:
+                break
+
+            driver_id, radius_km = int(claim[0]), float(claim[1])
+            lock_key = f"lock:driver:{driver_id}"
+            try:
+                with MATCHING_STAGE_DURATION.time("commit"):
+                    outcome = await self._commit_match(ride_id, driver_id, radius_km)
+                if outcome == AssignmentResult.ASSIGNED:
+                    MATCHING_RESULTS.inc("matched")
+                    return driver_id
+                if outcome not in DRIVER_REJECTIONS:
+                    logger.info(f"Ride {ride_id} is no longer open for matching")
+                    MATCHING_RESULTS.inc("closed")
+                    return None
+                rejected.append(driver_id)
+            finally:
+                await self.redis.delete(lock_key)
+
+        logger.warning(f"No available drivers found for ride {ride_id}")
+        MATCHING_RESULTS.inc("no_driver")
         return None
+
+    async def _commit_match(self, ride_id: int, driver_id: int, radius_km: float) -> AssignmentResult:
+        """
+        Commits the match for a locked driver with the conditional-update
+        primitive shared with the accept endpoint.
+        """
+        outcome = await assign_driver(self.db, ride_id, driver_id, radius_km)
+        if outcome == AssignmentResult.ASSIGNED:
+            logger.info(f"Matched ride {ride_id} with driver {driver_id}")
+            await RideCache(self.redis).invalidate(ride_id)
+            await RideEventPublisher(self.redis).ride_matched(ride_id, driver_id)
+            if self.availability_service:
+                await self.availability_service.mirror(driver_id, False)
+        elif outcome in DRIVER_REJECTIONS:
+            logger.info(f"Driver {driver_id} is not available in database")
+            if self.availability_service:
+                # The mirror was stale; repair it for the next ride
+                await self.availability_service.mirror(driver_id, False)
+        return outcome
+
+    async def _available_candidates(self, driver_ids: List[int]) -> List[int]:
+        """
+        Filters candidates down to available drivers, preserving order.
+        """
+        if not driver_ids:
+            return []
+        if self.availability_service:
+            return await self.availability_service.filter_available(driver_ids)
+
+        result = await self.db.execute(
+            select(DriverProfile.user_id).where(
+                DriverProfile.user_id.in_(driver_ids),
+                DriverProfile.is_available == True
+            )
+        )
+        available = set(result.scalars().all())
+        return [driver_id for driver_id in driver_ids if driver_id in available]
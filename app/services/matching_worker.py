@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Callable, List, Optional, Set
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import AsyncSessionLocal
+from app.models.models import Ride, RideStatus
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+from app.services.ride_queue import QueuedRide, RideRequestQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 2.0 # seconds, doubled on every attempt
+DEFAULT_BLOCK_MS = 1000
+# Entries read by a consumer but not acknowledged for this long are assumed
+# orphaned by a crashed worker and reclaimed
+DEFAULT_RECLAIM_IDLE_MS = 30000
+DEFAULT_RECLAIM_INTERVAL = 5.0 # seconds
+STREAM_REFRESH_INTERVAL = 1.0 # seconds between partition discovery
+IDLE_BACKOFF = 0.01 # seconds to pause after an empty read
+# "match" assigns the nearest free driver (`match_ride`); "offer" offers
+# the ride to drivers who must accept it (`offer_ride`)
+MATCHING_MODES = ("match", "offer")
+
+class MatchingWorkerPool:
+    """
+    Pool of asyncio workers consuming the ride request queue and running
+    `MatchingService.match_ride` for each entry, or `offer_ride` in
+    "offer" mode.
+
+    Delivery semantics:
+    - An entry is acknowledged only once its ride is matched, is no longer
+      REQUESTED, or has been re-enqueued for a retry. A worker that dies
+      mid-ride leaves the entry pending, and it is reclaimed after
+      `reclaim_idle_ms`.
+    - Rides with no available driver (or whose matching raised) are retried
+      with exponential backoff, up to `max_attempts`, then dead-lettered.
+    """
+    def __init__(
+        self,
+        queue: RideRequestQueue,
+        service_factory: Optional[Callable[[AsyncSession], MatchingService]] = None,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        block_ms: int = DEFAULT_BLOCK_MS,
+        reclaim_idle_ms: int = DEFAULT_RECLAIM_IDLE_MS,
+        reclaim_interval: float = DEFAULT_RECLAIM_INTERVAL,
+        name: Optional[str] = None,
+        mode: str = "match",
+    ):
+        if mode not in MATCHING_MODES:
+            raise ValueError(f"mode must be one of {MATCHING_MODES}")
+        self.queue = queue
+        self.service_factory = service_factory or (
+            lambda db: MatchingService(db, LocationService(queue.redis), queue.redis)
+        )
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.block_ms = block_ms
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self.reclaim_interval = reclaim_interval
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.mode = mode
+
+        self.matched = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.dropped = 0 # rides no longer REQUESTED when their entry was processed
+
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._retries: Set[asyncio.Task] = set()
+        self._streams: List[str] = []
+        self._groups: Set[str] = set()
+        self._streams_refreshed_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "matched": self.matched,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "dropped": self.dropped,
+            "pending_retries": len(self._retries),
+        }
+
+    async def start(self):
+        """
+        Starts `concurrency` workers plus the reclaim loop.
+        """
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self.name}-{index}"))
+            for index in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._reclaimer(f"{self.name}-reclaimer")))
+
+    async def stop(self):
+        """
+        Stops all workers. Unacknowledged entries (including scheduled
+        retries) stay pending in Redis and are reclaimed by another pool.
+        """
+        # Loops also check the flag: a cancellation delivered while a Redis
+        # client is mid-command can be swallowed by the client
+        self._stopping = True
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+
+    async def process(self, entry: QueuedRide):
+        """
+        Runs matching for one queue entry and settles it.
+        """
+        try:
+            async with self.session_factory() as db:
+                service = self.service_factory(db)
+                if self.mode == "offer":
+                    driver_id = await service.offer_ride(entry.ride_id)
+                else:
+                    driver_id = await service.match_ride(entry.ride_id)
+                if driver_id is not None:
+                    self.matched += 1
+                    await self.queue.ack(entry)
+                    return
+                result = await db.execute(select(Ride.status).where(Ride.id == entry.ride_id))
+                still_requested = result.scalar() == RideStatus.REQUESTED
+            reason = "no_driver"
+        except Exception:
+            logger.exception(f"Matching failed for ride {entry.ride_id}")
+            still_requested = True
+            reason = "error"
+
+        if not still_requested:
+            self.dropped += 1
+            await self.queue.ack(entry)
+        elif entry.attempt + 1 >= self.max_attempts:
+            logger.warning(f"Giving up on ride {entry.ride_id} after {entry.attempt + 1} attempts")
+            self.dead_lettered += 1
+            await self.queue.dead_letter(entry, reason)
+        else:
+            self.retried += 1
+            task = asyncio.create_task(self._retry_later(entry))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, entry: QueuedRide):
+        # The entry stays pending while we wait, so the backoff must end
+        # before the reclaimer would consider it orphaned
+        delay = min(self.retry_delay * (2 ** entry.attempt), self.reclaim_idle_ms / 2000)
+        await asyncio.sleep(delay)
+        # Re-enqueue before acknowledging so a crash in between can only
+        # duplicate the ride, never lose it
+        await self.queue.enqueue(entry.ride_id, entry.lat, entry.long, attempt=entry.attempt + 1)
+        await self.queue.ack(entry)
+
+    async def _refresh_streams(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._streams_refreshed_at >= STREAM_REFRESH_INTERVAL:
+            self._streams = await self.queue.streams()
+            for stream in self._streams:
+                if stream not in self._groups:
+                    await self.queue.ensure_group(stream)
+                    self._groups.add(stream)
+            self._streams_refreshed_at = now
+        return self._streams
+
+    async def _worker(self, consumer: str):
+        while not self._stopping:
+            try:
+                streams = await self._refresh_streams()
+                entries = await self.queue.read(consumer, streams, count=1, block_ms=self.block_ms)
+                if not entries:
+                    await asyncio.sleep(IDLE_BACKOFF if streams else self.block_ms / 1000)
+                    continue
+                for entry in entries:
+                    await self.process(entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Matching worker {consumer} failed to read the queue")
+                await asyncio.sleep(self.block_ms / 1000)
+
+    async def _reclaimer(self, consumer: str):
+        while not self._stopping:
+            await asyncio.sleep(self.reclaim_interval)
+            try:
+                for stream in await self._refresh_streams():
+                    for entry in await self.queue.reclaim(consumer, stream, self.reclaim_idle_ms):
+                        logger.info(f"Reclaimed ride {entry.ride_id} from {stream}")
+                        await self.process(entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to reclaim pending ride requests")
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from app.core.metrics import NOTIFICATION_BATCH_SIZE, NOTIFICATION_DELIVERY_DURATION, NOTIFICATIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 0.01 # seconds a partial batch waits for more
+DEFAULT_MAX_QUEUE = 10_000
+DEFAULT_SENDERS = 4
+DEFAULT_MAX_ATTEMPTS = 2
+DEFAULT_RETRY_DELAY = 0.2 # seconds before the first retry, doubled on every attempt
+# Per driver: a burst of offers, then one every few seconds at most
+DEFAULT_DRIVER_RATE = 0.5 # notifications per second
+DEFAULT_DRIVER_BURST = 3
+RATE_LIMIT_PRUNE_INTERVAL = 60.0 # seconds
+# Stub push provider: median latency of one batched call
+DEFAULT_STUB_LATENCY = 0.08 # seconds
+DEFAULT_KEEP_DELIVERED = 1000 # most recent deliveries the stub remembers
+
+class OfferNotification(NamedTuple):
+    ride_id: int
+    driver_id: int
+    queued_at: float # time.perf_counter()
+    attempt: int = 1
+
+class StubPushBackend:
+    """
+    In-process stand-in for a push provider (APNS/FCM).
+
+    Each batched call sleeps for a log-normal latency around `latency`,
+    then fails each notification with probability `failure_rate`.
+    `on_delivered` is called for every delivered notification, which lets
+    simulations make drivers react to what they actually received. Only the
+    last `keep_delivered` deliveries are kept in `delivered`;
+    `delivered_count` counts them all.
+    """
+    def __init__(
+        self,
+        latency: float = DEFAULT_STUB_LATENCY,
+        jitter: float = 0.5,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+        on_delivered: Optional[Callable[[OfferNotification], None]] = None,
+        keep_delivered: int = DEFAULT_KEEP_DELIVERED,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.on_delivered = on_delivered
+        self.delivered: Deque[OfferNotification] = deque(maxlen=keep_delivered)
+        self.delivered_count = 0
+        self.calls = 0
+
+    async def send(self, batch: Sequence[OfferNotification]) -> List[bool]:
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(float(self.rng.lognormal(np.log(self.latency), self.jitter)))
+        results = (self.rng.random(len(batch)) >= self.failure_rate).tolist()
+        for notification, ok in zip(batch, results):
+            if ok:
+                self.delivered.append(notification)
+                self.delivered_count += 1
+                if self.on_delivered:
+                    self.on_delivered(notification)
+        return results
+
+class HttpPushBackend:
+    """
+    Sends each batch as one POST to a push gateway, e.g. the stub from
+    `create_push_stub_app`. The gateway answers `{"results": [bool, ...]}`.
+    """
+    def __init__(self, client: httpx.AsyncClient, path: str = "/push"):
+        self.client = client
+        self.path = path
+
+    async def send(self, batch: Sequence[OfferNotification]) -> List[bool]:
+        response = await self.client.post(self.path, json={"notifications": [
+            {"ride_id": notification.ride_id, "driver_id": notification.driver_id} for notification in batch
+        ]})
+        response.raise_for_status()
+        return response.json()["results"]
+
+def create_push_stub_app(stub: StubPushBackend):
+    """
+    An HTTP push gateway backed by `stub`, to serve with uvicorn or mount
+    in-process with httpx.ASGITransport.
+    """
+    app = FastAPI(title="Push gateway stub")
+
+    @app.post("/push")
+    async def push(payload: dict):
+        now = time.perf_counter()
+        batch = [OfferNotification(item["ride_id"], item["driver_id"], now) for item in payload["notifications"]]
+        return {"results": await stub.send(batch)}
+
+    return app
+
+class DriverRateLimiter:
+    """
+    A token bucket per driver: `burst` notifications at once, refilled at
+    `rate` per second.
+    """
+    def __init__(self, rate: float = DEFAULT_DRIVER_RATE, burst: int = DEFAULT_DRIVER_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[int, Tuple[float, float]] = {} # driver -> (tokens, updated_at)
+
+    def allow(self, driver_id: int, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        tokens, updated_at = self._buckets.get(driver_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            self._buckets[driver_id] = (tokens, now)
+            return False
+        self._buckets[driver_id] = (tokens - 1, now)
+        return True
+
+    def prune(self, now: Optional[float] = None):
+        """
+        Forgets drivers whose bucket has refilled, bounding memory.
+        """
+        now = time.monotonic() if now is None else now
+        full_after = self.burst / self.rate
+        self._buckets = {
+            driver_id: bucket for driver_id, bucket in self._buckets.items() if now - bucket[1] < full_after
+        }
+
+class NotificationDispatcher:
+    """
+    Delivers ride offers to drivers through a push backend, off the
+    matching path.
+
+    `notify_offer` matches MatchingService's `offer_notifier` hook. It only
+    rate-limits and enqueues, so an offer round never waits on the push
+    provider. `senders` background tasks drain the queue in batches of up
+    to `batch_size`, waiting at most `flush_interval` to fill one, and
+    retry failed notifications up to `max_attempts` in total, after a
+    backoff of `retry_delay` doubled on every attempt. A driver over
+    their rate limit, or a full queue, drops the notification: an unseen
+    offer simply times out and goes to the next driver.
+    """
+    def __init__(
+        self,
+        backend,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        senders: int = DEFAULT_SENDERS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        rate_limiter: Optional[DriverRateLimiter] = None,
+    ):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.senders = senders
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.rate_limiter = rate_limiter or DriverRateLimiter()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.stats = {"delivered": 0, "failed": 0, "rate_limited": 0, "dropped": 0}
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._pruned_at = time.monotonic()
+
+    async def notify_offer(self, ride_id: int, driver_ids: List[int]):
+        now = time.perf_counter()
+        for driver_id in driver_ids:
+            if not self.rate_limiter.allow(driver_id):
+                self._count("rate_limited")
+                continue
+            self._enqueue(OfferNotification(ride_id, driver_id, now))
+
+    def _enqueue(self, notification: OfferNotification):
+        try:
+            self.queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self._count("dropped")
+
+    def _count(self, result: str, amount: int = 1):
+        self.stats[result] += amount
+        NOTIFICATIONS.inc(result, amount=amount)
+
+    async def _next_batch(self) -> List[OfferNotification]:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+        return batch
+
+    async def _send(self, batch: List[OfferNotification]):
+        NOTIFICATION_BATCH_SIZE.observe(len(batch))
+        try:
+            results = await self.backend.send(batch)
+        except Exception:
+            logger.warning(f"Push backend failed a batch of {len(batch)}", exc_info=True)
+            results = [False] * len(batch)
+        if len(results) != len(batch):
+            # Without a result a notification can't be assumed delivered
+            logger.warning(f"Push backend returned {len(results)} results for a batch of {len(batch)}")
+            results = (list(results) + [False] * len(batch))[:len(batch)]
+
+        delivered_at = time.perf_counter()
+        for notification, ok in zip(batch, results):
+            if ok:
+                self._count("delivered")
+                NOTIFICATION_DELIVERY_DURATION.observe(delivered_at - notification.queued_at)
+            elif notification.attempt < self.max_attempts:
+                task = asyncio.create_task(self._retry_later(notification))
+                self._retries.add(task)
+                task.add_done_callback(self._retries.discard)
+            else:
+                self._count("failed")
+
+    async def _retry_later(self, notification: OfferNotification):
+        # Give a struggling provider time to recover instead of failing the
+        # retry within milliseconds
+        await asyncio.sleep(self.retry_delay * (2 ** (notification.attempt - 1)))
+        self._enqueue(notification._replace(attempt=notification.attempt + 1))
+
+    async def flush(self):
+        """
+        Waits until every queued notification has been sent, including
+        scheduled retries.
+        """
+        while True:
+            await self.queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*self._retries, return_exceptions=True)
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.senders)]
+
+    async def stop(self):
+        # Pending retries are dropped, like a full queue would drop them
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._retries.clear()
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send(batch)
+            except Exception:
+                logger.exception("Failed to send notifications")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if time.monotonic() - self._pruned_at > RATE_LIMIT_PRUNE_INTERVAL:
+                self.rate_limiter.prune()
+                self._pruned_at = time.monotonic()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
@@ -0,0 +1,139 @@
+import time
+from typing import Iterable, List, Optional
+from redis.asyncio import Redis
+
+# Drivers offered a ride at the same time
+DEFAULT_OFFER_FANOUT = 3
+# Seconds an offered driver has to respond; their lock expires after this
+DEFAULT_OFFER_TIMEOUT = 15.0
+# How long a ride remembers who it was offered to, so later rounds skip them
+OFFER_HISTORY_TTL = 600 # seconds
+
+# Deletes each lock in KEYS only if it still holds ARGV[1] (the ride ID), so
+# an offer never releases a lock another ride has taken since.
+RELEASE_LOCKS_SCRIPT = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+        released = released + 1
+    end
+end
+return released
+"""
+
+class RideOfferService:
+    """
+    Offers a ride to several drivers at once; the first to accept wins.
+
+    Each offered driver is locked with `lock:driver:<id>` holding the ride
+    ID, so no other ride can claim them while the offer is open. Redis keys
+    per ride:
+    - `ride_offers:<ride_id>`: every driver the ride was offered to.
+    - `ride_offers:<ride_id>:responses`: accept/decline events, consumed by
+      `wait_for_acceptance`.
+
+    Deciding the winner is not done here: the accept endpoint's conditional
+    UPDATE on the ride row is the atomic step. This service only reports the
+    outcome and releases the losers' locks.
+    """
+    def __init__(self, redis_client: Redis, offer_timeout: float = DEFAULT_OFFER_TIMEOUT):
+        self.redis = redis_client
+        self.offer_timeout = offer_timeout
+        self._release_script = None
+
+    def offers_key(self, ride_id: int) -> str:
+        return f"ride_offers:{ride_id}"
+
+    def responses_key(self, ride_id: int) -> str:
+        return f"ride_offers:{ride_id}:responses"
+
+    async def send(self, ride_id: int, candidate_ids: Iterable[int], fanout: int = DEFAULT_OFFER_FANOUT) -> List[int]:
+        """
+        Offers the ride to the first `fanout` candidates that can be locked,
+        in order. Returns the drivers that received the offer.
+        """
+        remaining = list(candidate_ids)
+        offered: List[int] = []
+        lock_ttl_ms = max(1, int(self.offer_timeout * 1000))
+        while remaining and len(offered) < fanout:
+            batch = remaining[:fanout - len(offered)]
+            remaining = remaining[len(batch):]
+            pipe = self.redis.pipeline(transaction=False)
+            for driver_id in batch:
+                pipe.set(f"lock:driver:{driver_id}", str(ride_id), px=lock_ttl_ms, nx=True)
+            locked = await pipe.execute()
+            offered.extend(driver_id for driver_id, ok in zip(batch, locked) if ok)
+
+        if offered:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sadd(self.offers_key(ride_id), *offered)
+            pipe.expire(self.offers_key(ride_id), OFFER_HISTORY_TTL)
+            await pipe.execute()
+        return offered
+
+    async def offered(self, ride_id: int) -> List[int]:
+        """
+        Returns every driver the ride has been offered to so far.
+        """
+        return sorted(int(driver_id) for driver_id in await self.redis.smembers(self.offers_key(ride_id)))
+
+    async def accepted(self, ride_id: int, driver_id: int):
+        """
+        Records that `driver_id` won the ride, which the caller has already
+        committed, and releases every other offer's lock.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(self.responses_key(ride_id), f"accept:{driver_id}")
+        pipe.expire(self.responses_key(ride_id), OFFER_HISTORY_TTL)
+        await pipe.execute()
+        await self.release(ride_id, await self.offered(ride_id))
+
+    async def decline(self, ride_id: int, driver_id: int):
+        """
+        Records a declined offer and frees the driver for other rides.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(self.responses_key(ride_id), f"decline:{driver_id}")
+        pipe.expire(self.responses_key(ride_id), OFFER_HISTORY_TTL)
+        await pipe.execute()
+        await self.release(ride_id, [driver_id])
+
+    async def release(self, ride_id: int, driver_ids: Iterable[int]) -> int:
+        """
+        Releases the locks this ride still holds on `driver_ids`.
+        """
+        keys = [f"lock:driver:{driver_id}" for driver_id in driver_ids]
+        if not keys:
+            return 0
+        if self._release_script is None:
+            self._release_script = self.redis.register_script(RELEASE_LOCKS_SCRIPT)
+        return await self._release_script(keys=keys, args=[str(ride_id)])
+
+    async def wait_for_acceptance(
+        self, ride_id: int, driver_ids: Iterable[int], timeout: Optional[float] = None
+    ) -> Optional[int]:
+        """
+        Blocks until one of `driver_ids` accepts, all of them decline, or
+        `timeout` (default: the offer timeout) passes. Returns the winner.
+        """
+        waiting = {int(driver_id) for driver_id in driver_ids}
+        deadline = time.monotonic() + (self.offer_timeout if timeout is None else timeout)
+        # The client reads a blocking reply under its socket timeout, so
+        # block in slices well inside it rather than for the whole offer
+        socket_timeout = self.redis.connection_pool.connection_kwargs.get("socket_timeout")
+        max_block = socket_timeout / 2 if socket_timeout else None
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            block = remaining if max_block is None else min(remaining, max_block)
+            response = await self.redis.blpop([self.responses_key(ride_id)], timeout=block)
+            if response is None:
+                continue
+            value = response[1]
+            event, driver_id = (value.decode() if isinstance(value, bytes) else value).split(":")
+            if event == "accept":
+                return int(driver_id)
+            waiting.discard(int(driver_id))
+        return None
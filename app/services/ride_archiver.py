@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional, Set
+from sqlalchemy import bindparam, delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import AsyncSessionLocal
+from app.models.models import ArchivedRide, Ride, RideStatus
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = (RideStatus.COMPLETED, RideStatus.CANCELLED)
+# Finished rides stay hot this long, for the rider's last polls and receipts
+DEFAULT_ARCHIVE_AFTER = 3600.0 # seconds
+DEFAULT_ARCHIVE_BATCH_SIZE = 1000
+DEFAULT_ARCHIVE_INTERVAL = 60.0 # seconds
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(moment: datetime) -> datetime:
+    return month_start(month_start(moment) + timedelta(days=32))
+
+def archive_partition_name(moment: datetime) -> str:
+    return f"{ArchivedRide.__tablename__}_{moment:%Y_%m}"
+
+class RideArchiver:
+    """
+    Moves finished rides from `rides` into `rides_archive` in bulk batches.
+
+    Keeping only live rides in `rides` keeps the table, its indexes and its
+    vacuum work small enough to stay in memory, however many rides have
+    ever been taken. Each batch copies up to `batch_size` rides finished
+    more than `archive_after` seconds ago with one INSERT ... SELECT, then
+    deletes them, in one transaction. Rows are picked with
+    `FOR UPDATE SKIP LOCKED`, so several archivers never move the same ride.
+    """
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        archive_after: float = DEFAULT_ARCHIVE_AFTER,
+        batch_size: int = DEFAULT_ARCHIVE_BATCH_SIZE,
+        interval: float = DEFAULT_ARCHIVE_INTERVAL,
+    ):
+        self.session_factory = session_factory
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self.interval = interval
+        self.archived = 0
+        self._partitions: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def archive_batch(self) -> int:
+        """
+        Archives one batch. Returns the number of rides moved.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.archive_after)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Ride.id, func.coalesce(Ride.created_at, Ride.updated_at))
+                # Statuses are rendered inline so the planner can match the
+                # partial index ix_rides_finished_updated_at
+                .where(
+                    Ride.status.in_(bindparam("finished", FINISHED_STATUSES, expanding=True, literal_execute=True)),
+                    Ride.updated_at < cutoff,
+                )
+                .order_by(Ride.updated_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = result.all()
+            if not rows:
+                return 0
+
+            ride_ids = [ride_id for ride_id, _ in rows]
+            partitions = set()
+            if db.get_bind().dialect.name == "postgresql":
+                partitions = await self._ensure_partitions(db, (created_at for _, created_at in rows))
+
+            columns = [column.name for column in Ride.__table__.columns]
+            values = [
+                func.coalesce(Ride.created_at, Ride.updated_at) if name == "created_at" else Ride.__table__.c[name]
+                for name in columns
+            ]
+            await db.execute(
+                insert(ArchivedRide).from_select(columns, select(*values).where(Ride.id.in_(ride_ids)))
+            )
+            await db.execute(delete(Ride).where(Ride.id.in_(ride_ids)))
+            await db.commit()
+
+        # Only remembered once committed: a rolled back CREATE is gone too
+        self._partitions.update(partitions)
+        self.archived += len(ride_ids)
+        return len(ride_ids)
+
+    async def archive(self) -> int:
+        """
+        Archives batches until no eligible ride is left. Returns the total.
+        """
+        total = 0
+        while True:
+            moved = await self.archive_batch()
+            total += moved
+            if moved < self.batch_size:
+                break
+        if total:
+            logger.info(f"Archived {total} finished rides")
+        return total
+
+    async def _ensure_partitions(self, db: AsyncSession, created: Iterable[datetime]) -> Set[str]:
+        # Monthly range partitions are created the first time a ride from
+        # that month is archived. There is no default partition: a new
+        # partition could not be carved out of one that already holds rows.
+        names = set()
+        for month in {month_start(moment) for moment in created}:
+            name = archive_partition_name(month)
+            if name in self._partitions:
+                continue
+            await db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {ArchivedRide.__tablename__} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            ))
+            names.add(name)
+        return names
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.archive()
+            except Exception:
+                logger.exception("Failed to archive finished rides")
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
@@ -0,0 +1,119 @@
+import enum
+from typing import Optional
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Ride, DriverProfile, RideStatus
+
+class AssignmentResult(enum.Enum):
+    ASSIGNED = "assigned"
+    ALREADY_ASSIGNED = "already_assigned" # same driver, e.g. a retried accept
+    RIDE_NOT_FOUND = "ride_not_found"
+    RIDE_NOT_REQUESTED = "ride_not_requested"
+    DRIVER_NOT_FOUND = "driver_not_found"
+    DRIVER_NOT_AVAILABLE = "driver_not_available"
+
+def _claim_ride(ride_id: int, driver_id: int, match_radius_km: Optional[float]):
+    values = {"status": RideStatus.MATCHED, "driver_id": driver_id}
+    if match_radius_km is not None:
+        values["match_radius_km"] = match_radius_km
+    return (
+        update(Ride)
+        .where(Ride.id == ride_id, Ride.status == RideStatus.REQUESTED)
+        .values(**values)
+    )
+
+def _claim_ride_reporting(ride_id: int, driver_id: int, match_radius_km: Optional[float]):
+    # Postgres runs the UPDATE in a data-modifying CTE. The outer SELECT
+    # reads the row as it was before, so a losing call learns why it lost
+    # from the same statement.
+    claimed = _claim_ride(ride_id, driver_id, match_radius_km).returning(Ride.id).cte("claimed")
+    return select(
+        Ride.status, Ride.driver_id, exists(select(claimed.c.id)).label("claimed")
+    ).where(Ride.id == ride_id)
+
+def _claim_driver(driver_id: int):
+    return (
+        update(DriverProfile)
+        .where(DriverProfile.user_id == driver_id, DriverProfile.is_available == True)
+        .values(is_available=False)
+    )
+
+async def assign_driver(
+    db: AsyncSession, ride_id: int, driver_id: int, match_radius_km: Optional[float] = None
+) -> AssignmentResult:
+    """
+    Atomically assigns a driver to a REQUESTED ride and commits.
+
+    Both rows are flipped with conditional UPDATEs (compare-and-set on
+    `status` / `is_available`, checked through the row count) in one
+    transaction, so there is no read-modify-write window: of several
+    concurrent calls for the same ride or driver, exactly one succeeds.
+
+    The ride is updated first. A losing call for an already-taken ride fails
+    on that first statement without writing anything. On Postgres that same
+    statement also reports the ride's status, so a losing accept costs one
+    query. Elsewhere, and when the driver is the problem, one SELECT
+    classifies the failure for the caller.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        row = (await db.execute(_claim_ride_reporting(ride_id, driver_id, match_radius_km))).first()
+        if row is None:
+            return AssignmentResult.RIDE_NOT_FOUND
+        if not row.claimed:
+            if row.status == RideStatus.MATCHED and row.driver_id == driver_id:
+                return AssignmentResult.ALREADY_ASSIGNED
+            return AssignmentResult.RIDE_NOT_REQUESTED
+    else:
+        result = await db.execute(_claim_ride(ride_id, driver_id, match_radius_km))
+        if result.rowcount != 1:
+            return await _classify_failure(db, ride_id, driver_id)
+
+    result = await db.execute(_claim_driver(driver_id))
+    if result.rowcount == 1:
+        await db.commit()
+        return AssignmentResult.ASSIGNED
+    # Undo the ride update
+    await db.rollback()
+    return await _classify_failure(db, ride_id, driver_id)
+
+async def stage_assignment(
+    db: AsyncSession, ride_id: int, driver_id: int, match_radius_km: Optional[float] = None
+) -> AssignmentResult:
+    """
+    The compare-and-set UPDATEs of `assign_driver`, run in the caller's
+    transaction without committing, for callers assigning many rides at
+    once.
+
+    The driver is flipped first. If the ride is no longer REQUESTED, the
+    driver is flipped back in the same transaction, so any failure leaves
+    both rows as they were. Failures are not classified any further than
+    DRIVER_NOT_AVAILABLE or RIDE_NOT_REQUESTED.
+    """
+    result = await db.execute(_claim_driver(driver_id))
+    if result.rowcount != 1:
+        return AssignmentResult.DRIVER_NOT_AVAILABLE
+    result = await db.execute(_claim_ride(ride_id, driver_id, match_radius_km))
+    if result.rowcount != 1:
+        await db.execute(
+            update(DriverProfile).where(DriverProfile.user_id == driver_id).values(is_available=True)
+        )
+        return AssignmentResult.RIDE_NOT_REQUESTED
+    return AssignmentResult.ASSIGNED
+
+async def _classify_failure(db: AsyncSession, ride_id: int, driver_id: int) -> AssignmentResult:
+    result = await db.execute(
+        select(Ride.status, Ride.driver_id, DriverProfile.user_id.label("profile_user_id"))
+        .select_from(Ride)
+        .outerjoin(DriverProfile, DriverProfile.user_id == driver_id)
+        .where(Ride.id == ride_id)
+    )
+    row = result.first()
+    if row is None:
+        return AssignmentResult.RIDE_NOT_FOUND
+    if row.profile_user_id is None:
+        return AssignmentResult.DRIVER_NOT_FOUND
+    if row.status == RideStatus.MATCHED and row.driver_id == driver_id:
+        return AssignmentResult.ALREADY_ASSIGNED
+    if row.status != RideStatus.REQUESTED:
+        return AssignmentResult.RIDE_NOT_REQUESTED
+    return AssignmentResult.DRIVER_NOT_AVAILABLE
@@ -0,0 +1,80 @@
+import hashlib
+import logging
+from typing import NamedTuple, Optional
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.models.models import Ride
+from app.schemas.ride import RideResponse
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long a missed invalidation can serve a stale ride. A
+# poller that fills the cache just as a match commits could otherwise pin
+# the old status; invalidation makes the normal case immediate.
+DEFAULT_RIDE_CACHE_TTL = 30 # seconds
+
+class CachedRide(NamedTuple):
+    etag: str # quoted, as sent in the ETag header
+    body: bytes # serialized RideResponse
+
+class RideCache:
+    """
+    Read-through cache of serialized ride responses for status polling.
+
+    Each ride is a hash holding the JSON body and its ETag, so a conditional
+    poll is answered from one HGETALL. Every status transition must call
+    `put` or `invalidate`. Redis failures are logged and treated as misses;
+    Postgres stays the source of truth.
+    """
+    def __init__(self, redis_client: Redis, ttl: int = DEFAULT_RIDE_CACHE_TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def key(ride_id: int) -> str:
+        return f"ride:{ride_id}"
+
+    @staticmethod
+    def serialize(ride: Ride) -> CachedRide:
+        body = RideResponse.model_validate(ride).model_dump_json().encode()
+        return CachedRide(f'"{hashlib.sha1(body).hexdigest()[:16]}"', body)
+
+    async def get(self, ride_id: int) -> Optional[CachedRide]:
+        try:
+            fields = await self.redis.hgetall(self.key(ride_id))
+        except RedisError:
+            logger.warning(f"Failed to read ride {ride_id} from cache", exc_info=True)
+            return None
+        if not fields:
+            return None
+        return CachedRide(fields[b"etag"].decode(), fields[b"body"])
+
+    async def put(self, ride: Ride) -> CachedRide:
+        cached = self.serialize(ride)
+        key = self.key(ride.id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={"etag": cached.etag, "body": cached.body})
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except RedisError:
+            logger.warning(f"Failed to cache ride {ride.id}", exc_info=True)
+        return cached
+
+    async def invalidate(self, *ride_ids: int):
+        keys = [self.key(ride_id) for ride_id in ride_ids]
+        if not keys:
+            return
+        try:
+            await self.redis.delete(*keys)
+        except RedisError:
+            logger.warning(f"Failed to invalidate cached rides {list(ride_ids)}", exc_info=True)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches `etag` (weak comparison).
+    """
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in (value[2:] if value.startswith("W/") else value for value in candidates)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, Mapping, Optional, Set, Tuple
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from app.models.models import RideStatus
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = (RideStatus.COMPLETED, RideStatus.CANCELLED)
+# Safety net for `driver_ride` keys whose ride never reaches a final status
+ACTIVE_RIDE_TTL = 4 * 3600 # seconds
+# Comment lines sent on idle streams so proxies keep them open
+KEEPALIVE_INTERVAL = 15.0 # seconds
+# Events buffered per listener; a listener that falls this far behind
+# misses events rather than growing without bound
+LISTENER_QUEUE_SIZE = 100
+
+def ride_channel(ride_id: int) -> str:
+    return f"ride_events:{ride_id}"
+
+def driver_ride_key(driver_id: int) -> str:
+    return f"driver_ride:{driver_id}"
+
+def status_event(ride_id: int, status: RideStatus, driver_id: Optional[int] = None) -> str:
+    return json.dumps({"type": "status", "ride_id": ride_id, "status": status.value, "driver_id": driver_id})
+
+def position_event(ride_id: int, driver_id: int, lat: float, long: float) -> str:
+    return json.dumps({"type": "position", "ride_id": ride_id, "driver_id": driver_id, "lat": lat, "long": long})
+
+def sse_message(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+class RideEventPublisher:
+    """
+    Publishes ride status transitions and the assigned driver's positions
+    on the ride's pub/sub channel (`ride_events:<ride_id>`).
+
+    While a ride is active, `driver_ride:<driver_id>` points at it, so a
+    batch of location pings finds the rides it concerns with one MGET.
+    Publishing is best-effort: clients still read the current state when
+    they (re)connect, and Postgres stays the source of truth.
+    """
+    def __init__(self, redis_client: Redis):
+        self.redis = redis_client
+
+    async def rides_matched(self, matches: Mapping[int, int]):
+        """
+        Announces ride ID -> driver ID assignments.
+        """
+        if not matches:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for ride_id, driver_id in matches.items():
+                    pipe.set(driver_ride_key(driver_id), ride_id, ex=ACTIVE_RIDE_TTL)
+                    pipe.publish(ride_channel(ride_id), status_event(ride_id, RideStatus.MATCHED, driver_id))
+                await pipe.execute()
+        except RedisError:
+            logger.warning(f"Failed to publish matches for rides {list(matches)}", exc_info=True)
+
+    async def ride_matched(self, ride_id: int, driver_id: int):
+        await self.rides_matched({ride_id: driver_id})
+
+    async def status_changed(self, ride_id: int, status: RideStatus, driver_id: Optional[int] = None):
+        """
+        Announces any other transition. A final status stops the driver's
+        position updates for this ride.
+        """
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if driver_id is not None and status in FINAL_STATUSES:
+                    pipe.delete(driver_ride_key(driver_id))
+                pipe.publish(ride_channel(ride_id), status_event(ride_id, status, driver_id))
+                await pipe.execute()
+        except RedisError:
+            logger.warning(f"Failed to publish status of ride {ride_id}", exc_info=True)
+
+    async def driver_positions(self, pings: Iterable[Tuple[int, float, float]]) -> int:
+        """
+        Forwards (driver_id, lat, long) pings of drivers on an active ride.
+        Returns the number of position events published.
+        """
+        latest = {driver_id: (lat, long) for driver_id, lat, long in pings}
+        if not latest:
+            return 0
+        driver_ids = list(latest)
+        try:
+            ride_ids = await self.redis.mget([driver_ride_key(driver_id) for driver_id in driver_ids])
+            active = [(driver_id, int(ride_id)) for driver_id, ride_id in zip(driver_ids, ride_ids) if ride_id]
+            if not active:
+                return 0
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for driver_id, ride_id in active:
+                    pipe.publish(ride_channel(ride_id), position_event(ride_id, driver_id, *latest[driver_id]))
+                await pipe.execute()
+        except RedisError:
+            logger.warning("Failed to publish driver positions", exc_info=True)
+            return 0
+        return len(active)
+
+class RideEventHub:
+    """
+    Shares one pub/sub connection among every event stream of an API
+    process.
+
+    A channel is subscribed while at least one listener follows its ride,
+    and each message is copied to the listeners' queues. Thousands of open
+    streams then cost one Redis connection, not one each out of the shared
+    pool.
+    """
+    def __init__(self, redis_client: Redis, queue_size: int = LISTENER_QUEUE_SIZE):
+        self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self.queue_size = queue_size
+        self._listeners: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._subscribed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def listen(self, ride_id: int) -> AsyncIterator[asyncio.Queue]:
+        """
+        Yields a queue receiving the ride's events (decoded JSON) from the
+        moment the channel is subscribed.
+        """
+        channel = ride_channel(ride_id)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        first = not self._listeners[channel]
+        self._listeners[channel].add(queue)
+        try:
+            if first:
+                await self.pubsub.subscribe(channel)
+                self._subscribed.set()
+            yield queue
+        finally:
+            listeners = self._listeners[channel]
+            listeners.discard(queue)
+            if not listeners:
+                del self._listeners[channel]
+                try:
+                    await self.pubsub.unsubscribe(channel)
+                except RedisError:
+                    logger.warning(f"Failed to unsubscribe from {channel}", exc_info=True)
+
+    def dispatch(self, message: dict):
+        channel = message["channel"].decode() if isinstance(message["channel"], bytes) else message["channel"]
+        event = json.loads(message["data"])
+        for queue in self._listeners.get(channel, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping event for a slow listener on {channel}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.pubsub.aclose()
+
+    async def _run(self):
+        while True:
+            # Reading needs a subscribed connection; wait for the first listener
+            await self._subscribed.wait()
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+                if message is not None and message["type"] == "message":
+                    self.dispatch(message)
+            except RedisError:
+                logger.warning("Ride event subscription failed, retrying", exc_info=True)
+                await asyncio.sleep(1.0)
+            except Exception:
+                logger.exception("Failed to dispatch a ride event")
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+def get_ride_event_hub(request: Request) -> RideEventHub:
+    return request.app.state.ride_event_hub
@@ -0,0 +1,99 @@
+import base64
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import ArchivedRide, Ride
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# The RideResponse fields; history never loads whole ORM rows
+HISTORY_COLUMNS = (
+    "id", "rider_id", "driver_id", "source_lat", "source_long", "dest_lat", "dest_long",
+    "status", "created_at", "estimated_fare", "estimated_time",
+)
+
+class Cursor(NamedTuple):
+    created_at: datetime
+    id: int
+
+def encode_cursor(cursor: Cursor) -> str:
+    raw = f"{cursor.created_at.isoformat()}|{cursor.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Cursor:
+    """
+    Parses a cursor from `encode_cursor`. Raises ValueError if malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, ride_id = raw.split("|")
+        return Cursor(datetime.fromisoformat(created_at), int(ride_id))
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(f"Invalid cursor {token!r}") from exc
+
+class RidePage(NamedTuple):
+    rides: List[dict]
+    next_cursor: Optional[str]
+
+class RideHistory:
+    """
+    A rider's or driver's rides, newest first, one page at a time.
+
+    Pages are keyset-paginated on `(created_at, id)`: each page seeks
+    straight to its cursor in the `(rider_id|driver_id, created_at, id)`
+    indexes and reads at most `limit + 1` rows, from `rides` and from
+    `rides_archive`. The cost of a page does not depend on how many rides
+    the user has, unlike OFFSET or the lazy-loaded relationships.
+    """
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def page(
+        self, owner: str, user_id: int, limit: int = DEFAULT_PAGE_SIZE, before: Optional[Cursor] = None
+    ) -> RidePage:
+        """
+        One page of `owner`'s ("rider" or "driver") rides created before
+        `before`.
+        """
+        sources = [self._newest(table, owner, user_id, limit + 1, before) for table in (Ride, ArchivedRide)]
+        merged = union_all(*sources).subquery()
+        result = await self.db.execute(
+            select(merged).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(limit + 1)
+        )
+        rows = [dict(row._mapping) for row in result]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(Cursor(rows[-1]["created_at"], rows[-1]["id"]))
+        return RidePage(rows, next_cursor)
+
+    @staticmethod
+    def _newest(table, owner: str, user_id: int, limit: int, before: Optional[Cursor]):
+        owner_column = getattr(table, f"{owner}_id")
+        query = select(*(getattr(table, name) for name in HISTORY_COLUMNS)).where(owner_column == user_id)
+        if before is not None:
+            query = query.where(tuple_(table.created_at, table.id) < tuple_(before.created_at, before.id))
+        # Limited per table, so each side is an index range scan
+        return select(
+            query.order_by(table.created_at.desc(), table.id.desc()).limit(limit).subquery()
+        )
+
+def serialize_ride(ride: dict) -> str:
+    return json.dumps({
+        **ride,
+        "status": ride["status"].value,
+        "created_at": ride["created_at"].isoformat(),
+    })
+
+async def stream_page(page: RidePage) -> AsyncIterator[bytes]:
+    """
+    The page as a JSON object, written one ride at a time.
+    """
+    yield b'{"rides":['
+    for index, ride in enumerate(page.rides):
+        yield ((b"," if index else b"") + serialize_ride(ride).encode())
+    yield f'],"next_cursor":{json.dumps(page.next_cursor)}}}'.encode()
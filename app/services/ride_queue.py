@@ -0,0 +1,147 @@
+from typing import List, NamedTuple, Optional, Sequence
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from app.services.geo_sharding import geohash_encode
+
+# Geohash length of a queue partition (~156km x 156km, roughly a metro area)
+DEFAULT_PARTITION_PRECISION = 3
+# Approximate cap on entries kept per partition stream
+DEFAULT_STREAM_MAXLEN = 100000
+CONSUMER_GROUP = "matchers"
+
+class QueuedRide(NamedTuple):
+    stream: str
+    entry_id: str
+    ride_id: int
+    attempt: int
+    lat: float
+    long: float
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+class RideRequestQueue:
+    """
+    Ride request queue partitioned by region, backed by Redis Streams.
+
+    Each region (a geohash prefix of the pickup point) gets its own stream,
+    `ride_requests:<geohash>`, consumed by the `matchers` consumer group.
+    A surge in one city only deepens that city's stream; the set
+    `ride_requests:regions` lets workers discover partitions as they appear.
+    """
+    def __init__(
+        self,
+        redis_client: Redis,
+        partition_precision: int = DEFAULT_PARTITION_PRECISION,
+        stream_maxlen: int = DEFAULT_STREAM_MAXLEN,
+    ):
+        self.redis = redis_client
+        self.prefix = "ride_requests"
+        self.partition_precision = partition_precision
+        self.stream_maxlen = stream_maxlen
+        self.regions_key = f"{self.prefix}:regions"
+        self.dead_letter_stream = f"{self.prefix}:dead"
+
+    def stream_for(self, lat: float, long: float) -> str:
+        """
+        Returns the partition stream for a pickup point.
+        """
+        return f"{self.prefix}:{geohash_encode(lat, long, self.partition_precision)}"
+
+    async def enqueue(self, ride_id: int, lat: float, long: float, attempt: int = 0) -> str:
+        """
+        Appends a ride to its region's stream. Returns the entry ID.
+        """
+        stream = self.stream_for(lat, long)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(self.regions_key, stream)
+        pipe.xadd(
+            stream,
+            {"ride_id": ride_id, "attempt": attempt, "lat": lat, "long": long},
+            maxlen=self.stream_maxlen,
+            approximate=True,
+        )
+        _, entry_id = await pipe.execute()
+        return _decode(entry_id)
+
+    async def streams(self) -> List[str]:
+        """
+        Returns every partition stream that has received a ride.
+        """
+        return sorted(_decode(stream) for stream in await self.redis.smembers(self.regions_key))
+
+    async def ensure_group(self, stream: str):
+        """
+        Creates the consumer group for `stream` if it doesn't exist yet.
+        """
+        try:
+            await self.redis.xgroup_create(stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read(
+        self, consumer: str, streams: Sequence[str], count: int = 1, block_ms: Optional[int] = None
+    ) -> List[QueuedRide]:
+        """
+        Reads new entries for `consumer` from the given streams.
+        """
+        if not streams:
+            return []
+        response = await self.redis.xreadgroup(
+            CONSUMER_GROUP, consumer, {stream: ">" for stream in streams}, count=count, block=block_ms
+        )
+        return [
+            self._parse(_decode(stream), entry_id, fields)
+            for stream, entries in response or []
+            for entry_id, fields in entries
+        ]
+
+    async def reclaim(
+        self, consumer: str, stream: str, min_idle_ms: int, count: int = 10
+    ) -> List[QueuedRide]:
+        """
+        Takes over entries another consumer read but never acknowledged
+        within `min_idle_ms`, e.g. because its worker crashed.
+        """
+        response = await self.redis.xautoclaim(
+            stream, CONSUMER_GROUP, consumer, min_idle_time=min_idle_ms, start_id="0-0", count=count
+        )
+        return [
+            self._parse(stream, entry_id, fields)
+            for entry_id, fields in response[1]
+            if fields
+        ]
+
+    async def ack(self, entry: QueuedRide):
+        """
+        Acknowledges an entry so it is never delivered again, and deletes it.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xack(entry.stream, CONSUMER_GROUP, entry.entry_id)
+        pipe.xdel(entry.stream, entry.entry_id)
+        await pipe.execute()
+
+    async def dead_letter(self, entry: QueuedRide, reason: str):
+        """
+        Moves an entry that exhausted its retries to the dead-letter stream.
+        """
+        await self.redis.xadd(
+            self.dead_letter_stream,
+            {"ride_id": entry.ride_id, "attempt": entry.attempt, "stream": entry.stream, "reason": reason},
+            maxlen=self.stream_maxlen,
+            approximate=True,
+        )
+        await self.ack(entry)
+
+    @staticmethod
+    def _parse(stream: str, entry_id, fields) -> QueuedRide:
+        fields = {_decode(key): _decode(value) for key, value in fields.items()}
+        return QueuedRide(
+            stream=stream,
+            entry_id=_decode(entry_id),
+            ride_id=int(fields["ride_id"]),
+            attempt=int(fields.get("attempt", 0)),
+            lat=float(fields["lat"]),
+            long=float(fields["long"]),
+        )
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Optional
+from app.services.location_service import LocationService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWEEP_INTERVAL = 10.0 # seconds
+
+class StaleDriverSweeper:
+    """
+    Background task that periodically evicts drivers who stopped pinging.
+
+    Redis GEO members never expire on their own, so without this a crashed
+    driver app leaves a ghost in the index that every matching attempt pays
+    for. Searches already hide stale drivers; the sweeper keeps the sorted
+    sets themselves small.
+    """
+    def __init__(
+        self,
+        location_service: LocationService,
+        interval: float = DEFAULT_SWEEP_INTERVAL,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.location_service = location_service
+        self.interval = interval
+        self.max_age_seconds = max_age_seconds
+        self.evicted = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self) -> int:
+        """
+        Runs a single eviction pass. Returns the number of drivers evicted.
+        """
+        evicted = await self.location_service.evict_stale_drivers(self.max_age_seconds)
+        self.evicted += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} stale drivers")
+        return evicted
+
+    async def start(self):
+        """
+        Starts the background sweep loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the sweep loop.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Failed to evict stale drivers")
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+import numpy as np
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.base import AsyncSessionLocal
+from app.models.models import Ride, RideStatus
+from app.services.availability_service import AvailabilityService
+from app.services.geo_sharding import geohash_cell_size, geohash_encode
+from app.services.location_service import LocationService
+
+logger = logging.getLogger(__name__)
+
+# San Francisco, the area surge is computed over
+DEFAULT_CENTER = (37.7749, -122.4194)
+DEFAULT_SURGE_RADIUS_KM = 15.0
+# Precision 6 cells are ~1.2km x 0.6km, a few blocks of demand
+DEFAULT_SURGE_PRECISION = 6
+DEFAULT_DEMAND_WINDOW = 600.0 # seconds of ride requests counted as demand
+DEFAULT_RECOMPUTE_INTERVAL = 30.0 # seconds
+DEFAULT_REFRESH_INTERVAL = 5.0 # seconds
+# Multiplier added per unit of excess demand over supply
+SURGE_SENSITIVITY = 0.5
+MAX_SURGE_MULTIPLIER = 3.0
+# Open requests a cell needs before it can surge, so one request in an
+# empty cell does not price it up
+MIN_SURGE_DEMAND = 3
+SURGE_STEP = 0.1
+SURGE_MAP_KEY = "surge_map"
+_KM_PER_DEGREE_LAT = 111.32
+
+class SurgeMap(NamedTuple):
+    precision: int
+    multipliers: Dict[str, float] # geohash cell -> multiplier, surging cells only
+    computed_at: float
+
+    def multiplier_for(self, lat: float, long: float) -> float:
+        if not self.multipliers:
+            return 1.0
+        return self.multipliers.get(geohash_encode(lat, long, self.precision), 1.0)
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, raw) -> "SurgeMap":
+        return cls(**json.loads(raw))
+
+EMPTY_SURGE_MAP = SurgeMap(DEFAULT_SURGE_PRECISION, {}, 0.0)
+
+class CellGrid:
+    """
+    Geohash-aligned histogram grid over a city.
+
+    Bin edges fall on geohash cell boundaries, so each bin of a 2D histogram
+    is exactly one geohash cell. The grid size depends on the city's area,
+    not on how many drivers or requests are counted.
+    """
+    def __init__(self, center: Tuple[float, float], radius_km: float, precision: int):
+        self.precision = precision
+        cell_height, cell_width = geohash_cell_size(precision)
+        delta_lat = radius_km / _KM_PER_DEGREE_LAT
+        delta_long = radius_km / (_KM_PER_DEGREE_LAT * max(math.cos(math.radians(center[0])), 0.01))
+        first_row = math.floor((center[0] - delta_lat + 90.0) / cell_height)
+        last_row = math.floor((center[0] + delta_lat + 90.0) / cell_height)
+        first_col = math.floor((center[1] - delta_long + 180.0) / cell_width)
+        last_col = math.floor((center[1] + delta_long + 180.0) / cell_width)
+        self.lat_edges = -90.0 + np.arange(first_row, last_row + 2) * cell_height
+        self.long_edges = -180.0 + np.arange(first_col, last_col + 2) * cell_width
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.lat_edges) - 1, len(self.long_edges) - 1
+
+    def histogram(self, lats: np.ndarray, longs: np.ndarray) -> np.ndarray:
+        """
+        Counts points per cell. Points outside the grid are dropped.
+        """
+        counts, _, _ = np.histogram2d(lats, longs, bins=(self.lat_edges, self.long_edges))
+        return counts
+
+    def cell(self, row: int, col: int) -> str:
+        lat = (self.lat_edges[row] + self.lat_edges[row + 1]) / 2
+        long = (self.long_edges[col] + self.long_edges[col + 1]) / 2
+        return geohash_encode(float(lat), float(long), self.precision)
+
+def surge_multipliers(demand: np.ndarray, supply: np.ndarray) -> np.ndarray:
+    """
+    Multiplier per cell from demand and supply counts of the same shape.
+
+    Grows with the excess of open requests over available drivers, rounded
+    down to SURGE_STEP and capped at MAX_SURGE_MULTIPLIER. Cells below
+    MIN_SURGE_DEMAND stay at 1.0.
+    """
+    ratio = demand / np.maximum(supply, 1.0)
+    raw = 1.0 + SURGE_SENSITIVITY * np.maximum(ratio - 1.0, 0.0)
+    stepped = np.floor(np.round(raw / SURGE_STEP, 6)) * SURGE_STEP
+    return np.where(demand >= MIN_SURGE_DEMAND, np.minimum(stepped, MAX_SURGE_MULTIPLIER), 1.0)
+
+class SurgePricingService:
+    """
+    Computes the surge multiplier map and shares it through Redis.
+
+    `recompute` counts open ride requests from the last `demand_window`
+    seconds and available drivers per geohash cell, as NumPy histograms,
+    and publishes the cells that surge as one JSON value. Drivers are read
+    from the geo index a chunk at a time and folded into the histogram as
+    they arrive, so memory stays at the size of the grid however large the
+    fleet is. API processes `load` the published map and price from it in
+    memory.
+    """
+    def __init__(
+        self,
+        redis_client: Redis,
+        location_service: LocationService,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        availability_service: Optional[AvailabilityService] = None,
+        center: Tuple[float, float] = DEFAULT_CENTER,
+        radius_km: float = DEFAULT_SURGE_RADIUS_KM,
+        precision: int = DEFAULT_SURGE_PRECISION,
+        demand_window: float = DEFAULT_DEMAND_WINDOW,
+    ):
+        self.redis = redis_client
+        self.location_service = location_service
+        self.session_factory = session_factory
+        self.availability_service = availability_service or AvailabilityService(redis_client)
+        self.grid = CellGrid(center, radius_km, precision)
+        self.demand_window = demand_window
+
+    async def demand_histogram(self) -> np.ndarray:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.demand_window)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Ride.source_lat, Ride.source_long)
+                .where(Ride.status == RideStatus.REQUESTED, Ride.created_at >= cutoff)
+            )
+            points = np.array(result.all(), dtype=float).reshape(-1, 2)
+        return self.grid.histogram(points[:, 0], points[:, 1])
+
+    async def supply_histogram(self) -> np.ndarray:
+        counts = np.zeros(self.grid.shape)
+        async for pings in self.location_service.iter_positions():
+            pings = np.array(pings, dtype=float)
+            available = np.isin(
+                pings[:, 0], await self.availability_service.filter_available(pings[:, 0].astype(int).tolist())
+            )
+            counts += self.grid.histogram(pings[available, 1], pings[available, 2])
+        return counts
+
+    async def recompute(self) -> SurgeMap:
+        """
+        Aggregates demand and supply, publishes the new map and returns it.
+        """
+        demand, supply = await asyncio.gather(self.demand_histogram(), self.supply_histogram())
+        multipliers = surge_multipliers(demand, supply)
+        rows, cols = np.nonzero(multipliers > 1.0)
+        surge_map = SurgeMap(
+            self.grid.precision,
+            {self.grid.cell(row, col): round(float(multipliers[row, col]), 2) for row, col in zip(rows, cols)},
+            time.time(),
+        )
+        await self.redis.set(SURGE_MAP_KEY, surge_map.to_json())
+        return surge_map
+
+    async def load(self) -> SurgeMap:
+        """
+        Returns the last published map, or an empty one.
+        """
+        raw = await self.redis.get(SURGE_MAP_KEY)
+        return SurgeMap.from_json(raw) if raw else EMPTY_SURGE_MAP
+
+class SurgeMapUpdater:
+    """
+    Background task that keeps a surge map current.
+
+    With `recompute` it runs the aggregation every `interval` seconds
+    (one instance per city is enough); otherwise it reloads the published
+    map. Each new map is handed to `on_update`.
+    """
+    def __init__(
+        self,
+        service: SurgePricingService,
+        on_update: Callable[[SurgeMap], None],
+        interval: float = DEFAULT_REFRESH_INTERVAL,
+        recompute: bool = False,
+    ):
+        self.service = service
+        self.on_update = on_update
+        self.interval = interval
+        self.recompute = recompute
+        self._task: Optional[asyncio.Task] = None
+
+    async def update(self) -> SurgeMap:
+        surge_map = await (self.service.recompute() if self.recompute else self.service.load())
+        self.on_update(surge_map)
+        return surge_map
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.update()
+            except RedisError:
+                logger.warning("Failed to update the surge map", exc_info=True)
+            except Exception:
+                logger.exception("Failed to update the surge map")
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
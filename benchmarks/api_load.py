@@ -0,0 +1,296 @@
+"""
+Load-test harness for the ride API.
+
+Drives the FastAPI app in-process through httpx's ASGI transport, with a
+temporary SQLite file standing in for Postgres and fakeredis for Redis, so
+it runs offline and needs no services. Each scenario fires `--requests`
+calls from `--concurrency` concurrent clients and reports p50/p95/p99
+latency and throughput. Results can be saved as JSON and compared between
+commits.
+
+Usage:
+    uv run python -m benchmarks.api_load run --concurrency 32 --output before.json
+    uv run python -m benchmarks.api_load run --concurrency 32 --output after.json
+    uv run python -m benchmarks.api_load compare before.json after.json
+"""
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+import typer
+from fakeredis import FakeAsyncRedis
+from httpx import ASGITransport, AsyncClient, Response
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, get_db
+from app.db.redis import get_redis
+from app.main import app
+from app.models.models import DriverProfile, Ride, User, UserRole
+from app.services.location_buffer import LocationWriteBuffer, get_location_buffer
+from app.services.location_service import LocationService
+
+CENTER = (37.7749, -122.4194)
+SCENARIOS = ("ride_request", "ride_status", "driver_accept", "location_batch")
+# Regression threshold used by `compare` (fractional change in p95)
+DEFAULT_THRESHOLD = 0.10
+
+cli = typer.Typer(help=__doc__)
+
+class LoadContext:
+    """
+    Seeded data shared by the scenarios.
+    """
+    def __init__(self, rider_ids: List[int], driver_ids: List[int], ride_ids: List[int], seed: int):
+        self.rider_ids = rider_ids
+        self.driver_ids = driver_ids
+        self.ride_ids = ride_ids
+        self.rng = np.random.default_rng(seed)
+
+async def setup_world(riders: int, drivers: int, rides: int, seed: int):
+    path = os.path.join(tempfile.mkdtemp(), "load.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        rider_rows = [User(email=f"load_rider{i}@example.com", hashed_password="pw") for i in range(riders)]
+        driver_rows = [
+            User(email=f"load_driver{i}@example.com", hashed_password="pw", role=UserRole.DRIVER)
+            for i in range(drivers)
+        ]
+        db.add_all(rider_rows + driver_rows)
+        await db.commit()
+        db.add_all([
+            DriverProfile(user_id=driver.id, license_plate=f"L-{i}", car_model="Load", is_available=True)
+            for i, driver in enumerate(driver_rows)
+        ])
+        ride_rows = [
+            Ride(
+                rider_id=rider_rows[i % riders].id,
+                source_lat=CENTER[0], source_long=CENTER[1], dest_lat=CENTER[0] + 0.01, dest_long=CENTER[1] + 0.01,
+            )
+            for i in range(rides)
+        ]
+        db.add_all(ride_rows)
+        await db.commit()
+        context = LoadContext(
+            [rider.id for rider in rider_rows],
+            [driver.id for driver in driver_rows],
+            [ride.id for ride in ride_rows],
+            seed,
+        )
+    return engine, session_factory, context
+
+def ride_request(client: AsyncClient, context: LoadContext, index: int) -> Awaitable[Response]:
+    lat, long = np.asarray(CENTER) + context.rng.normal(0, 0.02, 2)
+    return client.post("/ride/request", json={
+        "rider_id": context.rider_ids[index % len(context.rider_ids)],
+        "source_lat": float(lat),
+        "source_long": float(long),
+        "dest_lat": CENTER[0],
+        "dest_long": CENTER[1],
+    })
+
+def ride_status(client: AsyncClient, context: LoadContext, index: int) -> Awaitable[Response]:
+    return client.get(f"/ride/{context.ride_ids[index % len(context.ride_ids)]}")
+
+def driver_accept(client: AsyncClient, context: LoadContext, index: int) -> Awaitable[Response]:
+    # Each call accepts a distinct seeded ride with a distinct driver, so
+    # every call is a successful match
+    return client.patch("/ride/driver/accept", json={
+        "ride_id": context.ride_ids[index],
+        "driver_id": context.driver_ids[index],
+        "accept": True,
+    })
+
+def location_batch(client: AsyncClient, context: LoadContext, index: int, batch_size: int) -> Awaitable[Response]:
+    driver_ids = context.rng.choice(context.driver_ids, size=batch_size)
+    points = np.asarray(CENTER) + context.rng.normal(0, 0.02, size=(batch_size, 2))
+    return client.patch("/location/update/batch", json={"updates": [
+        {"driver_id": int(driver_id), "lat": float(lat), "long": float(long)}
+        for driver_id, (lat, long) in zip(driver_ids, points)
+    ]})
+
+async def run_scenario(
+    call: Callable[[int], Awaitable[Response]], requests: int, concurrency: int, expected_status: int
+) -> dict:
+    """
+    Issues `requests` calls from `concurrency` clients; returns the latency
+    summary.
+    """
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def client_loop():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            response = await call(index)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != expected_status:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latency_ms = np.array(latencies) * 1000
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed,
+        "mean_ms": float(latency_ms.mean()),
+        "p50_ms": float(np.percentile(latency_ms, 50)),
+        "p95_ms": float(np.percentile(latency_ms, 95)),
+        "p99_ms": float(np.percentile(latency_ms, 99)),
+        "max_ms": float(latency_ms.max()),
+    }
+
+async def run_suite(
+    scenarios: List[str], requests: int, concurrency: int, batch_size: int, seed: int
+) -> Dict[str, dict]:
+    engine, session_factory, context = await setup_world(
+        riders=100, drivers=max(requests, 100), rides=max(requests, 100), seed=seed
+    )
+    redis_client = FakeAsyncRedis()
+    location_buffer = LocationWriteBuffer(LocationService(redis_client))
+
+    async def _get_db():
+        async with session_factory() as session:
+            yield session
+    async def _get_redis():
+        yield redis_client
+    app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[get_redis] = _get_redis
+    app.dependency_overrides[get_location_buffer] = lambda: location_buffer
+
+    calls = {
+        "ride_request": (ride_request, 201),
+        "ride_status": (ride_status, 200),
+        "driver_accept": (driver_accept, 200),
+        "location_batch": (lambda client, ctx, i: location_batch(client, ctx, i, batch_size), 200),
+    }
+    results = {}
+    try:
+        async with location_buffer, AsyncClient(transport=ASGITransport(app=app), base_url="http://load") as client:
+            for name in scenarios:
+                call, expected_status = calls[name]
+                results[name] = await run_scenario(
+                    lambda index: call(client, context, index), requests, concurrency, expected_status
+                )
+    finally:
+        app.dependency_overrides.clear()
+        await redis_client.aclose()
+        await engine.dispose()
+    return results
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results: Dict[str, dict]):
+    typer.echo(f"{'scenario':<16}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, r in results.items():
+        typer.echo(
+            f"{name:<16}{r['throughput_rps']:>9.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+            f"{r['p99_ms']:>9.2f}{r['errors']:>8}"
+        )
+
+def compare_results(baseline: dict, candidate: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """
+    Returns one row per scenario present in both runs, with the relative
+    change of each metric and whether p95 latency regressed past
+    `threshold`.
+    """
+    rows = []
+    for name, before in baseline["scenarios"].items():
+        after = candidate["scenarios"].get(name)
+        if after is None:
+            continue
+        change = {
+            metric: (after[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+        }
+        rows.append({"scenario": name, **change, "regressed": change["p95_ms"] > threshold})
+    return rows
+
+@cli.command()
+def run(
+    scenario: List[str] = typer.Option(list(SCENARIOS), help="Scenarios to run"),
+    requests: int = typer.Option(500, help="Requests per scenario"),
+    concurrency: int = typer.Option(16, help="Concurrent clients"),
+    batch_size: int = typer.Option(100, help="Pings per location batch"),
+    seed: int = typer.Option(7, help="Random seed"),
+    output: Optional[str] = typer.Option(None, help="Write results as JSON to this path"),
+):
+    """
+    Runs the benchmark scenarios against the in-process app.
+    """
+    unknown = set(scenario) - set(SCENARIOS)
+    if unknown:
+        raise typer.BadParameter(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    logging.disable(logging.WARNING)
+
+    results = asyncio.run(run_suite(scenario, requests, concurrency, batch_size, seed))
+    print_results(results)
+    if output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "requests": requests,
+                "concurrency": concurrency,
+                "batch_size": batch_size,
+            },
+            "scenarios": results,
+        }
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        typer.echo(f"Results written to {output}")
+
+@cli.command()
+def compare(
+    baseline: str = typer.Argument(..., help="JSON results of the reference run"),
+    candidate: str = typer.Argument(..., help="JSON results to compare"),
+    threshold: float = typer.Option(DEFAULT_THRESHOLD, help="Allowed fractional p95 increase"),
+):
+    """
+    Compares two saved runs. Exits with status 1 if any scenario's p95
+    latency regressed by more than `threshold`.
+    """
+    with open(baseline) as f:
+        before = json.load(f)
+    with open(candidate) as f:
+        after = json.load(f)
+
+    typer.echo(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    typer.echo(f"{'scenario':<16}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    rows = compare_results(before, after, threshold)
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        typer.echo(
+            f"{row['scenario']:<16}{row['throughput_rps']:>+9.1%}{row['p50_ms']:>+9.1%}"
+            f"{row['p95_ms']:>+9.1%}{row['p99_ms']:>+9.1%}{flag}"
+        )
+    if any(row["regressed"] for row in rows):
+        raise typer.Exit(code=1)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,169 @@
+"""
+Batch (global) assignment vs the sequential greedy matching loop.
+
+Two comparisons are run on the same synthetic surge (rides and drivers
+scattered around a few hotspots):
+- algorithm: greedy nearest-free-driver vs the Hungarian solver, in memory.
+- end-to-end: MatchingService.match_ride per ride vs one
+  BatchMatchingService.match_batch, against SQLite and fakeredis.
+
+Usage:
+    uv run python -m benchmarks.batch_matching --rides 200 --drivers 300
+"""
+import asyncio
+import time
+import numpy as np
+import typer
+from fakeredis import FakeAsyncRedis
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.models.models import DriverProfile, Ride, User, UserRole
+from app.services.batch_matching import DEFAULT_CANDIDATES_PER_RIDE, BatchMatchingService, solve_assignment
+from app.services.geo_sharding import haversine_matrix
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+
+CENTER = (37.7749, -122.4194)
+MAX_PICKUP_KM = 5.0
+
+def generate_surge(rides: int, drivers: int, seed: int):
+    """
+    Returns (ride_points, driver_points) as (n, 2) arrays of (lat, long).
+    Demand clusters tightly around hotspots; supply is spread wider.
+    """
+    rng = np.random.default_rng(seed)
+    hotspots = np.asarray(CENTER) + rng.normal(0, 0.02, size=(4, 2))
+    ride_points = hotspots[rng.integers(0, len(hotspots), rides)] + rng.normal(0, 0.004, size=(rides, 2))
+    driver_points = np.asarray(CENTER) + rng.normal(0, 0.025, size=(drivers, 2))
+    return ride_points, driver_points
+
+def greedy_assignment(distances: np.ndarray):
+    """
+    What the sequential loop does: each ride, in arrival order, takes the
+    nearest driver nobody has taken yet.
+    """
+    taken = np.zeros(distances.shape[1], dtype=bool)
+    pairs = []
+    for row in range(distances.shape[0]):
+        candidates = np.where(taken | (distances[row] > MAX_PICKUP_KM), np.inf, distances[row])
+        column = int(np.argmin(candidates))
+        if np.isfinite(candidates[column]):
+            taken[column] = True
+            pairs.append((row, column))
+    return pairs
+
+def optimal_assignment(distances: np.ndarray):
+    forbidden = distances > MAX_PICKUP_KM
+    cost = np.where(forbidden, MAX_PICKUP_KM * len(distances) * 10 + 1, distances)
+    return [(row, column) for row, column in solve_assignment(cost) if not forbidden[row, column]]
+
+def summarize(name, distances, pairs, seconds, rides):
+    pickup = np.array([distances[row, column] for row, column in pairs]) if pairs else np.zeros(1)
+    return {
+        "mode": name,
+        "matched": len(pairs),
+        "match_rate": len(pairs) / rides,
+        "avg_pickup_km": float(pickup.mean()),
+        "p95_pickup_km": float(np.percentile(pickup, 95)),
+        "seconds": seconds,
+        "rides_per_sec": rides / seconds if seconds else float("inf"),
+    }
+
+def run_algorithm(ride_points, driver_points):
+    distances = haversine_matrix(ride_points, driver_points)
+    results = []
+    for name, solver in (("greedy", greedy_assignment), ("hungarian", optimal_assignment)):
+        started = time.perf_counter()
+        pairs = solver(distances)
+        results.append(summarize(name, distances, pairs, time.perf_counter() - started, len(ride_points)))
+    return results
+
+async def setup_world(ride_points, driver_points):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    redis_client = FakeAsyncRedis()
+
+    async with session_factory() as db:
+        rider = User(email="bench_rider@example.com", hashed_password="pw")
+        db.add(rider)
+        await db.commit()
+        for index in range(len(driver_points)):
+            driver_id = 1000 + index
+            db.add(User(id=driver_id, email=f"bench_driver{index}@example.com", hashed_password="pw", role=UserRole.DRIVER))
+            db.add(DriverProfile(user_id=driver_id, license_plate=f"B-{index}", car_model="Bench", is_available=True))
+        rides = [
+            Ride(rider_id=rider.id, source_lat=float(lat), source_long=float(long), dest_lat=CENTER[0], dest_long=CENTER[1])
+            for lat, long in ride_points
+        ]
+        db.add_all(rides)
+        await db.commit()
+        ride_ids = [ride.id for ride in rides]
+
+    await LocationService(redis_client).update_locations_bulk(
+        (1000 + index, float(lat), float(long)) for index, (lat, long) in enumerate(driver_points)
+    )
+    return engine, session_factory, redis_client, ride_ids
+
+async def run_end_to_end(name, ride_points, driver_points, candidates: int):
+    engine, session_factory, redis_client, ride_ids = await setup_world(ride_points, driver_points)
+    try:
+        async with session_factory() as db:
+            location_service = LocationService(redis_client)
+            started = time.perf_counter()
+            if name == "sequential":
+                service = MatchingService(db, location_service, redis_client)
+                matches = {}
+                for ride_id in ride_ids:
+                    driver_id = await service.match_ride(ride_id)
+                    if driver_id is not None:
+                        matches[ride_id] = driver_id
+            else:
+                service = BatchMatchingService(
+                    db, location_service, redis_client,
+                    max_pickup_km=MAX_PICKUP_KM, candidates_per_ride=candidates,
+                )
+                matches = await service.match_batch(ride_ids)
+            seconds = time.perf_counter() - started
+
+        distances = haversine_matrix(ride_points, driver_points)
+        row_of = {ride_id: row for row, ride_id in enumerate(ride_ids)}
+        pairs = [(row_of[ride_id], driver_id - 1000) for ride_id, driver_id in matches.items()]
+        return summarize(name, distances, pairs, seconds, len(ride_ids))
+    finally:
+        await redis_client.aclose()
+        await engine.dispose()
+
+def print_table(title, results):
+    typer.echo(f"\n{title}")
+    typer.echo(f"{'mode':<12}{'matched':>9}{'avg km':>9}{'p95 km':>9}{'seconds':>10}{'rides/s':>10}")
+    for r in results:
+        typer.echo(
+            f"{r['mode']:<12}{r['matched']:>9}{r['avg_pickup_km']:>9.3f}{r['p95_pickup_km']:>9.3f}"
+            f"{r['seconds']:>10.3f}{r['rides_per_sec']:>10.0f}"
+        )
+
+async def run(rides: int, drivers: int, seed: int, candidates: int, end_to_end: bool):
+    ride_points, driver_points = generate_surge(rides, drivers, seed)
+    print_table("Algorithm only", run_algorithm(ride_points, driver_points))
+    if end_to_end:
+        results = [
+            await run_end_to_end(name, ride_points, driver_points, candidates)
+            for name in ("sequential", "batch")
+        ]
+        print_table("End to end (SQLite + fakeredis)", results)
+
+def main(
+    rides: int = typer.Option(200, help="Ride requests in the surge window"),
+    drivers: int = typer.Option(300, help="Available drivers"),
+    seed: int = typer.Option(7, help="Random seed"),
+    candidates: int = typer.Option(DEFAULT_CANDIDATES_PER_RIDE, help="Nearest drivers per ride in the batch matrix"),
+    end_to_end: bool = typer.Option(True, help="Also run the SQLite + fakeredis comparison"),
+):
+    asyncio.run(run(rides, drivers, seed, candidates, end_to_end))
+
+if __name__ == "__main__":
+    typer.run(main)
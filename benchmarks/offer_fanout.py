@@ -0,0 +1,214 @@
+"""
+Time-to-match with parallel offers vs the one-by-one offer loop.
+
+Drivers are simulated: each offered driver responds after a log-normal
+delay, and either accepts, declines, or ignores the offer until it times
+out. Offers reach drivers through the NotificationDispatcher and a stub
+push backend with simulated latency and failures, and drivers start
+deciding once an offer is delivered. Responses go through
+`PATCH /ride/driver/accept` on the ASGI app,
+backed by a temporary SQLite file and fakeredis. All durations are scaled
+by `--time-scale` so a run takes seconds; results are reported in
+unscaled (real-world) seconds. Very small scales let the in-process
+SQLite/Redis overhead dominate the measurement.
+
+Usage:
+    uv run python -m benchmarks.offer_fanout --rides 30 --fanout 1 --fanout 3 --fanout 5
+    uv run python -m benchmarks.offer_fanout --fanout 3 --push-latency 1.5 --push-failure-rate 0.1
+"""
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+import numpy as np
+import typer
+from fakeredis import FakeAsyncRedis
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, get_db
+from app.db.redis import get_redis
+from app.main import app
+from app.models.models import DriverProfile, Ride, User, UserRole
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+from app.services.notification_service import (
+    DEFAULT_DRIVER_BURST, DEFAULT_DRIVER_RATE, DEFAULT_RETRY_DELAY, DriverRateLimiter, NotificationDispatcher,
+    StubPushBackend,
+)
+
+CENTER = (37.7749, -122.4194)
+
+class DriverBehaviour:
+    """
+    How simulated drivers respond to an offer.
+    """
+    def __init__(self, accept: float, ignore: float, median_response: float, seed: int):
+        self.accept = accept
+        self.ignore = ignore
+        self.median_response = median_response
+        self.rng = np.random.default_rng(seed)
+
+    def decide(self):
+        """
+        Returns (response delay in seconds, "accept" | "decline" | "ignore").
+        """
+        delay = float(self.rng.lognormal(np.log(self.median_response), 0.6))
+        roll = self.rng.random()
+        if roll < self.ignore:
+            return delay, "ignore"
+        if roll < self.ignore + self.accept:
+            return delay, "accept"
+        return delay, "decline"
+
+async def setup_world(rides: int, drivers: int, seed: int):
+    path = os.path.join(tempfile.mkdtemp(), "offers.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    redis_client = FakeAsyncRedis()
+
+    rng = np.random.default_rng(seed)
+    ride_points = np.asarray(CENTER) + rng.normal(0, 0.01, size=(rides, 2))
+    driver_points = np.asarray(CENTER) + rng.normal(0, 0.015, size=(drivers, 2))
+
+    async with session_factory() as db:
+        rider = User(email="bench_rider@example.com", hashed_password="pw")
+        db.add(rider)
+        await db.commit()
+        for index in range(drivers):
+            driver_id = 1000 + index
+            db.add(User(id=driver_id, email=f"bench_driver{index}@example.com", hashed_password="pw", role=UserRole.DRIVER))
+            db.add(DriverProfile(user_id=driver_id, license_plate=f"B-{index}", car_model="Bench", is_available=True))
+        ride_rows = [
+            Ride(rider_id=rider.id, source_lat=float(lat), source_long=float(long), dest_lat=CENTER[0], dest_long=CENTER[1])
+            for lat, long in ride_points
+        ]
+        db.add_all(ride_rows)
+        await db.commit()
+        ride_ids = [ride.id for ride in ride_rows]
+
+    await LocationService(redis_client).update_locations_bulk(
+        (1000 + index, float(lat), float(long)) for index, (lat, long) in enumerate(driver_points)
+    )
+    return engine, session_factory, redis_client, ride_ids
+
+async def run_fanout(fanout: int, rides: int, drivers: int, concurrency: int, offer_timeout: float,
+                     time_scale: float, behaviour: DriverBehaviour, seed: int,
+                     push_latency: float = 0.5, push_failure_rate: float = 0.0) -> dict:
+    engine, session_factory, redis_client, ride_ids = await setup_world(rides, drivers, seed)
+
+    async def _get_db():
+        async with session_factory() as session:
+            yield session
+    async def _get_redis():
+        yield redis_client
+    app.dependency_overrides[get_db] = _get_db
+    app.dependency_overrides[get_redis] = _get_redis
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://bench")
+    responders = set()
+    notified: List[int] = []
+
+    async def respond(ride_id: int, driver_id: int):
+        delay, decision = behaviour.decide()
+        if decision == "ignore":
+            return
+        await asyncio.sleep(delay * time_scale)
+        await client.patch(
+            "/ride/driver/accept",
+            json={"ride_id": ride_id, "driver_id": driver_id, "accept": decision == "accept"},
+        )
+
+    delivery_times: List[float] = []
+
+    def on_delivered(notification):
+        delivery_times.append((time.perf_counter() - notification.queued_at) / time_scale)
+        task = asyncio.create_task(respond(notification.ride_id, notification.driver_id))
+        responders.add(task)
+        task.add_done_callback(responders.discard)
+
+    # Push latency and the per-driver rate limit run on the scaled clock
+    dispatcher = NotificationDispatcher(
+        StubPushBackend(push_latency * time_scale, failure_rate=push_failure_rate, seed=seed, on_delivered=on_delivered),
+        flush_interval=0.01 * time_scale,
+        retry_delay=DEFAULT_RETRY_DELAY * time_scale,
+        rate_limiter=DriverRateLimiter(DEFAULT_DRIVER_RATE / time_scale, DEFAULT_DRIVER_BURST),
+    )
+
+    async def notify(ride_id: int, driver_ids: List[int]):
+        notified.append(len(driver_ids))
+        await dispatcher.notify_offer(ride_id, driver_ids)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def time_to_match(ride_id: int):
+        async with semaphore:
+            async with session_factory() as db:
+                service = MatchingService(
+                    db, LocationService(redis_client), redis_client,
+                    offer_fanout=fanout, offer_timeout=offer_timeout * time_scale, offer_notifier=notify,
+                )
+                started = time.perf_counter()
+                driver_id = await service.offer_ride(ride_id)
+                return driver_id, (time.perf_counter() - started) / time_scale
+
+    try:
+        async with dispatcher:
+            results = await asyncio.gather(*(time_to_match(ride_id) for ride_id in ride_ids))
+            await asyncio.gather(*responders, return_exceptions=True)
+    finally:
+        await client.aclose()
+        app.dependency_overrides.clear()
+        await redis_client.aclose()
+        await engine.dispose()
+
+    matched = np.array([seconds for driver_id, seconds in results if driver_id is not None])
+    if not len(matched):
+        matched = np.array([float("nan")])
+    return {
+        "fanout": fanout,
+        "matched": sum(1 for driver_id, _ in results if driver_id is not None),
+        "rides": rides,
+        "p50_s": float(np.percentile(matched, 50)),
+        "p95_s": float(np.percentile(matched, 95)),
+        "p99_s": float(np.percentile(matched, 99)),
+        "offers_per_ride": sum(notified) / rides,
+        "push_p95_s": float(np.percentile(delivery_times, 95)) if delivery_times else float("nan"),
+        "undelivered": dispatcher.stats["failed"] + dispatcher.stats["rate_limited"] + dispatcher.stats["dropped"],
+    }
+
+def main(
+    rides: int = typer.Option(30, help="Rides to match"),
+    drivers: int = typer.Option(400, help="Available drivers"),
+    fanout: List[int] = typer.Option([1, 3, 5], help="Fan-out widths to compare; 1 is the sequential loop"),
+    concurrency: int = typer.Option(5, help="Rides being offered at the same time"),
+    offer_timeout: float = typer.Option(15.0, help="Seconds a driver has to respond"),
+    accept: float = typer.Option(0.4, help="Probability a driver accepts"),
+    ignore: float = typer.Option(0.3, help="Probability a driver never responds"),
+    median_response: float = typer.Option(4.0, help="Median response time in seconds"),
+    push_latency: float = typer.Option(0.5, help="Median push provider latency in seconds"),
+    push_failure_rate: float = typer.Option(0.0, help="Probability a push delivery attempt fails"),
+    time_scale: float = typer.Option(0.05, help="Wall-clock seconds per simulated second"),
+    seed: int = typer.Option(7, help="Random seed"),
+):
+    typer.echo(
+        f"{'fanout':>7}{'matched':>9}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'offers/ride':>13}"
+        f"{'push p95 s':>12}{'undelivered':>13}"
+    )
+    for width in fanout:
+        behaviour = DriverBehaviour(accept, ignore, median_response, seed)
+        r = asyncio.run(run_fanout(
+            width, rides, drivers, concurrency, offer_timeout, time_scale, behaviour, seed,
+            push_latency, push_failure_rate,
+        ))
+        typer.echo(
+            f"{r['fanout']:>7}{r['matched']:>9}{r['p50_s']:>9.1f}{r['p95_s']:>9.1f}{r['p99_s']:>9.1f}"
+            f"{r['offers_per_ride']:>13.1f}{r['push_p95_s']:>12.2f}{r['undelivered']:>13}"
+        )
+
+if __name__ == "__main__":
+    typer.run(main)
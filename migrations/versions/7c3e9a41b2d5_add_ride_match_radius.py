@@ -0,0 +1,28 @@
+"""Add ride match radius
+
+Revision ID: 7c3e9a41b2d5
+Revises: 1f1f1122d7fb
+Create Date: 2026-10-18 11:02:41.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e9a41b2d5'
+down_revision: Union[str, Sequence[str], None] = '1f1f1122d7fb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('rides', sa.Column('match_radius_km', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('rides', 'match_radius_km')
@@ -0,0 +1,50 @@
+"""Add hot query indexes
+
+Revision ID: b4d2e8f61a93
+Revises: 7c3e9a41b2d5
+Create Date: 2026-10-18 11:40:12.604518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d2e8f61a93'
+down_revision: Union[str, Sequence[str], None] = '7c3e9a41b2d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY keeps rides writable while the indexes build, but cannot
+    # run inside the migration's transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_rides_requested_created_at', 'rides', ['created_at'],
+            postgresql_where=sa.text("status = 'REQUESTED'"), postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_rides_rider_id_created_at', 'rides', ['rider_id', 'created_at', 'id'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_rides_driver_id_created_at', 'rides', ['driver_id', 'created_at', 'id'],
+            postgresql_where=sa.text("driver_id IS NOT NULL"), postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_driver_profiles_available', 'driver_profiles', ['user_id'],
+            postgresql_where=sa.text("is_available"), postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_driver_profiles_available', table_name='driver_profiles', postgresql_concurrently=True)
+        op.drop_index('ix_rides_driver_id_created_at', table_name='rides', postgresql_concurrently=True)
+        op.drop_index('ix_rides_rider_id_created_at', table_name='rides', postgresql_concurrently=True)
+        op.drop_index('ix_rides_requested_created_at', table_name='rides', postgresql_concurrently=True)
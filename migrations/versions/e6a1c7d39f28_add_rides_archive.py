@@ -0,0 +1,58 @@
+"""Add rides archive
+
+Revision ID: e6a1c7d39f28
+Revises: b4d2e8f61a93
+Create Date: 2026-10-18 12:05:47.219034
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a1c7d39f28'
+down_revision: Union[str, Sequence[str], None] = 'b4d2e8f61a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Monthly partitions are created by the archiver as it needs them
+    op.create_table('rides_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rider_id', sa.Integer(), nullable=False),
+    sa.Column('driver_id', sa.Integer(), nullable=True),
+    sa.Column('source_lat', sa.Float(), nullable=False),
+    sa.Column('source_long', sa.Float(), nullable=False),
+    sa.Column('dest_lat', sa.Float(), nullable=False),
+    sa.Column('dest_long', sa.Float(), nullable=False),
+    sa.Column('status', postgresql.ENUM('REQUESTED', 'MATCHED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED', name='ridestatus', create_type=False), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('estimated_fare', sa.Float(), nullable=True),
+    sa.Column('estimated_time', sa.Integer(), nullable=True),
+    sa.Column('match_radius_km', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index('ix_rides_archive_rider_id_created_at', 'rides_archive', ['rider_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_rides_archive_driver_id_created_at', 'rides_archive', ['driver_id', 'created_at', 'id'], unique=False, postgresql_where=sa.text('driver_id IS NOT NULL'))
+    # rides is live: build its index without blocking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_rides_finished_updated_at', 'rides', ['updated_at'],
+            postgresql_where=sa.text("status IN ('COMPLETED', 'CANCELLED')"), postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_rides_finished_updated_at', table_name='rides', postgresql_concurrently=True)
+    op.drop_index('ix_rides_archive_driver_id_created_at', table_name='rides_archive')
+    op.drop_index('ix_rides_archive_rider_id_created_at', table_name='rides_archive')
+    op.drop_table('rides_archive')
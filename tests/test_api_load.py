@@ -0,0 +1,25 @@
+import pytest
+from benchmarks.api_load import SCENARIOS, compare_results, run_suite
+
+@pytest.mark.asyncio
+async def test_run_suite_smoke():
+    results = await run_suite(list(SCENARIOS), requests=5, concurrency=2, batch_size=10, seed=1)
+
+    assert set(results) == set(SCENARIOS)
+    for summary in results.values():
+        assert summary["requests"] == 5
+        assert summary["errors"] == 0
+        assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"] <= summary["max_ms"]
+
+def test_compare_results_flags_p95_regressions():
+    def run(p95):
+        return {"scenarios": {"ride_status": {
+            "throughput_rps": 100.0, "p50_ms": 1.0, "p95_ms": p95, "p99_ms": 5.0,
+        }}}
+
+    [row] = compare_results(run(2.0), run(2.1), threshold=0.10)
+    assert row["p95_ms"] == pytest.approx(0.05)
+    assert not row["regressed"]
+
+    [row] = compare_results(run(2.0), run(3.0), threshold=0.10)
+    assert row["regressed"]
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import AsyncMock
+from fakeredis import FakeAsyncRedis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import User, DriverProfile, UserRole
+from app.services.availability_service import AvailabilityService
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+async def create_driver(db_session, driver_id, is_available):
+    db_session.add(User(id=driver_id, email=f"driver{driver_id}@availability.com", hashed_password="pw", role=UserRole.DRIVER))
+    db_session.add(DriverProfile(user_id=driver_id, license_plate=f"AV-{driver_id}", car_model="Tesla", is_available=is_available))
+    await db_session.commit()
+
+@pytest.mark.asyncio
+async def test_set_availability_writes_through(db_session: AsyncSession, redis_client):
+    await create_driver(db_session, 10, False)
+    service = AvailabilityService(redis_client)
+
+    assert await service.set_availability(db_session, 10, True) is True
+    assert await redis_client.sismember("available_drivers", "10")
+
+    assert await service.set_availability(db_session, 10, False) is True
+    assert not await redis_client.sismember("available_drivers", "10")
+
+@pytest.mark.asyncio
+async def test_set_availability_unknown_driver(db_session: AsyncSession, redis_client):
+    service = AvailabilityService(redis_client)
+    assert await service.set_availability(db_session, 404, True) is False
+    assert await redis_client.scard("available_drivers") == 0
+
+@pytest.mark.asyncio
+async def test_filter_available_preserves_order(redis_client):
+    service = AvailabilityService(redis_client)
+    await redis_client.sadd("available_drivers", "3", "1")
+
+    assert await service.filter_available([1, 2, 3]) == [1, 3]
+    assert await service.filter_available([3, 1]) == [3, 1]
+    assert await service.filter_available([]) == []
+
+@pytest.mark.asyncio
+async def test_mirror_swallows_redis_errors():
+    redis_client = AsyncMock()
+    redis_client.srem = AsyncMock(side_effect=RedisConnectionError("down"))
+    service = AvailabilityService(redis_client)
+
+    # Postgres already committed; a failed mirror write must not raise
+    await service.mirror(10, False)
+
+@pytest.mark.asyncio
+async def test_reconcile_rebuilds_from_database(db_session: AsyncSession, redis_client):
+    await create_driver(db_session, 10, True)
+    await create_driver(db_session, 11, False)
+    await create_driver(db_session, 12, True)
+    # Drift: 11 is wrongly marked available, 12 is missing
+    await redis_client.sadd("available_drivers", "10", "11")
+    service = AvailabilityService(redis_client)
+
+    assert await service.reconcile(db_session) == 2
+    assert await redis_client.smembers("available_drivers") == {b"10", b"12"}
+    assert not await redis_client.exists("available_drivers:rebuild")
+
+@pytest.mark.asyncio
+async def test_reconcile_with_no_available_drivers(db_session: AsyncSession, redis_client):
+    await create_driver(db_session, 10, False)
+    await redis_client.sadd("available_drivers", "10")
+
+    assert await AvailabilityService(redis_client).reconcile(db_session) == 0
+    assert await redis_client.scard("available_drivers") == 0
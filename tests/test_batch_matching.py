@@ -0,0 +1,201 @@
+import pytest
+import itertools
+import numpy as np
+from fakeredis import FakeAsyncRedis
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
+from app.services.batch_matching import (
+    BatchMatchingService, BatchMatchingWorker, solve_assignment
+)
+from app.services.location_service import LocationService
+from app.services.ride_queue import RideRequestQueue
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+def brute_force_cost(cost):
+    n, m = cost.shape
+    if n <= m:
+        return min(sum(cost[i, cols[i]] for i in range(n)) for cols in itertools.permutations(range(m), n))
+    return brute_force_cost(cost.T)
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 3), (3, 5), (5, 3), (6, 6)])
+def test_solve_assignment_is_optimal(shape):
+    rng = np.random.default_rng(42)
+    for _ in range(20):
+        cost = rng.uniform(0, 10, size=shape)
+        pairs = solve_assignment(cost)
+
+        assert len(pairs) == min(shape)
+        assert len({row for row, _ in pairs}) == len(pairs)
+        assert len({column for _, column in pairs}) == len(pairs)
+        assert sum(cost[row, column] for row, column in pairs) == pytest.approx(brute_force_cost(cost))
+
+def test_solve_assignment_empty():
+    assert solve_assignment(np.zeros((0, 3))) == []
+
+async def create_drivers(db_session, redis_client, drivers, prefix):
+    for driver_id, (lat, long) in drivers.items():
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}_{prefix}@batch.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"{prefix}-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+    await LocationService(redis_client).update_locations_bulk(
+        [(driver_id, lat, long) for driver_id, (lat, long) in drivers.items()]
+    )
+
+async def create_rides(db_session, pickups, prefix):
+    rider = User(email=f"rider_{prefix}@batch.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    rides = [
+        Ride(rider_id=rider.id, source_lat=lat, source_long=long, dest_lat=37.80, dest_long=-122.41)
+        for lat, long in pickups
+    ]
+    db_session.add_all(rides)
+    await db_session.commit()
+    return rides
+
+@pytest.mark.asyncio
+async def test_match_batch_minimises_total_pickup_distance(db_session: AsyncSession, redis_client):
+    # Driver 10 sits between both rides but slightly closer to ride A.
+    # Greedy (A first) gives A->10, B->11 (far). Optimal is A->11, B->10.
+    await create_drivers(db_session, redis_client, {
+        10: (37.7750, -122.4194),
+        11: (37.7650, -122.4194),
+    }, "opt")
+    ride_a, ride_b = await create_rides(db_session, [(37.7740, -122.4194), (37.7800, -122.4194)], "opt")
+
+    service = BatchMatchingService(db_session, LocationService(redis_client), redis_client)
+    matches = await service.match_batch([ride_a.id, ride_b.id])
+
+    assert matches == {ride_a.id: 11, ride_b.id: 10}
+    for ride in (ride_a, ride_b):
+        await db_session.refresh(ride)
+        assert ride.status == RideStatus.MATCHED
+    result = await db_session.execute(DriverProfile.__table__.select())
+    assert all(not row.is_available for row in result)
+    # Locks are released after the commit
+    assert await redis_client.keys("lock:driver:*") == []
+
+@pytest.mark.asyncio
+async def test_match_batch_more_rides_than_drivers(db_session: AsyncSession, redis_client):
+    await create_drivers(db_session, redis_client, {10: (37.7750, -122.4194)}, "scarce")
+    rides = await create_rides(db_session, [(37.7749, -122.4194), (37.7849, -122.4194)], "scarce")
+
+    service = BatchMatchingService(db_session, LocationService(redis_client), redis_client)
+    matches = await service.match_batch([ride.id for ride in rides])
+
+    assert matches == {rides[0].id: 10}
+    await db_session.refresh(rides[1])
+    assert rides[1].status == RideStatus.REQUESTED
+
+@pytest.mark.asyncio
+async def test_match_batch_skips_locked_drivers(db_session: AsyncSession, redis_client):
+    await create_drivers(db_session, redis_client, {10: (37.7750, -122.4194)}, "locked")
+    rides = await create_rides(db_session, [(37.7749, -122.4194)], "locked")
+    await redis_client.set("lock:driver:10", "locked")
+
+    service = BatchMatchingService(db_session, LocationService(redis_client), redis_client)
+
+    assert await service.match_batch([rides[0].id]) == {}
+    # Someone else's lock is left alone
+    assert await redis_client.exists("lock:driver:10")
+
+@pytest.mark.asyncio
+async def test_match_batch_skips_rides_accepted_meanwhile(db_session: AsyncSession, redis_client):
+    await create_drivers(db_session, redis_client, {10: (37.7750, -122.4194), 11: (37.7850, -122.4194)}, "cas")
+    rides = await create_rides(db_session, [(37.7749, -122.4194), (37.7849, -122.4194)], "cas")
+    ride_ids = [ride.id for ride in rides]
+    service = BatchMatchingService(db_session, LocationService(redis_client), redis_client)
+
+    # Ride 0 is accepted by driver 11 after the batch read it
+    await db_session.execute(
+        update(Ride).where(Ride.id == ride_ids[0]).values(status=RideStatus.MATCHED, driver_id=11)
+    )
+    await db_session.execute(update(DriverProfile).where(DriverProfile.user_id == 11).values(is_available=False))
+    await db_session.commit()
+    matches = await service._commit(rides, [10, 11], [(0, 0), (1, 1)])
+
+    # Driver 11 was busy; driver 10 stays free since its ride was taken
+    assert matches == {}
+    ride = await db_session.get(Ride, ride_ids[0], populate_existing=True)
+    assert (ride.status, ride.driver_id) == (RideStatus.MATCHED, 11)
+    result = await db_session.execute(select(DriverProfile.is_available).where(DriverProfile.user_id == 10))
+    assert result.scalar() is True
+
+@pytest.mark.asyncio
+async def test_batch_worker_matches_and_requeues(engine, db_session: AsyncSession, redis_client):
+    await create_drivers(db_session, redis_client, {10: (37.7750, -122.4194)}, "worker")
+    rides = await create_rides(db_session, [(37.7749, -122.4194), (37.7849, -122.4194)], "worker")
+    queue = RideRequestQueue(redis_client)
+    for ride in rides:
+        await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+
+    worker = BatchMatchingWorker(
+        queue,
+        service_factory=lambda db: BatchMatchingService(db, LocationService(redis_client), redis_client),
+        session_factory=sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+        window=0.05,
+    )
+    stream = queue.stream_for(37.7749, -122.4194)
+    matches = await worker.run_once(stream)
+
+    assert matches == {rides[0].id: 10}
+    assert worker.requeued == 1
+    # Only the re-enqueued retry is left in the stream, nothing pending
+    entries = await redis_client.xrange(stream)
+    assert [(int(f[b"ride_id"]), int(f[b"attempt"])) for _, f in entries] == [(rides[1].id, 1)]
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_batch_worker_retries_a_failed_batch(engine, db_session: AsyncSession, redis_client):
+    await create_drivers(db_session, redis_client, {10: (37.7750, -122.4194)}, "failing")
+    [ride] = await create_rides(db_session, [(37.7749, -122.4194)], "failing")
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+
+    calls = []
+    def service_factory(db):
+        calls.append(db)
+        if len(calls) == 1:
+            raise RuntimeError("database went away")
+        return BatchMatchingService(db, LocationService(redis_client), redis_client)
+
+    worker = BatchMatchingWorker(
+        queue, service_factory=service_factory,
+        session_factory=sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+        window=0.05,
+    )
+    stream = queue.stream_for(37.7749, -122.4194)
+
+    assert await worker.run_once(stream) == {}
+    assert worker.requeued == 1
+    assert await worker.run_once(stream) == {ride.id: 10}
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_batch_worker_reclaims_entries_of_a_crashed_batch(engine, db_session: AsyncSession, redis_client):
+    await create_drivers(db_session, redis_client, {10: (37.7750, -122.4194)}, "crashed")
+    [ride] = await create_rides(db_session, [(37.7749, -122.4194)], "crashed")
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+    stream = queue.stream_for(37.7749, -122.4194)
+    # A previous batch matcher read the entry, then died before settling it
+    await queue.ensure_group(stream)
+    assert len(await queue.read("crashed-matcher", [stream], count=10)) == 1
+
+    worker = BatchMatchingWorker(
+        queue,
+        service_factory=lambda db: BatchMatchingService(db, LocationService(redis_client), redis_client),
+        session_factory=sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+        window=0.05,
+        reclaim_idle_ms=0,
+    )
+
+    assert await worker.run_once(stream) == {ride.id: 10}
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
@@ -3,19 +3,30 @@ from httpx import AsyncClient, ASGITransport
 from app.main import app
 from app.models.models import RideStatus, User, UserRole, Ride, DriverProfile
 from app.db.base import get_db
+from app.db.redis import get_redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from fakeredis import FakeAsyncRedis
 
 @pytest.fixture
-def override_db(db_session):
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def override_db(db_session, redis_client):
     async def _override_get_db():
         yield db_session
+    async def _override_get_redis():
+        yield redis_client
     app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_redis] = _override_get_redis
     yield
     app.dependency_overrides.clear()
 
 @pytest.mark.asyncio
-async def test_driver_accept_ride(db_session: AsyncSession, override_db):
+async def test_driver_accept_ride(db_session: AsyncSession, redis_client, override_db):
     # Setup: Create rider, driver, and a requested ride
     rider = User(email="rider_accept@test.com", hashed_password="pw")
     driver_user = User(email="driver_accept@test.com", hashed_password="pw", role=UserRole.DRIVER)
@@ -26,6 +37,7 @@ async def test_driver_accept_ride(db_session: AsyncSession, override_db):
     ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094, status=RideStatus.REQUESTED)
     db_session.add_all([profile, ride])
     await db_session.commit()
+    await redis_client.sadd("available_drivers", str(driver_user.id))
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
@@ -45,9 +57,11 @@ async def test_driver_accept_ride(db_session: AsyncSession, override_db):
     
     await db_session.refresh(profile)
     assert profile.is_available is False
+    # Availability mirror is written through
+    assert not await redis_client.sismember("available_drivers", str(driver_user.id))
 
 @pytest.mark.asyncio
-async def test_driver_deny_ride(db_session: AsyncSession, override_db):
+async def test_driver_deny_ride(db_session: AsyncSession, redis_client, override_db):
     # Setup: Create rider, driver, and a requested ride
     rider = User(email="rider_deny@test.com", hashed_password="pw")
     driver_user = User(email="driver_deny@test.com", hashed_password="pw", role=UserRole.DRIVER)
@@ -58,6 +72,8 @@ async def test_driver_deny_ride(db_session: AsyncSession, override_db):
     ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094, status=RideStatus.REQUESTED)
     db_session.add_all([profile, ride])
     await db_session.commit()
+    # The driver is holding an open offer for this ride
+    await redis_client.set(f"lock:driver:{driver_user.id}", str(ride.id))
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
@@ -76,6 +92,8 @@ async def test_driver_deny_ride(db_session: AsyncSession, override_db):
     
     await db_session.refresh(profile)
     assert profile.is_available is True
+    # Declining frees the driver for other rides right away
+    assert not await redis_client.exists(f"lock:driver:{driver_user.id}")
 
 @pytest.mark.asyncio
 async def test_driver_accept_already_matched(db_session: AsyncSession, override_db):
@@ -118,3 +136,29 @@ async def test_driver_accept_driver_not_available(db_session: AsyncSession, over
     
     assert response.status_code == 400
     assert response.json()["detail"] == "Driver is not available"
+
+@pytest.mark.asyncio
+async def test_update_driver_availability(db_session: AsyncSession, redis_client, override_db):
+    driver_user = User(email="driver_online@test.com", hashed_password="pw", role=UserRole.DRIVER)
+    db_session.add(driver_user)
+    await db_session.commit()
+    profile = DriverProfile(user_id=driver_user.id, license_plate="ON-123", car_model="Tesla", is_available=False)
+    db_session.add(profile)
+    await db_session.commit()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.patch("/driver/availability", json={"driver_id": driver_user.id, "available": True})
+
+    assert response.status_code == 200
+    await db_session.refresh(profile)
+    assert profile.is_available is True
+    assert await redis_client.sismember("available_drivers", str(driver_user.id))
+
+@pytest.mark.asyncio
+async def test_update_driver_availability_unknown_driver(db_session: AsyncSession, override_db):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.patch("/driver/availability", json={"driver_id": 999, "available": True})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Driver profile not found"
@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from app.services.geo_sharding import haversine_matrix
+from app.services.fare_estimator import (
+    MINIMUM_FARE, ROAD_FACTOR, CostGrid, FareEstimator, TTLCache
+)
+
+@pytest.fixture(scope="module")
+def grid():
+    return CostGrid(radius_km=5.0)
+
+def test_grid_distance_close_to_road_scaled_haversine(grid):
+    source, destination = (37.7749, -122.4194), (37.7949, -122.3994)
+    direct = float(haversine_matrix([source], [destination])[0, 0]) * ROAD_FACTOR
+
+    # Off by at most the distance between points and their cell centers
+    assert grid.distance_km(source, destination) == pytest.approx(direct, abs=1.5)
+
+def test_grid_falls_back_outside_the_grid_and_within_a_cell(grid):
+    source = (37.7749, -122.4194)
+    for destination in [(37.7751, -122.4192), (38.5, -121.5)]:
+        direct = float(haversine_matrix([source], [destination])[0, 0]) * ROAD_FACTOR
+        assert grid.distance_km(source, destination) == pytest.approx(direct)
+
+def test_rush_hour_is_slower_and_dearer(grid):
+    estimator = FareEstimator(grid)
+    source, destination = (37.7749, -122.4194), (37.8049, -122.4094)
+
+    night = estimator.estimate(source, destination, datetime(2024, 1, 1, 3))
+    rush = estimator.estimate(source, destination, datetime(2024, 1, 1, 8))
+
+    assert night.distance_km == rush.distance_km
+    assert rush.duration_s > night.duration_s
+    assert rush.fare > night.fare
+
+def test_short_trips_pay_the_minimum_fare(grid):
+    estimate = FareEstimator(grid).estimate((37.7749, -122.4194), (37.7751, -122.4194), datetime(2024, 1, 1, 3))
+    assert estimate.fare == MINIMUM_FARE
+
+def test_estimates_are_cached_by_quantized_endpoints(grid):
+    estimator = FareEstimator(grid)
+    at = datetime(2024, 1, 1, 12)
+
+    first = estimator.estimate((37.77490, -122.41940), (37.80490, -122.40940), at)
+    with patch.object(grid, "distance_km", side_effect=AssertionError("grid consulted")):
+        # A few metres away quantizes to the same key
+        second = estimator.estimate((37.77492, -122.41938), (37.80491, -122.40941), at)
+
+    assert second == first
+    assert estimator.cache.hits == 1
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=10.0)
+    with patch("app.services.fare_estimator.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+        # "b" was least recently used
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+
+    with patch("app.services.fare_estimator.time.monotonic", return_value=111.0):
+        assert cache.get("a") is None
+        assert len(cache) == 1
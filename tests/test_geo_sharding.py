@@ -0,0 +1,64 @@
+import pytest
+from collections import Counter
+from app.services.geo_sharding import (
+    ConsistentHashRing, covering_cells, geohash_cell_size, geohash_decode, geohash_encode, haversine_matrix
+)
+
+def test_geohash_encode_known_values():
+    # Reference values from the original geohash implementation
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(37.7749, -122.4194, 5) == "9q8yy"
+
+def test_geohash_decode_returns_cell_center():
+    lat, long = geohash_decode("9q8yy")
+    height, width = geohash_cell_size(5)
+    assert abs(lat - 37.7749) <= height / 2
+    assert abs(long + 122.4194) <= width / 2
+    assert geohash_encode(lat, long, 5) == "9q8yy"
+
+def test_geohash_cell_size():
+    height, width = geohash_cell_size(4)
+    assert height == 180.0 / 1024
+    assert width == 360.0 / 1024
+
+def test_covering_cells_inside_one_region():
+    # Centre of the 9q8y cell with a tiny radius
+    assert covering_cells(37.705, -122.52, 0.1, 4) == ["9q8y"]
+
+def test_covering_cells_straddling_boundary():
+    # -122.34375 is a precision-4 longitude boundary
+    cells = covering_cells(37.77, -122.34375, 1.0, 4)
+    assert geohash_encode(37.77, -122.35, 4) in cells
+    assert geohash_encode(37.77, -122.34, 4) in cells
+    assert len(cells) == 2
+
+def test_covering_cells_wraps_antimeridian():
+    cells = covering_cells(0.1, 179.99, 5.0, 4)
+    assert geohash_encode(0.1, 179.99, 4) in cells
+    assert geohash_encode(0.1, -179.99, 4) in cells
+
+def test_haversine_matrix():
+    distances = haversine_matrix([(37.7749, -122.4194)], [(37.7749, -122.4194), (34.0522, -118.2437)])
+    assert distances.shape == (1, 2)
+    assert distances[0, 0] == pytest.approx(0.0, abs=1e-9)
+    # San Francisco to Los Angeles
+    assert distances[0, 1] == pytest.approx(559.1, rel=0.01)
+
+def test_ring_distributes_keys_across_nodes():
+    ring = ConsistentHashRing(["a", "b", "c"])
+    counts = Counter(ring.get_node(f"driver_locations:{i}") for i in range(3000))
+    assert set(counts) == {"a", "b", "c"}
+    assert min(counts.values()) > 600
+
+def test_ring_only_moves_keys_of_removed_node():
+    keys = [f"driver_locations:{i}" for i in range(1000)]
+    full = ConsistentHashRing(["a", "b", "c"], names=["a", "b", "c"])
+    reduced = ConsistentHashRing(["a", "c"], names=["a", "c"])
+
+    for key in keys:
+        if full.get_node(key) != "b":
+            assert reduced.get_node(key) == full.get_node(key)
+
+def test_ring_requires_nodes():
+    with pytest.raises(ValueError):
+        ConsistentHashRing([])
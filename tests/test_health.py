@@ -1,4 +1,6 @@
 from fastapi.testclient import TestClient
+from app.core.config import Settings, get_settings
+from app.db.base import create_engine, pool_stats
 from app.main import app
 
 client = TestClient(app)
@@ -7,3 +9,30 @@ def test_health_check():
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+def test_pool_health_reports_engine_and_redis_pools():
+    # Running the lifespan creates the pools; nothing connects until used
+    with TestClient(app) as lifespan_client:
+        response = lifespan_client.get("/health/pools")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["database"]["size"] == get_settings().db_pool_size
+    assert data["database"]["checked_out"] == 0
+    assert data["redis"]["max_connections"] == get_settings().redis_max_connections
+
+def test_metrics_export_pool_utilization():
+    with TestClient(app) as lifespan_client:
+        text = lifespan_client.get("/metrics").text
+
+    assert f'db_pool_connections{{state="size"}} {get_settings().db_pool_size}' in text
+    assert 'db_pool_connections{state="checked_out"} 0' in text
+    assert f'redis_pool_connections{{state="max_connections"}} {get_settings().redis_max_connections}' in text
+
+def test_engine_uses_pool_settings():
+    settings = Settings(database_url="postgresql+asyncpg://user:pw@db/uber", db_pool_size=5, db_max_overflow=2)
+    engine = create_engine(settings)
+
+    assert engine.echo is False
+    assert engine.pool.size() == 5
+    assert pool_stats(engine)["max_overflow"] == 2
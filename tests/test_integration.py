@@ -3,6 +3,7 @@ from httpx import AsyncClient, ASGITransport
 from app.main import app
 from app.models.models import RideStatus, User, UserRole, Ride, DriverProfile
 from app.db.base import get_db
+from app.db.redis import get_redis
 from app.services.location_service import LocationService
 from app.services.matching_service import MatchingService
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -17,10 +18,13 @@ async def redis_client():
     await client.aclose()
 
 @pytest.fixture
-def override_db(db_session):
+def override_db(db_session, redis_client):
     async def _override_get_db():
         yield db_session
+    async def _override_get_redis():
+        yield redis_client
     app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_redis] = _override_get_redis
     yield
     app.dependency_overrides.clear()
 
@@ -0,0 +1,74 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from app.main import app
+from app.db.redis import get_redis
+from app.services.location_buffer import LocationWriteBuffer, get_location_buffer
+from app.services.location_service import LocationService
+from fakeredis import FakeAsyncRedis
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def location_buffer(redis_client):
+    return LocationWriteBuffer(LocationService(redis_client), flush_interval=60)
+
+@pytest.fixture
+def override_redis(redis_client, location_buffer):
+    async def _override_get_redis():
+        yield redis_client
+    app.dependency_overrides[get_redis] = _override_get_redis
+    app.dependency_overrides[get_location_buffer] = lambda: location_buffer
+    yield
+    app.dependency_overrides.clear()
+
+@pytest.mark.asyncio
+async def test_update_locations_batch(redis_client, location_buffer, override_redis):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        payload = {
+            "updates": [
+                {"driver_id": driver_id, "lat": 37.7749, "long": -122.4194 + driver_id * 0.001}
+                for driver_id in range(1, 301)
+            ]
+        }
+        response = await ac.patch("/location/update/batch", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "updated": 300}
+    # Written behind, on the buffer's next flush
+    assert location_buffer.pending == 300
+    assert await location_buffer.flush() == 300
+    assert await redis_client.zcard("driver_locations") == 300
+
+@pytest.mark.asyncio
+async def test_update_locations_batch_coalesces_repeated_pings(redis_client, location_buffer, override_redis):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        for step in range(3):
+            payload = {"updates": [{"driver_id": 1, "lat": 37.7749 + step * 0.001, "long": -122.4194}]}
+            response = await ac.patch("/location/update/batch", json=payload)
+            assert response.status_code == 200
+
+    assert await location_buffer.flush() == 1
+    assert location_buffer.stats()["dropped"] == 2
+    [(long, lat)] = await redis_client.geopos("driver_locations", "1")
+    assert lat == pytest.approx(37.7769, abs=1e-5)
+
+@pytest.mark.asyncio
+async def test_update_locations_batch_rejects_empty(override_redis):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.patch("/location/update/batch", json={"updates": []})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_update_locations_batch_rejects_invalid_coordinates(override_redis):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        payload = {"updates": [{"driver_id": 1, "lat": 95.0, "long": -122.4194}]}
+        response = await ac.patch("/location/update/batch", json=payload)
+    assert response.status_code == 422
@@ -0,0 +1,81 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+from fakeredis import FakeAsyncRedis
+from app.services.location_service import LocationService
+from app.services.location_buffer import LocationWriteBuffer
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_buffer_coalesces_pings_per_driver(redis_client):
+    service = LocationService(redis_client)
+    buffer = LocationWriteBuffer(service)
+
+    await buffer.add(1, 37.7749, -122.4194)
+    await buffer.add(1, 37.7759, -122.4194)
+    await buffer.add(1, 37.7769, -122.4194)
+    await buffer.add(2, 37.7849, -122.4094)
+
+    # Nothing reaches Redis until a flush
+    assert await redis_client.zcard("driver_locations") == 0
+
+    written = await buffer.flush()
+
+    assert written == 2
+    assert buffer.stats() == {"received": 4, "written": 2, "dropped": 2, "pending": 0}
+    pos = await redis_client.geopos("driver_locations", "1")
+    assert abs(pos[0][1] - 37.7769) < 0.0001
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_at_size_threshold(redis_client):
+    service = LocationService(redis_client)
+    buffer = LocationWriteBuffer(service, max_pending=3)
+
+    await buffer.add(1, 37.7749, -122.4194)
+    await buffer.add(2, 37.7749, -122.4194)
+    assert await redis_client.zcard("driver_locations") == 0
+
+    await buffer.add(3, 37.7749, -122.4194)
+    assert await redis_client.zcard("driver_locations") == 3
+    assert buffer.pending == 0
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_on_timer(redis_client):
+    service = LocationService(redis_client)
+
+    async with LocationWriteBuffer(service, flush_interval=0.01) as buffer:
+        await buffer.add(1, 37.7749, -122.4194)
+        for _ in range(50):
+            if await redis_client.zcard("driver_locations") == 1:
+                break
+            await asyncio.sleep(0.01)
+        assert await redis_client.zcard("driver_locations") == 1
+
+@pytest.mark.asyncio
+async def test_buffer_stop_flushes_remaining(redis_client):
+    service = LocationService(redis_client)
+    buffer = LocationWriteBuffer(service, flush_interval=60)
+    await buffer.start()
+
+    await buffer.add(1, 37.7749, -122.4194)
+    await buffer.stop()
+
+    assert await redis_client.zcard("driver_locations") == 1
+
+@pytest.mark.asyncio
+async def test_buffer_keeps_pings_when_flush_fails():
+    service = AsyncMock()
+    service.update_locations_bulk = AsyncMock(side_effect=ConnectionError("redis down"))
+    buffer = LocationWriteBuffer(service)
+
+    await buffer.add(1, 37.7749, -122.4194)
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+
+    assert buffer.pending == 1
+    assert buffer.written == 0
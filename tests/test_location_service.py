@@ -1,6 +1,7 @@
 import pytest
 import asyncio
-from fakeredis import FakeAsyncRedis
+import time
+from fakeredis import FakeAsyncRedis, FakeServer
 from app.services.location_service import LocationService
 
 @pytest.fixture
@@ -50,4 +51,281 @@ async def test_find_nearby_drivers(redis_client):
 async def test_find_nearby_drivers_empty(redis_client):
     service = LocationService(redis_client=redis_client)
     drivers = await service.find_nearby_drivers(37.7749, -122.4194, 5.0)
-    assert drivers == []
\ No newline at end of file
+    assert drivers == []
+
+@pytest.mark.asyncio
+async def test_update_locations_bulk(redis_client):
+    service = LocationService(redis_client=redis_client)
+
+    pings = [(driver_id, 37.7749 + driver_id * 0.001, -122.4194) for driver_id in range(1, 8)]
+    written = await service.update_locations_bulk(pings, batch_size=3)
+
+    assert written == 7
+    assert await redis_client.zcard("driver_locations") == 7
+    pos = await redis_client.geopos("driver_locations", "7")
+    assert abs(pos[0][1] - (37.7749 + 0.007)) < 0.0001
+
+@pytest.mark.asyncio
+async def test_update_locations_bulk_keeps_latest_ping(redis_client):
+    service = LocationService(redis_client=redis_client)
+
+    await service.update_locations_bulk([(1, 37.7749, -122.4194), (1, 37.7849, -122.4094)])
+
+    pos = await redis_client.geopos("driver_locations", "1")
+    assert abs(pos[0][1] - 37.7849) < 0.0001
+
+@pytest.mark.asyncio
+async def test_update_locations_bulk_from_async_stream(redis_client):
+    service = LocationService(redis_client=redis_client)
+    release = asyncio.Event()
+
+    async def stream():
+        yield (1, 37.7749, -122.4194)
+        # Stall the stream; the first ping must still be flushed on the interval.
+        await release.wait()
+        yield (2, 37.7849, -122.4094)
+
+    task = asyncio.create_task(
+        service.update_locations_bulk(stream(), batch_size=100, flush_interval=0.01)
+    )
+    for _ in range(50):
+        if await redis_client.zcard("driver_locations") == 1:
+            break
+        await asyncio.sleep(0.01)
+    assert await redis_client.zcard("driver_locations") == 1
+
+    release.set()
+    assert await task == 2
+    assert await redis_client.zcard("driver_locations") == 2
+
+@pytest.mark.asyncio
+async def test_update_locations_bulk_invalid_batch_size(redis_client):
+    service = LocationService(redis_client=redis_client)
+    with pytest.raises(ValueError):
+        await service.update_locations_bulk([(1, 37.7749, -122.4194)], batch_size=0)
+
+
+@pytest.mark.asyncio
+async def test_find_nearest_drivers_sorted_and_limited(redis_client):
+    service = LocationService(redis_client=redis_client)
+
+    # Added out of distance order on purpose
+    await service.update_location(3, 37.7949, -122.4194) # ~2.2km
+    await service.update_location(1, 37.7750, -122.4194) # ~0km
+    await service.update_location(2, 37.7849, -122.4194) # ~1.1km
+    await service.update_location(4, 34.0522, -118.2437) # Los Angeles
+
+    drivers = await service.find_nearest_drivers(37.7749, -122.4194, radius_km=5.0, count=2)
+
+    assert [d.driver_id for d in drivers] == [1, 2]
+    assert drivers[0].distance_km < drivers[1].distance_km
+    assert abs(drivers[1].distance_km - 1.11) < 0.05
+    lat, long = drivers[1].coordinates
+    assert abs(lat - 37.7849) < 0.0001
+    assert abs(long - -122.4194) < 0.0001
+
+@pytest.mark.asyncio
+async def test_find_nearest_drivers_empty(redis_client):
+    service = LocationService(redis_client=redis_client)
+    assert await service.find_nearest_drivers(37.7749, -122.4194, radius_km=5.0, count=5) == []
+
+@pytest.mark.asyncio
+async def test_find_nearest_drivers_expanding_stops_early_in_dense_area(redis_client):
+    service = LocationService(redis_client=redis_client)
+
+    await service.update_location(1, 37.7750, -122.4194) # ~0km
+    await service.update_location(2, 37.7755, -122.4194) # ~70m
+    await service.update_location(3, 37.7949, -122.4194) # ~2.2km
+
+    search = await service.find_nearest_drivers_expanding(
+        37.7749, -122.4194, count=10, min_results=2, radii_km=(0.5, 1.0, 5.0)
+    )
+
+    assert search.radius_km == 0.5
+    assert [d.driver_id for d in search.drivers] == [1, 2]
+
+@pytest.mark.asyncio
+async def test_find_nearest_drivers_expanding_widens_in_sparse_area(redis_client):
+    service = LocationService(redis_client=redis_client)
+
+    # Nearest driver is ~7km out, beyond the old fixed 5km radius
+    await service.update_location(1, 37.8379, -122.4194)
+
+    search = await service.find_nearest_drivers_expanding(
+        37.7749, -122.4194, count=10, radii_km=(0.5, 2.0, 5.0, 10.0)
+    )
+
+    assert search.radius_km == 10.0
+    assert [d.driver_id for d in search.drivers] == [1]
+
+@pytest.mark.asyncio
+async def test_find_nearest_drivers_expanding_nothing_found(redis_client):
+    service = LocationService(redis_client=redis_client)
+    search = await service.find_nearest_drivers_expanding(
+        37.7749, -122.4194, count=10, radii_km=(0.5, 1.0)
+    )
+    assert search.drivers == []
+    assert search.radius_km == 1.0
+
+@pytest.fixture
+async def shard_clients():
+    # Each client gets its own FakeServer so the shards behave like separate nodes
+    clients = [FakeAsyncRedis(server=FakeServer()) for _ in range(3)]
+    yield clients
+    for client in clients:
+        await client.aclose()
+
+@pytest.mark.asyncio
+async def test_sharded_update_partitions_by_region(redis_client, shard_clients):
+    service = LocationService(redis_client, shard_clients=shard_clients, region_precision=4)
+
+    await service.update_location(1, 37.7749, -122.4194) # San Francisco
+    await service.update_location(2, 34.0522, -118.2437) # Los Angeles
+
+    sf_key = service.region_key(37.7749, -122.4194)
+    la_key = service.region_key(34.0522, -118.2437)
+    assert sf_key == "driver_locations:9q8y"
+    assert sf_key != la_key
+    assert await service._client_for(sf_key).zscore(sf_key, "1") is not None
+    assert await service._client_for(la_key).zscore(la_key, "2") is not None
+    # Nothing lands in the unsharded key
+    for client in shard_clients:
+        assert await client.zcard("driver_locations") == 0
+
+@pytest.mark.asyncio
+async def test_sharded_search_fans_out_across_region_boundary(redis_client, shard_clients):
+    service = LocationService(redis_client, shard_clients=shard_clients, region_precision=4)
+
+    # -122.34375 is a region boundary; these drivers are ~900m apart
+    await service.update_locations_bulk([(1, 37.77, -122.35), (2, 37.77, -122.34)])
+    assert service.region_key(37.77, -122.35) != service.region_key(37.77, -122.34)
+
+    drivers = await service.find_nearest_drivers(37.77, -122.3445, radius_km=2.0, count=5)
+    assert [d.driver_id for d in drivers] == [2, 1]
+
+    assert set(await service.find_nearby_drivers(37.77, -122.3445, 2.0)) == {1, 2}
+
+@pytest.mark.asyncio
+async def test_sharded_search_merges_nearest_across_regions(redis_client, shard_clients):
+    service = LocationService(redis_client, shard_clients=shard_clients, region_precision=4)
+
+    await service.update_locations_bulk([
+        (1, 37.77, -122.3500), # west region, ~560m
+        (2, 37.77, -122.3480), # west region, ~390m
+        (3, 37.77, -122.3400), # east region, ~390m
+        (4, 37.77, -122.3300), # east region, ~1.3km
+    ])
+
+    drivers = await service.find_nearest_drivers(37.77, -122.3440, radius_km=5.0, count=3)
+    assert sorted(d.driver_id for d in drivers[:2]) == [2, 3]
+    assert drivers[2].driver_id == 1
+
+@pytest.mark.asyncio
+async def test_sharded_driver_moving_regions_leaves_old_region(redis_client, shard_clients):
+    service = LocationService(redis_client, shard_clients=shard_clients, region_precision=4)
+
+    await service.update_location(1, 37.77, -122.35)
+    old_key = service.region_key(37.77, -122.35)
+    await service.update_location(1, 37.77, -122.34)
+    new_key = service.region_key(37.77, -122.34)
+
+    assert await service._client_for(old_key).zscore(old_key, "1") is None
+    assert await service._client_for(new_key).zscore(new_key, "1") is not None
+    assert await service.find_nearby_drivers(37.77, -122.345, 5.0) == [1]
+
+@pytest.mark.asyncio
+async def test_update_location_records_last_seen(redis_client):
+    service = LocationService(redis_client=redis_client)
+    before = time.time()
+
+    await service.update_location(1, 37.7749, -122.4194)
+
+    seen = await redis_client.zscore("driver_locations:seen", "1")
+    assert seen is not None and seen >= before
+
+@pytest.mark.asyncio
+async def test_search_skips_stale_drivers(redis_client):
+    service = LocationService(redis_client=redis_client, freshness_seconds=30)
+
+    await service.update_locations_bulk([(1, 37.7749, -122.4194), (2, 37.7750, -122.4194)])
+    # Driver 1's app crashed a minute ago
+    await redis_client.zadd("driver_locations:seen", {"1": time.time() - 60})
+    # Driver 3 was written without a last-seen timestamp
+    await redis_client.geoadd("driver_locations", (-122.4194, 37.7751, "3"))
+
+    assert await service.find_nearby_drivers(37.7749, -122.4194, 5.0) == [2]
+    nearest = await service.find_nearest_drivers(37.7749, -122.4194, 5.0, count=5)
+    assert [d.driver_id for d in nearest] == [2]
+
+    unfiltered = LocationService(redis_client=redis_client, freshness_seconds=None)
+    assert set(await unfiltered.find_nearby_drivers(37.7749, -122.4194, 5.0)) == {1, 2, 3}
+
+@pytest.mark.asyncio
+async def test_stale_drivers_do_not_hide_fresh_ones(redis_client, shard_clients):
+    for service in (
+        LocationService(redis_client=redis_client, freshness_seconds=30),
+        LocationService(redis_client, shard_clients=shard_clients, region_precision=4),
+    ):
+        # Five ghosts right at the pickup, a live driver ~120m away
+        await service.update_locations_bulk([(i, 37.7749, -122.4194) for i in range(5)])
+        await service.update_location(99, 37.7760, -122.4194)
+        key = service.region_key(37.7749, -122.4194)
+        await service._client_for(key).zadd(service.seen_key(key), {str(i): time.time() - 60 for i in range(5)})
+
+        nearest = await service.find_nearest_drivers(37.7749, -122.4194, 5.0, count=5)
+        assert [d.driver_id for d in nearest] == [99]
+        nearest = await service.find_nearest_drivers(37.7749, -122.4194, 5.0, count=1)
+        assert [d.driver_id for d in nearest] == [99]
+        search = await service.find_nearest_drivers_expanding(37.7749, -122.4194, count=3, radii_km=(0.5, 1.0))
+        assert [d.driver_id for d in search.drivers] == [99]
+        assert search.radius_km == 0.5
+
+@pytest.mark.asyncio
+async def test_evict_stale_drivers(redis_client):
+    service = LocationService(redis_client=redis_client, freshness_seconds=30)
+
+    await service.update_locations_bulk([(1, 37.7749, -122.4194), (2, 37.7750, -122.4194)])
+    await redis_client.zadd("driver_locations:seen", {"1": time.time() - 60})
+
+    assert await service.evict_stale_drivers() == 1
+
+    assert await redis_client.zscore("driver_locations", "1") is None
+    assert await redis_client.zscore("driver_locations:seen", "1") is None
+    assert await redis_client.zscore("driver_locations", "2") is not None
+    assert await service.evict_stale_drivers() == 0
+
+@pytest.mark.asyncio
+async def test_evict_stale_drivers_in_batches(redis_client, monkeypatch):
+    monkeypatch.setattr("app.services.location_service.EVICTION_BATCH_SIZE", 2)
+    service = LocationService(redis_client=redis_client)
+
+    await service.update_locations_bulk([(i, 37.7749, -122.4194) for i in range(5)])
+    await redis_client.zadd("driver_locations:seen", {str(i): time.time() - 60 for i in range(5)})
+
+    assert await service.evict_stale_drivers() == 5
+    assert await redis_client.zcard("driver_locations") == 0
+
+@pytest.mark.asyncio
+async def test_evict_stale_drivers_sharded(redis_client, shard_clients):
+    service = LocationService(redis_client, shard_clients=shard_clients, region_precision=4)
+
+    await service.update_locations_bulk([(1, 37.7749, -122.4194), (2, 34.0522, -118.2437)])
+    la_key = service.region_key(34.0522, -118.2437)
+    await service._client_for(la_key).zadd(service.seen_key(la_key), {"2": time.time() - 60})
+
+    assert await service.evict_stale_drivers() == 1
+    assert await service._client_for(la_key).zcard(la_key) == 0
+    assert await service.find_nearby_drivers(37.7749, -122.4194, 5.0) == [1]
+
+@pytest.mark.asyncio
+async def test_iter_positions_pages_every_key(redis_client, shard_clients):
+    service = LocationService(redis_client, shard_clients=shard_clients, region_precision=4)
+    pings = [(i, 37.7749 + i * 0.001, -122.4194) for i in range(7)] + [(100, 34.0522, -118.2437)]
+    await service.update_locations_bulk(pings)
+
+    chunks = [chunk async for chunk in service.iter_positions(chunk_size=3)]
+
+    assert all(len(chunk) <= 3 for chunk in chunks)
+    seen = {driver_id: (lat, long) for chunk in chunks for driver_id, lat, long in chunk}
+    assert sorted(seen) == [0, 1, 2, 3, 4, 5, 6, 100]
+    assert seen[100] == pytest.approx((34.0522, -118.2437), abs=1e-4)
@@ -1,7 +1,12 @@
 import pytest
 import asyncio
+import time
+from fakeredis import FakeAsyncRedis
 from unittest.mock import MagicMock, AsyncMock
 from app.services.matching_service import MatchingService
+from app.services.location_service import LocationService, NearbyDriver, NearbySearch
+from app.services.availability_service import AvailabilityService
+from app.services.ride_cache import RideCache
 from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -9,7 +14,11 @@ from sqlalchemy import select
 @pytest.fixture
 def mock_location_service():
     service = MagicMock()
-    service.find_nearby_drivers = AsyncMock(return_value=[10, 11, 12])
+    service.find_nearest_drivers_expanding = AsyncMock(return_value=NearbySearch([
+        NearbyDriver(10, 0.1, (37.7750, -122.4194)),
+        NearbyDriver(11, 0.5, (37.7790, -122.4194)),
+        NearbyDriver(12, 1.2, (37.7850, -122.4194)),
+    ], 2.0))
     return service
 
 @pytest.fixture
@@ -18,6 +27,12 @@ def mock_redis():
     # Mock lock acquisition
     client.set = AsyncMock(return_value=True)
     client.delete = AsyncMock()
+    # Pipelines used to publish ride events
+    pipe = MagicMock()
+    pipe.__aenter__ = AsyncMock(return_value=pipe)
+    pipe.__aexit__ = AsyncMock(return_value=False)
+    pipe.execute = AsyncMock(return_value=[])
+    client.pipeline = MagicMock(return_value=pipe)
     return client
 
 @pytest.mark.asyncio
@@ -49,6 +64,7 @@ async def test_match_ride_success(db_session: AsyncSession, mock_location_servic
     await db_session.refresh(ride)
     assert ride.status == RideStatus.MATCHED
     assert ride.driver_id == 10
+    assert ride.match_radius_km == 2.0
     
     # Verify driver status
     await db_session.refresh(profile)
@@ -97,10 +113,201 @@ async def test_match_ride_no_drivers(db_session: AsyncSession, mock_location_ser
     await db_session.commit()
     
     # Mock location service to return empty list
-    mock_location_service.find_nearby_drivers.return_value = []
+    mock_location_service.find_nearest_drivers_expanding.return_value = NearbySearch([], 10.0)
     
     matching_service = MatchingService(db_session, mock_location_service, mock_redis)
     
     matched_driver_id = await matching_service.match_ride(ride.id)
     
     assert matched_driver_id is None
+
+@pytest.mark.asyncio
+async def test_match_ride_prefers_closest_driver(db_session: AsyncSession, mock_location_service, mock_redis):
+    rider = User(email="rider_closest@matching.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    await db_session.commit()
+
+    # Drivers 10 and 11 are both available; 10 is listed first (closest)
+    for driver_id in (11, 10):
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}_closest@matching.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"CL-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+
+    matching_service = MatchingService(db_session, mock_location_service, mock_redis, max_candidates=2)
+    matched_driver_id = await matching_service.match_ride(ride.id)
+
+    assert matched_driver_id == 10
+    mock_location_service.find_nearest_drivers_expanding.assert_awaited_once()
+    assert mock_location_service.find_nearest_drivers_expanding.await_args.kwargs["count"] == 2
+
+@pytest.mark.asyncio
+async def test_match_ride_uses_availability_mirror(db_session: AsyncSession, mock_location_service, mock_redis):
+    rider = User(email="rider_mirror@matching.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    await db_session.commit()
+
+    for driver_id in (10, 11):
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}_mirror@matching.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"MR-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+
+    # The mirror says only driver 11 is available, so 10 is never locked
+    availability_service = MagicMock()
+    availability_service.filter_available = AsyncMock(return_value=[11])
+    availability_service.mirror = AsyncMock()
+
+    matching_service = MatchingService(
+        db_session, mock_location_service, mock_redis, availability_service=availability_service
+    )
+    matched_driver_id = await matching_service.match_ride(ride.id)
+
+    assert matched_driver_id == 11
+    availability_service.filter_available.assert_awaited_once_with([10, 11, 12])
+    assert mock_redis.set.await_count == 1
+    availability_service.mirror.assert_awaited_once_with(11, False)
+
+@pytest.mark.asyncio
+async def test_match_ride_repairs_stale_mirror(db_session: AsyncSession, mock_location_service, mock_redis):
+    rider = User(email="rider_stale_mirror@matching.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    await db_session.commit()
+
+    # Mirror claims driver 10 is available, but it has no available profile
+    availability_service = MagicMock()
+    availability_service.filter_available = AsyncMock(return_value=[10])
+    availability_service.mirror = AsyncMock()
+
+    matching_service = MatchingService(
+        db_session, mock_location_service, mock_redis, availability_service=availability_service
+    )
+
+    assert await matching_service.match_ride(ride.id) is None
+    availability_service.mirror.assert_awaited_once_with(10, False)
+
+@pytest.fixture
+async def fake_redis():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+async def create_ride_and_drivers(db_session, prefix, drivers):
+    rider = User(email=f"rider_{prefix}@matching.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    for driver_id, is_available in drivers.items():
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}_{prefix}@matching.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"{prefix}-{driver_id}", car_model="Tesla", is_available=is_available))
+    await db_session.commit()
+    return ride
+
+@pytest.mark.asyncio
+async def test_claim_script_skips_locked_and_unavailable(db_session: AsyncSession, fake_redis):
+    ride = await create_ride_and_drivers(db_session, "script", {10: True, 11: True, 12: True})
+    location_service = LocationService(fake_redis)
+    await location_service.update_locations_bulk([
+        (10, 37.7750, -122.4194), # closest, but locked by another ride
+        (11, 37.7760, -122.4194), # not in the availability set
+        (12, 37.7770, -122.4194),
+    ])
+    await fake_redis.set("lock:driver:10", "locked")
+    await fake_redis.sadd("available_drivers", "10", "12")
+
+    matching_service = MatchingService(
+        db_session, location_service, fake_redis,
+        availability_service=AvailabilityService(fake_redis),
+        use_claim_script=True,
+    )
+    matched_driver_id = await matching_service.match_ride(ride.id)
+
+    assert matched_driver_id == 12
+    await db_session.refresh(ride)
+    assert ride.status == RideStatus.MATCHED
+    assert ride.match_radius_km == 0.5
+    # Our lock was released; the other ride's lock was left alone
+    assert not await fake_redis.exists("lock:driver:12")
+    assert await fake_redis.exists("lock:driver:10")
+    assert not await fake_redis.sismember("available_drivers", "12")
+
+@pytest.mark.asyncio
+async def test_claim_script_skips_stale_drivers(db_session: AsyncSession, fake_redis):
+    ride = await create_ride_and_drivers(db_session, "script_stale", {10: True, 11: True})
+    location_service = LocationService(fake_redis)
+    await location_service.update_locations_bulk([(10, 37.7750, -122.4194), (11, 37.7760, -122.4194)])
+    await fake_redis.zadd("driver_locations:seen", {"10": time.time() - 600})
+
+    matching_service = MatchingService(db_session, location_service, fake_redis, use_claim_script=True)
+
+    assert await matching_service.match_ride(ride.id) == 11
+
+@pytest.mark.asyncio
+async def test_claim_script_looks_past_stale_drivers(db_session: AsyncSession, fake_redis):
+    ride = await create_ride_and_drivers(db_session, "script_ghosts", {11: True})
+    location_service = LocationService(fake_redis)
+    # More ghosts at the pickup than candidates considered per radius
+    await location_service.update_locations_bulk([(i, 37.7749, -122.4194) for i in range(100, 105)])
+    await fake_redis.zadd("driver_locations:seen", {str(i): time.time() - 600 for i in range(100, 105)})
+    await location_service.update_location(11, 37.7760, -122.4194)
+
+    matching_service = MatchingService(
+        db_session, location_service, fake_redis, max_candidates=3, use_claim_script=True
+    )
+
+    assert await matching_service.match_ride(ride.id) == 11
+    await db_session.refresh(ride)
+    assert ride.match_radius_km == 0.5
+
+@pytest.mark.asyncio
+async def test_claim_script_retries_when_database_disagrees(db_session: AsyncSession, fake_redis):
+    # Driver 10 is closest but unavailable in Postgres and there is no mirror
+    ride = await create_ride_and_drivers(db_session, "script_db", {10: False, 11: True})
+    location_service = LocationService(fake_redis)
+    await location_service.update_locations_bulk([(10, 37.7750, -122.4194), (11, 37.7760, -122.4194)])
+
+    matching_service = MatchingService(db_session, location_service, fake_redis, use_claim_script=True)
+
+    assert await matching_service.match_ride(ride.id) == 11
+    assert not await fake_redis.exists("lock:driver:10")
+
+@pytest.mark.asyncio
+async def test_claim_script_widens_radius(db_session: AsyncSession, fake_redis):
+    ride = await create_ride_and_drivers(db_session, "script_wide", {10: True})
+    location_service = LocationService(fake_redis)
+    await location_service.update_location(10, 37.8379, -122.4194) # ~7km away
+
+    matching_service = MatchingService(db_session, location_service, fake_redis, use_claim_script=True)
+
+    assert await matching_service.match_ride(ride.id) == 10
+    await db_session.refresh(ride)
+    assert ride.match_radius_km == 10.0
+
+@pytest.mark.asyncio
+async def test_claim_script_no_drivers(db_session: AsyncSession, fake_redis):
+    ride = await create_ride_and_drivers(db_session, "script_none", {})
+    matching_service = MatchingService(db_session, LocationService(fake_redis), fake_redis, use_claim_script=True)
+    assert await matching_service.match_ride(ride.id) is None
+
+@pytest.mark.asyncio
+async def test_match_invalidates_cached_ride(db_session: AsyncSession, fake_redis):
+    ride = await create_ride_and_drivers(db_session, "cache", {10: True})
+    location_service = LocationService(fake_redis)
+    await location_service.update_location(10, 37.7750, -122.4194)
+    await RideCache(fake_redis).put(ride)
+
+    matching_service = MatchingService(db_session, location_service, fake_redis)
+
+    assert await matching_service.match_ride(ride.id) == 10
+    assert not await fake_redis.exists(RideCache.key(ride.id))
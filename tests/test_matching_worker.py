@@ -0,0 +1,173 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from fakeredis import FakeAsyncRedis
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.core.metrics import MATCHING_RESULTS, serve_metrics
+from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
+from app.services.location_service import LocationService
+from app.services.matching_worker import MatchingWorkerPool
+from app.services.ride_queue import RideRequestQueue
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def create_ride(db_session, email):
+    rider = User(email=email, hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    await db_session.commit()
+    return ride
+
+async def wait_for(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    assert condition()
+
+@pytest.mark.asyncio
+async def test_worker_pool_matches_queued_rides(db_session: AsyncSession, redis_client, session_factory):
+    for driver_id in (10, 11):
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}@worker.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"WK-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+    await LocationService(redis_client).update_locations_bulk([(10, 37.7750, -122.4194), (11, 37.7760, -122.4194)])
+
+    queue = RideRequestQueue(redis_client)
+    rides = [await create_ride(db_session, f"rider{i}@worker.com") for i in range(2)]
+    for ride in rides:
+        await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+
+    pool = MatchingWorkerPool(queue, session_factory=session_factory, concurrency=2)
+    async with pool:
+        await wait_for(lambda: pool.matched == 2)
+
+    for ride in rides:
+        await db_session.refresh(ride)
+        assert ride.status == RideStatus.MATCHED
+    assert {ride.driver_id for ride in rides} == {10, 11}
+    stream = queue.stream_for(37.7749, -122.4194)
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_worker_metrics_are_scraped_from_the_worker(db_session: AsyncSession, redis_client, session_factory):
+    db_session.add(User(id=10, email="driver10@metrics.com", hashed_password="pw", role=UserRole.DRIVER))
+    db_session.add(DriverProfile(user_id=10, license_plate="WM-10", car_model="Tesla", is_available=True))
+    await db_session.commit()
+    await LocationService(redis_client).update_locations_bulk([(10, 37.7750, -122.4194)])
+    ride = await create_ride(db_session, "rider@metrics.com")
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+    before = MATCHING_RESULTS.value("matched")
+
+    server = await serve_metrics(0, host="127.0.0.1")
+    port = server.sockets[0].getsockname()[1]
+    try:
+        pool = MatchingWorkerPool(queue, session_factory=session_factory, concurrency=1)
+        async with pool:
+            await wait_for(lambda: pool.matched == 1)
+        async with AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            response = await client.get("/metrics")
+            missing = await client.get("/")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert response.status_code == 200
+    assert f'matching_results_total{{result="matched"}} {int(before) + 1}' in response.text
+    assert "matching_stage_duration_seconds_count" in response.text
+    assert missing.status_code == 404
+
+@pytest.mark.asyncio
+async def test_worker_pool_retries_then_dead_letters(db_session: AsyncSession, redis_client, session_factory):
+    # No drivers at all: every attempt fails
+    ride = await create_ride(db_session, "rider_retry@worker.com")
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+
+    pool = MatchingWorkerPool(
+        queue, session_factory=session_factory, concurrency=1, max_attempts=3, retry_delay=0.01
+    )
+    async with pool:
+        await wait_for(lambda: pool.dead_lettered == 1)
+
+    assert pool.retried == 2
+    assert await redis_client.xlen("ride_requests:dead") == 1
+    await db_session.refresh(ride)
+    assert ride.status == RideStatus.REQUESTED
+
+@pytest.mark.asyncio
+async def test_process_drops_rides_no_longer_requested(db_session: AsyncSession, redis_client, session_factory):
+    ride = await create_ride(db_session, "rider_cancelled@worker.com")
+    ride.status = RideStatus.CANCELLED
+    await db_session.commit()
+
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+    stream = queue.stream_for(ride.source_lat, ride.source_long)
+    await queue.ensure_group(stream)
+    entry = (await queue.read("worker-1", [stream]))[0]
+
+    pool = MatchingWorkerPool(queue, session_factory=session_factory)
+    await pool.process(entry)
+
+    assert pool.dropped == 1
+    assert pool.retried == 0
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_process_retries_when_matching_raises(db_session: AsyncSession, redis_client, session_factory):
+    ride = await create_ride(db_session, "rider_error@worker.com")
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+    stream = queue.stream_for(ride.source_lat, ride.source_long)
+    await queue.ensure_group(stream)
+    entry = (await queue.read("worker-1", [stream]))[0]
+
+    failing_service = MagicMock()
+    failing_service.match_ride = AsyncMock(side_effect=RuntimeError("boom"))
+    pool = MatchingWorkerPool(
+        queue, service_factory=lambda db: failing_service, session_factory=session_factory, retry_delay=0
+    )
+    await pool.process(entry)
+    await asyncio.gather(*pool._retries)
+
+    assert pool.retried == 1
+    # The retry is a new entry with a bumped attempt counter
+    entries = await redis_client.xrange(stream)
+    assert [fields[b"attempt"] for _, fields in entries] == [b"1"]
+
+@pytest.mark.asyncio
+async def test_process_offers_rides_in_offer_mode(db_session: AsyncSession, redis_client, session_factory):
+    ride = await create_ride(db_session, "rider_offer@worker.com")
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(ride.id, ride.source_lat, ride.source_long)
+    stream = queue.stream_for(ride.source_lat, ride.source_long)
+    await queue.ensure_group(stream)
+    entry = (await queue.read("worker-1", [stream]))[0]
+
+    service = MagicMock()
+    service.offer_ride = AsyncMock(return_value=10)
+    pool = MatchingWorkerPool(queue, service_factory=lambda db: service, session_factory=session_factory, mode="offer")
+    await pool.process(entry)
+
+    service.offer_ride.assert_awaited_once_with(ride.id)
+    service.match_ride.assert_not_called()
+    assert pool.matched == 1
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+
+def test_pool_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        MatchingWorkerPool(RideRequestQueue(MagicMock()), mode="auction")
@@ -0,0 +1,104 @@
+import pytest
+from fakeredis import FakeAsyncRedis
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.metrics import (
+    DB_QUERY_DURATION, HTTP_REQUEST_DURATION, MATCHING_LOCK_ATTEMPTS, MATCHING_RESULTS,
+    MATCHING_STAGE_DURATION, REDIS_COMMAND_DURATION, Registry, instrument_engine,
+)
+from app.main import app
+from app.models.models import DriverProfile, Ride, User, UserRole
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+def test_render_exposition_format():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    latency.observe(0.05, "/a")
+    latency.observe(0.5, "/a")
+    latency.observe(3.0, "/a")
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a"} 3',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 3.55',
+        'latency_seconds_count{route="/a"} 3',
+    ]
+
+def test_duplicate_metric_names_are_rejected():
+    registry = Registry()
+    registry.counter("requests_total", "Requests.")
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Requests.")
+
+@pytest.mark.asyncio
+async def test_requests_are_timed_by_route_template():
+    before = HTTP_REQUEST_DURATION.count("GET", "/health", "200")
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        await ac.get("/health")
+        response = await ac.get("/metrics")
+
+    assert HTTP_REQUEST_DURATION.count("GET", "/health", "200") == before + 1
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+
+@pytest.mark.asyncio
+async def test_match_ride_records_stages_and_lock_contention(db_session: AsyncSession, redis_client):
+    rider = User(email="rider@metrics.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    for driver_id in (10, 11):
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}@metrics.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"M-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+
+    location_service = LocationService(redis_client)
+    await location_service.update_locations_bulk([(10, 37.7750, -122.4194), (11, 37.7760, -122.4194)])
+    # The nearest driver is busy with another ride
+    await redis_client.set("lock:driver:10", "locked")
+
+    stages = ("fetch_ride", "geo_search", "availability_check", "lock", "commit")
+    before = {stage: MATCHING_STAGE_DURATION.count(stage) for stage in stages}
+    contended = MATCHING_LOCK_ATTEMPTS.value("contended")
+    matched = MATCHING_RESULTS.value("matched")
+    searches = REDIS_COMMAND_DURATION.count("geo_search")
+
+    assert await MatchingService(db_session, location_service, redis_client).match_ride(ride.id) == 11
+
+    assert MATCHING_STAGE_DURATION.count("lock") == before["lock"] + 2
+    for stage in ("fetch_ride", "geo_search", "availability_check", "commit"):
+        assert MATCHING_STAGE_DURATION.count(stage) == before[stage] + 1
+    assert MATCHING_LOCK_ATTEMPTS.value("contended") == contended + 1
+    assert MATCHING_RESULTS.value("matched") == matched + 1
+    assert REDIS_COMMAND_DURATION.count("geo_search") > searches
+
+@pytest.mark.asyncio
+async def test_instrumented_engine_times_statements(engine):
+    instrument_engine(engine)
+    before = DB_QUERY_DURATION.count("SELECT")
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+    assert DB_QUERY_DURATION.count("SELECT") == before + 1
@@ -0,0 +1,163 @@
+import pytest
+import asyncio
+import time
+from fakeredis import FakeAsyncRedis
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Ride, User, DriverProfile, UserRole
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+from app.services.notification_service import (
+    DriverRateLimiter, HttpPushBackend, NotificationDispatcher, OfferNotification, StubPushBackend,
+    create_push_stub_app,
+)
+from app.services.offer_service import RideOfferService
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+class FlakyBackend:
+    """
+    Fails every notification of the first call.
+    """
+    def __init__(self):
+        self.batches = []
+        self.sent_at = []
+
+    async def send(self, batch):
+        self.batches.append([notification.driver_id for notification in batch])
+        self.sent_at.append(time.monotonic())
+        return [len(self.batches) > 1] * len(batch)
+
+class ShortBackend:
+    """
+    Answers with one result fewer than the batch.
+    """
+    async def send(self, batch):
+        return [True] * (len(batch) - 1)
+
+def test_rate_limiter_allows_a_burst_then_refills():
+    limiter = DriverRateLimiter(rate=1.0, burst=2)
+
+    assert [limiter.allow(1, now=0.0) for _ in range(3)] == [True, True, False]
+    assert limiter.allow(2, now=0.0) # per driver
+    assert limiter.allow(1, now=1.0)
+    assert not limiter.allow(1, now=1.5)
+
+    limiter.prune(now=10.0)
+    assert limiter._buckets == {}
+
+@pytest.mark.asyncio
+async def test_dispatcher_sends_in_batches():
+    stub = StubPushBackend(latency=0.0)
+    dispatcher = NotificationDispatcher(stub, batch_size=100, senders=1)
+
+    # Enqueued before the sender starts, so batches are full
+    for ride_id in range(25):
+        await dispatcher.notify_offer(ride_id, [ride_id * 10 + offset for offset in range(10)])
+    async with dispatcher:
+        await asyncio.wait_for(dispatcher.flush(), 2)
+
+    assert stub.calls == 3
+    assert len(stub.delivered) == 250
+    assert dispatcher.stats["delivered"] == 250
+
+@pytest.mark.asyncio
+async def test_dispatcher_rate_limits_and_drops():
+    dispatcher = NotificationDispatcher(
+        StubPushBackend(latency=0.0), max_queue=2, rate_limiter=DriverRateLimiter(rate=0.1, burst=1)
+    )
+
+    await dispatcher.notify_offer(1, [10, 11])
+    await dispatcher.notify_offer(2, [10, 12])
+
+    # Driver 10 already had an offer; driver 12 finds the queue full
+    assert dispatcher.stats == {"delivered": 0, "failed": 0, "rate_limited": 1, "dropped": 1}
+
+@pytest.mark.asyncio
+async def test_dispatcher_retries_failures():
+    backend = FlakyBackend()
+    async with NotificationDispatcher(backend, senders=1) as dispatcher:
+        await dispatcher.notify_offer(1, [10, 11])
+        await asyncio.wait_for(dispatcher.flush(), 2)
+
+    assert backend.batches == [[10, 11], [10, 11]]
+    assert dispatcher.stats["delivered"] == 2
+
+    async with NotificationDispatcher(StubPushBackend(latency=0.0, failure_rate=1.0), max_attempts=3) as dispatcher:
+        await dispatcher.notify_offer(1, [10])
+        await asyncio.wait_for(dispatcher.flush(), 2)
+    assert dispatcher.stats["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_dispatcher_backs_off_before_retrying():
+    backend = FlakyBackend()
+    async with NotificationDispatcher(backend, senders=1, retry_delay=0.1) as dispatcher:
+        await dispatcher.notify_offer(1, [10])
+        await asyncio.wait_for(dispatcher.flush(), 2)
+
+    assert backend.batches == [[10], [10]]
+    assert backend.sent_at[1] - backend.sent_at[0] >= 0.1
+    assert dispatcher.stats["delivered"] == 1
+
+@pytest.mark.asyncio
+async def test_missing_backend_results_count_as_failed():
+    async with NotificationDispatcher(ShortBackend(), senders=1, max_attempts=1) as dispatcher:
+        await dispatcher.notify_offer(1, [10, 11, 12])
+        await asyncio.wait_for(dispatcher.flush(), 2)
+
+    assert dispatcher.stats["delivered"] == 2
+    assert dispatcher.stats["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_stub_keeps_only_recent_deliveries():
+    stub = StubPushBackend(latency=0.0, keep_delivered=2)
+
+    await stub.send([OfferNotification(1, driver_id, 0.0) for driver_id in range(5)])
+
+    assert [notification.driver_id for notification in stub.delivered] == [3, 4]
+    assert stub.delivered_count == 5
+
+@pytest.mark.asyncio
+async def test_http_backend_against_stub_gateway():
+    stub = StubPushBackend(latency=0.0)
+    transport = ASGITransport(app=create_push_stub_app(stub))
+    async with AsyncClient(transport=transport, base_url="http://push") as client:
+        async with NotificationDispatcher(HttpPushBackend(client)) as dispatcher:
+            await dispatcher.notify_offer(7, [10, 11])
+            await asyncio.wait_for(dispatcher.flush(), 2)
+
+    assert [(notification.ride_id, notification.driver_id) for notification in stub.delivered] == [(7, 10), (7, 11)]
+    assert dispatcher.stats["delivered"] == 2
+
+@pytest.mark.asyncio
+async def test_offer_ride_notifies_through_dispatcher(db_session: AsyncSession, redis_client):
+    rider = User(email="rider@notify.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    for driver_id in (10, 11):
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}@notify.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"N-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+    location_service = LocationService(redis_client)
+    await location_service.update_locations_bulk([(10, 37.7750, -122.4194), (11, 37.7760, -122.4194)])
+
+    # Driver 11 accepts as soon as the offer reaches their phone
+    def on_delivered(notification):
+        if notification.driver_id == 11:
+            asyncio.create_task(RideOfferService(redis_client).accepted(notification.ride_id, 11))
+
+    stub = StubPushBackend(latency=0.01, seed=1, on_delivered=on_delivered)
+    async with NotificationDispatcher(stub) as dispatcher:
+        matching_service = MatchingService(
+            db_session, location_service, redis_client,
+            offer_fanout=2, offer_timeout=2.0, offer_notifier=dispatcher.notify_offer,
+        )
+        assert await matching_service.offer_ride(ride.id) == 11
+
+    assert sorted(notification.driver_id for notification in stub.delivered) == [10, 11]
@@ -0,0 +1,208 @@
+import pytest
+import asyncio
+import time
+from fakeredis import FakeAsyncRedis
+from redis.asyncio import Redis
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.db.base import get_db
+from app.db.redis import get_redis
+from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
+from app.services.location_service import LocationService
+from app.services.matching_service import MatchingService
+from app.services.offer_service import RideOfferService
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def override_db(engine, redis_client):
+    # Each request gets its own session, as in production, so accepts can
+    # run while offer_ride holds the test session
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async def _override_get_db():
+        async with session_factory() as session:
+            yield session
+    async def _override_get_redis():
+        yield redis_client
+    app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_redis] = _override_get_redis
+    yield
+    app.dependency_overrides.clear()
+
+async def create_ride_and_drivers(db_session, prefix, driver_ids):
+    rider = User(email=f"rider_{prefix}@offers.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    for driver_id in driver_ids:
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}_{prefix}@offers.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"{prefix}-{driver_id}", car_model="Tesla", is_available=True))
+    await db_session.commit()
+    return ride
+
+async def respond(ride_id, driver_id, accept):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        return await ac.patch(
+            "/ride/driver/accept", json={"ride_id": ride_id, "driver_id": driver_id, "accept": accept}
+        )
+
+@pytest.mark.asyncio
+async def test_send_skips_drivers_locked_by_other_rides(redis_client):
+    await redis_client.set("lock:driver:10", "99")
+    offers = RideOfferService(redis_client)
+
+    assert await offers.send(1, [10, 11, 12, 13], fanout=2) == [11, 12]
+    assert await redis_client.get("lock:driver:11") == b"1"
+    assert not await redis_client.exists("lock:driver:13")
+    assert await offers.offered(1) == [11, 12]
+
+@pytest.mark.asyncio
+async def test_release_leaves_other_rides_locks(redis_client):
+    offers = RideOfferService(redis_client)
+    await offers.send(1, [10, 11], fanout=2)
+    await redis_client.set("lock:driver:11", "2") # re-locked by ride 2 after expiry
+
+    assert await offers.release(1, [10, 11]) == 1
+    assert not await redis_client.exists("lock:driver:10")
+    assert await redis_client.get("lock:driver:11") == b"2"
+
+@pytest.mark.asyncio
+async def test_wait_for_acceptance(redis_client):
+    offers = RideOfferService(redis_client, offer_timeout=0.2)
+    await offers.send(1, [10, 11], fanout=2)
+
+    # Timeout with no responses
+    assert await offers.wait_for_acceptance(1, [10, 11]) is None
+
+    # Returns as soon as everyone has declined, without waiting for the timeout
+    await offers.decline(1, 10)
+    await offers.decline(1, 11)
+    assert await offers.wait_for_acceptance(1, [10, 11], timeout=5) is None
+    assert not await redis_client.exists("lock:driver:10")
+
+    await offers.accepted(1, 11)
+    assert await offers.wait_for_acceptance(1, [10, 11]) == 11
+
+async def serve_slow_blpop(accept_after: float):
+    """
+    A Redis stand-in that, like a real server, holds each BLPOP reply for the
+    command's full timeout. From `accept_after` seconds on, it answers with
+    driver 11's accept. Every other command gets +OK.
+    """
+    started = time.monotonic()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode())
+                if args[0].upper() != "BLPOP":
+                    writer.write(b"+OK\r\n")
+                elif time.monotonic() - started >= accept_after:
+                    key = args[1].encode()
+                    writer.write(b"*2\r\n$%d\r\n%s\r\n$9\r\naccept:11\r\n" % (len(key), key))
+                else:
+                    await asyncio.sleep(float(args[-1]))
+                    writer.write(b"*-1\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("accept_after, winner", [(0.4, 11), (float("inf"), None)])
+async def test_wait_for_acceptance_outlasts_the_socket_timeout(accept_after, winner):
+    server = await serve_slow_blpop(accept_after)
+    client = Redis(host="127.0.0.1", port=server.sockets[0].getsockname()[1], socket_timeout=0.2)
+    offers = RideOfferService(client, offer_timeout=0.6)
+    try:
+        # The offer stays open well past the client's socket timeout
+        started = time.monotonic()
+        assert await offers.wait_for_acceptance(1, [10, 11]) == winner
+        if winner is None:
+            assert time.monotonic() - started >= 0.6
+    finally:
+        await client.aclose()
+        server.close()
+        await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_offer_ride_first_accept_wins(db_session: AsyncSession, redis_client, override_db):
+    ride = await create_ride_and_drivers(db_session, "fanout", [10, 11, 12])
+    location_service = LocationService(redis_client)
+    await location_service.update_locations_bulk([
+        (10, 37.7750, -122.4194),
+        (11, 37.7760, -122.4194),
+        (12, 37.7770, -122.4194),
+    ])
+    responses = []
+    tasks = []
+
+    async def notify(ride_id, driver_ids):
+        assert driver_ids == [10, 11, 12]
+        # No connection is held in a transaction while drivers decide
+        assert not db_session.in_transaction()
+        async def drivers_respond():
+            responses.append(await respond(ride_id, 11, True))
+            responses.append(await respond(ride_id, 10, True))
+        tasks.append(asyncio.create_task(drivers_respond()))
+
+    matching_service = MatchingService(
+        db_session, location_service, redis_client, offer_fanout=3, offer_timeout=2.0, offer_notifier=notify
+    )
+
+    assert await matching_service.offer_ride(ride.id) == 11
+    # The late accept is answered independently of the offer loop
+    await asyncio.wait_for(tasks[0], 2)
+    assert [response.status_code for response in responses] == [200, 400]
+
+    await db_session.refresh(ride)
+    assert ride.status == RideStatus.MATCHED
+    assert ride.driver_id == 11
+    # The losing offers' locks are released immediately
+    for driver_id in (10, 11, 12):
+        assert not await redis_client.exists(f"lock:driver:{driver_id}")
+
+@pytest.mark.asyncio
+async def test_offer_ride_one_by_one(db_session: AsyncSession, redis_client, override_db):
+    ride = await create_ride_and_drivers(db_session, "sequential", [10, 11])
+    location_service = LocationService(redis_client)
+    await location_service.update_locations_bulk([(10, 37.7750, -122.4194), (11, 37.7760, -122.4194)])
+    rounds = []
+
+    async def notify(ride_id, driver_ids):
+        rounds.append(driver_ids)
+        asyncio.create_task(respond(ride_id, driver_ids[0], driver_ids[0] == 11))
+
+    matching_service = MatchingService(
+        db_session, location_service, redis_client, offer_fanout=1, offer_timeout=2.0, offer_notifier=notify
+    )
+
+    assert await matching_service.offer_ride(ride.id) == 11
+    assert rounds == [[10], [11]]
+
+@pytest.mark.asyncio
+async def test_offer_ride_gives_up_when_nobody_accepts(db_session: AsyncSession, redis_client):
+    ride = await create_ride_and_drivers(db_session, "ignored", [10])
+    location_service = LocationService(redis_client)
+    await location_service.update_location(10, 37.7750, -122.4194)
+
+    matching_service = MatchingService(db_session, location_service, redis_client, offer_timeout=0.1)
+
+    assert await matching_service.offer_ride(ride.id) is None
+    assert not await redis_client.exists("lock:driver:10")
+    await db_session.refresh(ride)
+    assert ride.status == RideStatus.REQUESTED
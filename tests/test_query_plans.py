@@ -0,0 +1,102 @@
+import pytest
+from datetime import datetime
+from fakeredis import FakeAsyncRedis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.db.base import Base
+from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
+from app.services.availability_service import AvailabilityService
+from app.services.location_service import LocationService
+from app.services.ride_archiver import RideArchiver
+from app.services.ride_assignment import assign_driver
+from app.services.ride_history import Cursor, RideHistory
+from app.services.surge_pricing import SurgePricingService
+
+# Statement kinds whose plans we check; inserts never scan
+PLANNED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def captured(engine):
+    """
+    Records every planned statement the engine runs, with its DBAPI parameters.
+    """
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in PLANNED_STATEMENTS:
+            statements.append((statement, parameters))
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+async def query_plan(engine, statement, parameters=()):
+    async with engine.connect() as conn:
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in result]
+
+def full_scans(plan):
+    # "SCAN rides" reads the whole table; "SCAN ... USING INDEX" only an
+    # index, and "SCAN anon_1" a subquery's already limited rows
+    return [
+        step for step in plan
+        if step.startswith("SCAN ") and step.split()[1] in Base.metadata.tables and " USING " not in step
+    ]
+
+async def seed(db_session):
+    rider = User(email="rider@plans.com", hashed_password="pw")
+    db_session.add(rider)
+    for driver_id, is_available in {10: True, 11: False}.items():
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}@plans.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"PLAN-{driver_id}", car_model="Tesla", is_available=is_available))
+    await db_session.commit()
+    rides = [
+        Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094, status=status)
+        for status in (RideStatus.REQUESTED, RideStatus.REQUESTED, RideStatus.COMPLETED)
+    ]
+    db_session.add_all(rides)
+    await db_session.commit()
+    return rider, rides
+
+@pytest.mark.asyncio
+async def test_hot_queries_use_indexes(engine, db_session: AsyncSession, redis_client, captured):
+    _, rides = await seed(db_session)
+    captured.clear()
+
+    # Surge demand, the availability reconcile, the assignment write path
+    # and the archiver
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await SurgePricingService(redis_client, LocationService(redis_client), session_factory=session_factory).demand_histogram()
+    await AvailabilityService(redis_client).reconcile(db_session)
+    await assign_driver(db_session, rides[0].id, 10, 1.0)
+    await RideArchiver(session_factory, archive_after=0).archive_batch()
+
+    plans = {statement: await query_plan(engine, statement, parameters) for statement, parameters in captured}
+    assert len(plans) >= 4
+    for statement, plan in plans.items():
+        assert not full_scans(plan), f"Sequential scan in {statement!r}: {plan}"
+    steps = " ".join(step for plan in plans.values() for step in plan)
+    assert "ix_rides_requested_created_at" in steps
+    assert "ix_driver_profiles_available" in steps
+    assert "ix_rides_finished_updated_at" in steps
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("owner, indexes", [
+    ("rider", ("ix_rides_rider_id_created_at", "ix_rides_archive_rider_id_created_at")),
+    ("driver", ("ix_rides_driver_id_created_at", "ix_rides_archive_driver_id_created_at")),
+])
+async def test_ride_history_seeks_to_the_cursor(engine, db_session: AsyncSession, captured, owner, indexes):
+    await RideHistory(db_session).page(owner, 1, limit=20, before=Cursor(datetime.utcnow(), 100))
+
+    [(statement, parameters)] = captured
+    plan = await query_plan(engine, statement, parameters)
+
+    assert not full_scans(plan)
+    # Both sides seek the (owner, created_at, id) index past the cursor
+    for index in indexes:
+        assert any(step.startswith("SEARCH") and f"INDEX {index} (" in step and "<" in step for step in plan)
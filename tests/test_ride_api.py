@@ -1,21 +1,35 @@
 import pytest
+from datetime import datetime
+from unittest.mock import patch
+from redis.exceptions import ConnectionError as RedisConnectionError
 from httpx import AsyncClient, ASGITransport
 from app.main import app
-from app.models.models import RideStatus, User, UserRole, Ride
+from app.models.models import ArchivedRide, DriverProfile, RideStatus, User, UserRole, Ride
 from app.db.base import get_db
+from app.db.redis import get_redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from fakeredis import FakeAsyncRedis
 
 @pytest.fixture
-def override_db(db_session):
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def override_db(db_session, redis_client):
     async def _override_get_db():
         yield db_session
+    async def _override_get_redis():
+        yield redis_client
     app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_redis] = _override_get_redis
     yield
     app.dependency_overrides.clear()
 
 @pytest.mark.asyncio
-async def test_create_ride_request(db_session: AsyncSession, override_db):
+async def test_create_ride_request(db_session: AsyncSession, redis_client, override_db):
     # Setup: Create a rider
     rider = User(email="rider@test.com", hashed_password="pw", role=UserRole.RIDER)
     db_session.add(rider)
@@ -36,8 +50,15 @@ async def test_create_ride_request(db_session: AsyncSession, override_db):
     data = response.json()
     assert data["status"] == "requested"
     assert data["rider_id"] == rider.id
+    # Priced from the local cost grid at request time
+    assert data["estimated_fare"] > 0
+    assert data["estimated_time"] > 0
     
     ride_id = data["id"]
+
+    # The ride is queued for the matching workers in its region's stream
+    entries = await redis_client.xrange("ride_requests:9q8")
+    assert [int(fields[b"ride_id"]) for _, fields in entries] == [ride_id]
     
     # Test getting ride status
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
@@ -52,4 +73,109 @@ async def test_get_ride_not_found(db_session: AsyncSession, override_db):
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get("/ride/999")
     assert response.status_code == 404
-    assert response.json()["detail"] == "Ride not found"
\ No newline at end of file
+    assert response.json()["detail"] == "Ride not found"
+
+@pytest.mark.asyncio
+async def test_get_archived_ride(db_session: AsyncSession, override_db):
+    db_session.add(ArchivedRide(
+        id=42, rider_id=7, driver_id=8, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094,
+        status=RideStatus.COMPLETED, created_at=datetime(2026, 1, 5, 8, 30),
+    ))
+    await db_session.commit()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/ride/42")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert response.json()["driver_id"] == 8
+
+@pytest.mark.asyncio
+async def test_create_ride_request_survives_queue_outage(db_session: AsyncSession, override_db):
+    rider = User(email="rider_outage@test.com", hashed_password="pw", role=UserRole.RIDER)
+    db_session.add(rider)
+    await db_session.commit()
+
+    with patch("app.routers.ride.RideRequestQueue.enqueue", side_effect=RedisConnectionError("down")):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            payload = {
+                "rider_id": rider.id,
+                "source_lat": 37.7749,
+                "source_long": -122.4194,
+                "dest_lat": 37.7849,
+                "dest_long": -122.4094
+            }
+            response = await ac.post("/ride/request", json=payload)
+
+    assert response.status_code == 201
+    assert response.json()["status"] == "requested"
+
+@pytest.mark.asyncio
+async def test_fare_estimate():
+    transport = ASGITransport(app=app)
+    payload = {"source_lat": 37.7749, "source_long": -122.4194, "dest_lat": 37.8049, "dest_long": -122.4094}
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/ride/fair-estimate", json=payload)
+        invalid = await ac.post("/ride/fair-estimate", json={**payload, "dest_lat": 95.0})
+
+    assert response.status_code == 200
+    data = response.json()
+    # ~3.4km as the crow flies, more by road
+    assert 3.4 < data["distance_km"] < 6.0
+    assert data["estimated_fare"] >= 7.0
+    assert data["estimated_time"] > 0
+    assert invalid.status_code == 422
+
+@pytest.mark.asyncio
+async def test_ride_status_is_served_from_cache_with_etag(db_session: AsyncSession, redis_client, override_db):
+    rider = User(email="rider_poll@test.com", hashed_password="pw", role=UserRole.RIDER)
+    driver = User(email="driver_poll@test.com", hashed_password="pw", role=UserRole.DRIVER)
+    db_session.add_all([rider, driver])
+    await db_session.commit()
+    db_session.add(DriverProfile(user_id=driver.id, license_plate="POLL-1", car_model="Tesla", is_available=True))
+    await db_session.commit()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        created = await ac.post("/ride/request", json={
+            "rider_id": rider.id, "source_lat": 37.7749, "source_long": -122.4194,
+            "dest_lat": 37.7849, "dest_long": -122.4094,
+        })
+        ride_id = created.json()["id"]
+
+        # Creation wrote the ride through to the cache, so polls skip Postgres
+        with patch.object(db_session, "execute", side_effect=AssertionError("database queried")):
+            first = await ac.get(f"/ride/{ride_id}")
+            etag = first.headers["etag"]
+            unchanged = await ac.get(f"/ride/{ride_id}", headers={"If-None-Match": etag})
+        assert first.status_code == 200
+        assert first.json()["status"] == "requested"
+        assert unchanged.status_code == 304
+        assert unchanged.headers["etag"] == etag
+
+        # Accepting invalidates the entry; the next poll sees the match
+        await ac.patch("/ride/driver/accept", json={"ride_id": ride_id, "driver_id": driver.id, "accept": True})
+        changed = await ac.get(f"/ride/{ride_id}", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.json()["status"] == "matched"
+    assert changed.headers["etag"] != etag
+
+@pytest.mark.asyncio
+async def test_ride_status_falls_back_to_database_when_cache_is_down(db_session: AsyncSession, redis_client, override_db):
+    rider = User(email="rider_nocache@test.com", hashed_password="pw", role=UserRole.RIDER)
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    await db_session.commit()
+
+    with patch.object(redis_client, "hgetall", side_effect=RedisConnectionError("down")):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.get(f"/ride/{ride.id}")
+
+    assert response.status_code == 200
+    assert response.json()["id"] == ride.id
@@ -0,0 +1,80 @@
+import pytest
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.models.models import ArchivedRide, Ride, RideStatus, User
+from app.services.ride_archiver import RideArchiver, archive_partition_name, next_month
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def create_rides(db_session, statuses, finished_ago):
+    rider = User(email=f"rider{len(statuses)}_{finished_ago}@archive.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    updated_at = datetime.utcnow() - timedelta(seconds=finished_ago)
+    rides = [
+        Ride(
+            rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094,
+            status=status, estimated_fare=12.5, created_at=updated_at - timedelta(minutes=20), updated_at=updated_at,
+        )
+        for status in statuses
+    ]
+    db_session.add_all(rides)
+    await db_session.commit()
+    return rides
+
+async def count(db_session, model):
+    return (await db_session.execute(select(func.count()).select_from(model))).scalar()
+
+def test_partition_months():
+    assert archive_partition_name(datetime(2026, 1, 31, 23, 59)) == "rides_archive_2026_01"
+    assert next_month(datetime(2026, 1, 31, 23, 59)) == datetime(2026, 2, 1)
+    assert next_month(datetime(2026, 12, 15)) == datetime(2027, 1, 1)
+
+@pytest.mark.asyncio
+async def test_archive_moves_only_old_finished_rides(db_session: AsyncSession, session_factory):
+    old = await create_rides(
+        db_session, [RideStatus.COMPLETED, RideStatus.CANCELLED, RideStatus.MATCHED], finished_ago=7200
+    )
+    recent = await create_rides(db_session, [RideStatus.COMPLETED], finished_ago=60)
+
+    archiver = RideArchiver(session_factory, archive_after=3600)
+
+    assert await archiver.archive() == 2
+    remaining = (await db_session.execute(select(Ride.id).execution_options(populate_existing=True))).scalars().all()
+    assert sorted(remaining) == sorted([old[2].id, recent[0].id])
+
+    archived = (await db_session.execute(select(ArchivedRide).order_by(ArchivedRide.id))).scalars().all()
+    assert [ride.id for ride in archived] == [old[0].id, old[1].id]
+    # Every column is carried over
+    assert archived[0].status == RideStatus.COMPLETED
+    assert archived[0].estimated_fare == 12.5
+    assert archived[0].created_at == old[0].created_at
+
+@pytest.mark.asyncio
+async def test_archive_runs_in_batches(db_session: AsyncSession, session_factory):
+    await create_rides(db_session, [RideStatus.COMPLETED] * 5, finished_ago=7200)
+
+    archiver = RideArchiver(session_factory, archive_after=3600, batch_size=2)
+
+    assert await archiver.archive_batch() == 2
+    assert await archiver.archive() == 3
+    assert archiver.archived == 5
+    assert await count(db_session, Ride) == 0
+    assert await count(db_session, ArchivedRide) == 5
+
+@pytest.mark.asyncio
+async def test_archiver_runs_in_background(db_session: AsyncSession, session_factory):
+    await create_rides(db_session, [RideStatus.COMPLETED], finished_ago=7200)
+
+    async with RideArchiver(session_factory, archive_after=3600, interval=0.01) as archiver:
+        for _ in range(50):
+            if archiver.archived:
+                break
+            await asyncio.sleep(0.01)
+
+    assert archiver.archived == 1
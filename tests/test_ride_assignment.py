@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Ride, User, DriverProfile, RideStatus, UserRole
+from app.services.ride_assignment import AssignmentResult, _claim_ride_reporting, assign_driver
+
+async def create_ride_and_drivers(db_session, prefix, drivers):
+    rider = User(email=f"rider_{prefix}@assign.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    for driver_id, is_available in drivers.items():
+        db_session.add(User(id=driver_id, email=f"driver{driver_id}_{prefix}@assign.com", hashed_password="pw", role=UserRole.DRIVER))
+        db_session.add(DriverProfile(user_id=driver_id, license_plate=f"{prefix}-{driver_id}", car_model="Tesla", is_available=is_available))
+    await db_session.commit()
+    return ride
+
+async def is_available(db_session, driver_id):
+    result = await db_session.execute(
+        select(DriverProfile.is_available).where(DriverProfile.user_id == driver_id)
+    )
+    return result.scalar()
+
+@pytest.mark.asyncio
+async def test_first_assignment_wins(db_session: AsyncSession):
+    ride = await create_ride_and_drivers(db_session, "race", {10: True, 11: True})
+    ride_id = ride.id
+
+    assert await assign_driver(db_session, ride_id, 10, match_radius_km=1.0) == AssignmentResult.ASSIGNED
+    assert await assign_driver(db_session, ride_id, 11) == AssignmentResult.RIDE_NOT_REQUESTED
+    # A retried accept by the winner is recognised
+    assert await assign_driver(db_session, ride_id, 10) == AssignmentResult.ALREADY_ASSIGNED
+
+    ride = await db_session.get(Ride, ride_id, populate_existing=True)
+    assert ride.status == RideStatus.MATCHED
+    assert ride.driver_id == 10
+    assert ride.match_radius_km == 1.0
+    assert await is_available(db_session, 10) is False
+    # The loser was never touched
+    assert await is_available(db_session, 11) is True
+
+@pytest.mark.asyncio
+async def test_unavailable_driver_leaves_ride_requested(db_session: AsyncSession):
+    ride = await create_ride_and_drivers(db_session, "busy", {10: False})
+    ride_id = ride.id
+
+    assert await assign_driver(db_session, ride_id, 10) == AssignmentResult.DRIVER_NOT_AVAILABLE
+
+    ride = await db_session.get(Ride, ride_id, populate_existing=True)
+    assert ride.status == RideStatus.REQUESTED
+    assert ride.driver_id is None
+
+@pytest.mark.asyncio
+async def test_missing_ride_or_driver(db_session: AsyncSession):
+    ride = await create_ride_and_drivers(db_session, "missing", {10: True})
+
+    assert await assign_driver(db_session, 999, 10) == AssignmentResult.RIDE_NOT_FOUND
+    assert await assign_driver(db_session, ride.id, 999) == AssignmentResult.DRIVER_NOT_FOUND
+    assert await is_available(db_session, 10) is True
+
+def test_postgres_claim_reports_status_in_one_statement():
+    sql = str(_claim_ride_reporting(1, 10, 1.0).compile(dialect=postgresql.dialect()))
+
+    # The conditional UPDATE and the status read are one round trip
+    assert sql.startswith("WITH claimed AS \n(UPDATE rides SET")
+    assert "RETURNING rides.id" in sql
+    assert "SELECT rides.status, rides.driver_id, EXISTS" in sql
@@ -0,0 +1,137 @@
+import pytest
+import asyncio
+import json
+from fakeredis import FakeAsyncRedis
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.main import app
+from app.db.base import get_db
+from app.db.redis import get_redis
+from app.models.models import Ride, RideStatus, User
+from app.services.ride_events import (
+    RideEventHub, RideEventPublisher, driver_ride_key, get_ride_event_hub, ride_channel
+)
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+async def hub(redis_client):
+    async with RideEventHub(redis_client) as hub:
+        yield hub
+
+@pytest.fixture
+def override_deps(db_session, redis_client, hub):
+    async def _override_get_db():
+        yield db_session
+    async def _override_get_redis():
+        yield redis_client
+    app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_redis] = _override_get_redis
+    app.dependency_overrides[get_ride_event_hub] = lambda: hub
+    yield
+    app.dependency_overrides.clear()
+
+async def wait_for_subscribers(redis_client, ride_id, count=1):
+    for _ in range(100):
+        [(_, subscribers)] = await redis_client.pubsub_numsub(ride_channel(ride_id))
+        if subscribers >= count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"No subscriber on ride {ride_id}")
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+@pytest.mark.asyncio
+async def test_hub_fans_out_to_listeners(redis_client, hub):
+    publisher = RideEventPublisher(redis_client)
+
+    async with hub.listen(1) as first, hub.listen(1) as second, hub.listen(2) as other:
+        await wait_for_subscribers(redis_client, 1)
+        await publisher.ride_matched(1, 10)
+        await publisher.driver_positions([(10, 37.7749, -122.4194), (11, 37.0, -122.0)])
+
+        for queue in (first, second):
+            matched = await asyncio.wait_for(queue.get(), 2)
+            position = await asyncio.wait_for(queue.get(), 2)
+            assert matched == {"type": "status", "ride_id": 1, "status": "matched", "driver_id": 10}
+            assert position == {"type": "position", "ride_id": 1, "driver_id": 10, "lat": 37.7749, "long": -122.4194}
+        assert other.empty()
+
+    # The last listener to leave unsubscribes the channel
+    await asyncio.sleep(0.05)
+    assert await redis_client.pubsub_numsub(ride_channel(1)) == [(ride_channel(1).encode(), 0)]
+
+@pytest.mark.asyncio
+async def test_final_status_stops_position_updates(redis_client):
+    publisher = RideEventPublisher(redis_client)
+    await publisher.ride_matched(1, 10)
+    assert await redis_client.get(driver_ride_key(10)) == b"1"
+    assert await publisher.driver_positions([(10, 37.7749, -122.4194)]) == 1
+
+    await publisher.status_changed(1, RideStatus.COMPLETED, 10)
+
+    assert await redis_client.get(driver_ride_key(10)) is None
+    assert await publisher.driver_positions([(10, 37.7749, -122.4194)]) == 0
+
+@pytest.mark.asyncio
+async def test_ride_event_stream(db_session: AsyncSession, redis_client, override_deps):
+    rider = User(email="rider@events.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    db_session.add(ride)
+    await db_session.commit()
+    ride_id = ride.id
+
+    async def drive():
+        # What matching, the location gateway and drop-off publish
+        await wait_for_subscribers(redis_client, ride_id)
+        publisher = RideEventPublisher(redis_client)
+        await publisher.ride_matched(ride_id, 10)
+        await publisher.driver_positions([(10, 37.7760, -122.4194)])
+        await publisher.status_changed(ride_id, RideStatus.COMPLETED, 10)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response, _ = await asyncio.wait_for(
+            asyncio.gather(ac.get(f"/ride/{ride_id}/events"), drive()), 5
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["ride", "status", "position", "status"]
+    assert events[0][1]["status"] == "requested"
+    assert events[1][1]["driver_id"] == 10
+    assert events[2][1]["lat"] == 37.7760
+    # The stream ends with the ride
+    assert events[3][1]["status"] == "completed"
+
+@pytest.mark.asyncio
+async def test_ride_event_stream_for_finished_or_missing_ride(db_session: AsyncSession, override_deps):
+    rider = User(email="rider_done@events.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    ride = Ride(
+        rider_id=rider.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094,
+        status=RideStatus.CANCELLED,
+    )
+    db_session.add(ride)
+    await db_session.commit()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        finished = await asyncio.wait_for(ac.get(f"/ride/{ride.id}/events"), 5)
+        missing = await ac.get("/ride/999/events")
+
+    assert [name for name, _ in parse_sse(finished.text)] == ["ride"]
+    assert missing.status_code == 404
@@ -0,0 +1,94 @@
+import pytest
+from datetime import datetime, timedelta
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.main import app
+from app.db.base import get_db
+from app.models.models import ArchivedRide, Ride, RideStatus, User, UserRole
+from app.services.ride_history import Cursor, RideHistory, decode_cursor, encode_cursor
+
+START = datetime(2026, 3, 1, 8, 0)
+
+@pytest.fixture
+def override_db(db_session):
+    async def _override_get_db():
+        yield db_session
+    app.dependency_overrides[get_db] = _override_get_db
+    yield
+    app.dependency_overrides.clear()
+
+async def create_history(db_session):
+    """
+    Seven rides for one rider and driver: four archived, three still hot,
+    two of them created in the same instant.
+    """
+    rider = User(email="rider@history.com", hashed_password="pw")
+    driver = User(email="driver@history.com", hashed_password="pw", role=UserRole.DRIVER)
+    db_session.add_all([rider, driver])
+    await db_session.commit()
+    trip = dict(rider_id=rider.id, driver_id=driver.id, source_lat=37.7749, source_long=-122.4194, dest_lat=37.7849, dest_long=-122.4094)
+    for hours in range(4):
+        db_session.add(ArchivedRide(id=hours + 1, status=RideStatus.COMPLETED, created_at=START + timedelta(hours=hours), **trip))
+    await db_session.commit()
+    for ride_id, hours in ((5, 4), (6, 5), (7, 5)):
+        db_session.add(Ride(id=ride_id, status=RideStatus.MATCHED, created_at=START + timedelta(hours=hours), **trip))
+    # Another rider's ride, never listed
+    db_session.add(Ride(id=8, rider_id=driver.id, status=RideStatus.REQUESTED, created_at=START, **{
+        key: value for key, value in trip.items() if key not in ("rider_id", "driver_id")
+    }))
+    await db_session.commit()
+    return rider, driver
+
+def test_cursor_round_trip():
+    cursor = Cursor(datetime(2026, 3, 1, 8, 0, 0, 123456), 42)
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+@pytest.mark.asyncio
+async def test_pages_span_hot_and_archived_rides(db_session: AsyncSession):
+    rider, _ = await create_history(db_session)
+    history = RideHistory(db_session)
+
+    seen, cursor = [], None
+    while True:
+        page = await history.page("rider", rider.id, limit=3, before=cursor and decode_cursor(cursor))
+        assert len(page.rides) <= 3
+        seen.extend(ride["id"] for ride in page.rides)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    # Newest first; ties on created_at are broken by ID
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+@pytest.mark.asyncio
+async def test_rider_and_driver_history_api(db_session: AsyncSession, override_db):
+    rider, driver = await create_history(db_session)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        first = await ac.get(f"/riders/{rider.id}/rides", params={"limit": 4})
+        second = await ac.get(f"/riders/{rider.id}/rides", params={"limit": 4, "cursor": first.json()["next_cursor"]})
+        driver_page = await ac.get(f"/drivers/{driver.id}/rides")
+
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/json"
+    assert [ride["id"] for ride in first.json()["rides"]] == [7, 6, 5, 4]
+    assert first.json()["rides"][3]["status"] == "completed"
+    assert first.json()["rides"][0]["created_at"] == "2026-03-01T13:00:00"
+    assert [ride["id"] for ride in second.json()["rides"]] == [3, 2, 1]
+    assert second.json()["next_cursor"] is None
+    assert [ride["id"] for ride in driver_page.json()["rides"]] == [7, 6, 5, 4, 3, 2, 1]
+
+@pytest.mark.asyncio
+async def test_history_rejects_bad_requests(db_session: AsyncSession, override_db):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        bad_cursor = await ac.get("/riders/1/rides", params={"cursor": "garbage"})
+        too_large = await ac.get("/riders/1/rides", params={"limit": 1000})
+        empty = await ac.get("/drivers/1/rides")
+
+    assert bad_cursor.status_code == 400
+    assert too_large.status_code == 422
+    assert empty.json() == {"rides": [], "next_cursor": None}
@@ -0,0 +1,77 @@
+import pytest
+from fakeredis import FakeAsyncRedis
+from app.services.ride_queue import RideRequestQueue
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_enqueue_partitions_by_region(redis_client):
+    queue = RideRequestQueue(redis_client)
+
+    await queue.enqueue(1, 37.7749, -122.4194) # San Francisco
+    await queue.enqueue(2, 37.6879, -122.4702) # Daly City, same partition
+    await queue.enqueue(3, 34.0522, -118.2437) # Los Angeles
+
+    sf_stream = queue.stream_for(37.7749, -122.4194)
+    la_stream = queue.stream_for(34.0522, -118.2437)
+    assert sf_stream == "ride_requests:9q8"
+    assert await queue.streams() == sorted([sf_stream, la_stream])
+    assert await redis_client.xlen(sf_stream) == 2
+    assert await redis_client.xlen(la_stream) == 1
+
+@pytest.mark.asyncio
+async def test_read_and_ack(redis_client):
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(1, 37.7749, -122.4194, attempt=2)
+    stream = queue.stream_for(37.7749, -122.4194)
+    await queue.ensure_group(stream)
+    await queue.ensure_group(stream) # idempotent
+
+    entries = await queue.read("worker-1", [stream], count=10)
+
+    assert len(entries) == 1
+    entry = entries[0]
+    assert (entry.ride_id, entry.attempt, entry.stream) == (1, 2, stream)
+    assert abs(entry.lat - 37.7749) < 1e-9
+    # Already delivered to this group
+    assert await queue.read("worker-2", [stream], count=10) == []
+
+    await queue.ack(entry)
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+    assert await redis_client.xlen(stream) == 0
+
+@pytest.mark.asyncio
+async def test_reclaim_orphaned_entries(redis_client):
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(1, 37.7749, -122.4194)
+    stream = queue.stream_for(37.7749, -122.4194)
+    await queue.ensure_group(stream)
+
+    # worker-1 reads the entry and then dies without acknowledging it
+    await queue.read("worker-1", [stream])
+
+    reclaimed = await queue.reclaim("worker-2", stream, min_idle_ms=0)
+    assert [entry.ride_id for entry in reclaimed] == [1]
+
+@pytest.mark.asyncio
+async def test_dead_letter(redis_client):
+    queue = RideRequestQueue(redis_client)
+    await queue.enqueue(1, 37.7749, -122.4194, attempt=4)
+    stream = queue.stream_for(37.7749, -122.4194)
+    await queue.ensure_group(stream)
+    entry = (await queue.read("worker-1", [stream]))[0]
+
+    await queue.dead_letter(entry, "no_driver")
+
+    dead = await redis_client.xrange("ride_requests:dead")
+    assert dead[0][1][b"ride_id"] == b"1"
+    assert dead[0][1][b"reason"] == b"no_driver"
+    assert (await redis_client.xpending(stream, "matchers"))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_read_with_no_streams(redis_client):
+    assert await RideRequestQueue(redis_client).read("worker-1", []) == []
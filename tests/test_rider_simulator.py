@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from app.scripts.rider_simulator import Surge, generate_workload, load_workload, run_workload, save_workload
+
+def test_workload_is_deterministic_for_a_seed():
+    first = generate_workload(duration=120, rate=2.0, seed=3)
+    second = generate_workload(duration=120, rate=2.0, seed=3)
+
+    assert first == second
+    assert first != generate_workload(duration=120, rate=2.0, seed=4)
+    times = [event.at for event in first]
+    assert times == sorted(times) and 0 <= times[0] and times[-1] < 120
+    # Roughly Poisson: 240 expected arrivals
+    assert 180 < len(first) < 300
+
+def test_surge_raises_demand_around_its_center():
+    surge = Surge(start=100, duration=100, multiplier=5.0, lat=37.80, long=-122.41, radius_km=0.5)
+    events = generate_workload(duration=300, rate=1.0, surges=[surge], seed=1)
+
+    during = [event for event in events if 125 <= event.at < 175]
+    before = [event for event in events if 25 <= event.at < 75]
+    assert len(during) > 2.5 * len(before)
+    # Most surge-time pickups are close to the surge center
+    near = [e for e in during if abs(e.source_lat - surge.lat) < 0.01 and abs(e.source_long - surge.long) < 0.01]
+    assert len(near) > len(during) / 2
+
+def test_workload_round_trips_through_a_file(tmp_path):
+    events = generate_workload(duration=30, rate=1.0, surges=[Surge(5, 10, 3.0, 37.77, -122.42)], seed=2)
+    path = str(tmp_path / "workload.jsonl")
+
+    save_workload(path, events, {"seed": 2})
+
+    assert load_workload(path) == events
+
+@pytest.mark.asyncio
+async def test_run_workload_matches_rides_end_to_end(tmp_path, monkeypatch):
+    events = generate_workload(duration=5, rate=2.0, seed=5, radius_km=1.0)
+    replay_dir = tmp_path / "replay"
+    replay_dir.mkdir()
+    monkeypatch.setattr("app.scripts.rider_simulator.tempfile.mkdtemp", lambda: str(replay_dir))
+
+    report = await run_workload(events, drivers=30, speed=20.0, concurrency=4, drain=5.0, radius_km=1.0, seed=5)
+
+    assert report["requested"] == len(events)
+    assert report["matched"] == len(events)
+    assert report["match_rate"] == 1.0
+    assert report["time_to_match_s"]["p50"] <= report["time_to_match_s"]["p99"]
+    assert np.isfinite(report["pickup_km"]["p95"])
+    # The replay database is cleaned up
+    assert not replay_dir.exists()
+
+@pytest.mark.asyncio
+async def test_run_workload_in_offer_mode_exercises_accepts():
+    events = generate_workload(duration=5, rate=2.0, seed=6, radius_km=1.0)
+
+    report = await run_workload(
+        events, drivers=30, speed=20.0, concurrency=4, drain=5.0, radius_km=1.0, seed=6, mode="offer"
+    )
+
+    # Under contention a ride can run out of unlocked drivers and be
+    # dead-lettered; every ride is settled either way
+    assert report["matched"] + report["dead_lettered"] == len(events)
+    assert report["matched"] > 0
+    # Every match came from a driver's accept, after their offer was pushed
+    assert report["accepts"]["accepted"] >= report["matched"]
+    assert report["notifications"]["delivered"] >= report["matched"]
@@ -1,14 +1,16 @@
+import math
+import numpy as np
 import pytest
 from unittest.mock import patch
-from app.scripts.driver_simulator import simulate
+from app.scripts.driver_simulator import DriverFleet, METERS_PER_DEGREE_LAT, simulate
 from fakeredis import FakeAsyncRedis
 
 @pytest.mark.asyncio
 async def test_simulate_logic():
-    # Mock Redis.from_url to return FakeAsyncRedis
-    with patch("app.scripts.driver_simulator.Redis.from_url") as mock_from_url:
+    # Mock create_redis to return FakeAsyncRedis
+    with patch("app.scripts.driver_simulator.create_redis") as mock_create_redis:
         fake_redis = FakeAsyncRedis()
-        mock_from_url.return_value = fake_redis
+        mock_create_redis.return_value = fake_redis
         
         # Run for 1 iteration
         await simulate(driver_ids=[1], interval=0.1, redis_url="redis://dummy", iterations=1)
@@ -17,4 +19,40 @@ async def test_simulate_logic():
         pos = await fake_redis.geopos("driver_locations", "1")
         assert pos[0] is not None
         
-        await fake_redis.aclose()
\ No newline at end of file
+        await fake_redis.aclose()
+
+def test_fleet_moves_within_city_and_speed_limits():
+    fleet = DriverFleet(range(5000), seed=1)
+    start = fleet.positions.copy()
+
+    for _ in range(60):
+        fleet.step(1.0)
+
+    assert (fleet.positions >= fleet.lower).all() and (fleet.positions <= fleet.upper).all()
+    assert (fleet.speeds >= 0).all() and (fleet.speeds <= fleet.speed_limits).all()
+    # Everyone drives along the street grid
+    quarter_turns = fleet.headings / (math.pi / 2)
+    assert np.allclose(quarter_turns, np.round(quarter_turns))
+    moved_m = np.abs(fleet.positions - start)[:, 0] * METERS_PER_DEGREE_LAT
+    # Nobody covers more than a minute at 80 km/h
+    assert moved_m.max() <= 22.2 * 60 + 1
+    assert moved_m.mean() > 0
+
+@pytest.mark.asyncio
+async def test_simulate_many_drivers_with_concurrent_writers():
+    with patch("app.scripts.driver_simulator.create_redis") as mock_create_redis:
+        fake_redis = FakeAsyncRedis()
+        mock_create_redis.return_value = fake_redis
+
+        stats = await simulate(
+            driver_ids=list(range(1, 2001)), interval=1.0, redis_url="redis://dummy",
+            iterations=2, rate=1000000, writers=3, batch_size=250, seed=7,
+        )
+
+        assert stats.updates == 4000
+        assert stats.ticks == 2
+        assert stats.target_rate == pytest.approx(1000000)
+        assert stats.achieved_rate > 0
+        assert await fake_redis.zcard("driver_locations") == 2000
+
+        await fake_redis.aclose()
@@ -0,0 +1,39 @@
+import pytest
+import asyncio
+import time
+from fakeredis import FakeAsyncRedis
+from app.services.location_service import LocationService
+from app.services.stale_driver_sweeper import StaleDriverSweeper
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_sweep_evicts_and_counts(redis_client):
+    service = LocationService(redis_client)
+    await service.update_locations_bulk([(1, 37.7749, -122.4194), (2, 37.7750, -122.4194)])
+    await redis_client.zadd("driver_locations:seen", {"1": time.time() - 120})
+
+    sweeper = StaleDriverSweeper(service, max_age_seconds=60)
+
+    assert await sweeper.sweep() == 1
+    assert sweeper.evicted == 1
+    assert await redis_client.zcard("driver_locations") == 1
+
+@pytest.mark.asyncio
+async def test_sweeper_runs_in_background(redis_client):
+    service = LocationService(redis_client)
+    await service.update_location(1, 37.7749, -122.4194)
+    await redis_client.zadd("driver_locations:seen", {"1": time.time() - 120})
+
+    async with StaleDriverSweeper(service, interval=0.01) as sweeper:
+        for _ in range(50):
+            if sweeper.evicted:
+                break
+            await asyncio.sleep(0.01)
+
+    assert sweeper.evicted == 1
+    assert await redis_client.zcard("driver_locations") == 0
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+import time
+from datetime import datetime, timedelta
+from fakeredis import FakeAsyncRedis
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.models.models import Ride, RideStatus, User
+from app.services.availability_service import AvailabilityService
+from app.services.fare_estimator import CostGrid, FareEstimator
+from app.services.geo_sharding import geohash_encode
+from app.services.location_service import LocationService
+from app.services.surge_pricing import (
+    MAX_SURGE_MULTIPLIER, CellGrid, SurgeMap, SurgeMapUpdater, SurgePricingService, surge_multipliers
+)
+
+HOT_SPOT = (37.7749, -122.4194)
+QUIET_SPOT = (37.7400, -122.4600)
+
+@pytest.fixture
+async def redis_client():
+    client = FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+def test_surge_multipliers():
+    demand = np.array([0, 2, 3, 6, 10, 100], dtype=float)
+    supply = np.array([0, 0, 3, 2, 0, 1], dtype=float)
+
+    multipliers = surge_multipliers(demand, supply)
+
+    # Too little demand, balanced, 3x demand, and two capped cells
+    assert multipliers.tolist() == pytest.approx([1.0, 1.0, 1.0, 2.0, MAX_SURGE_MULTIPLIER, MAX_SURGE_MULTIPLIER])
+
+def test_cell_grid_bins_are_geohash_cells():
+    grid = CellGrid(HOT_SPOT, radius_km=5.0, precision=6)
+    points = np.array([HOT_SPOT, HOT_SPOT, QUIET_SPOT, (40.0, -100.0)])
+
+    counts = grid.histogram(points[:, 0], points[:, 1])
+
+    # The far-away point falls outside the grid
+    assert counts.sum() == 3
+    cells = {grid.cell(row, col): counts[row, col] for row, col in zip(*np.nonzero(counts))}
+    assert cells == {geohash_encode(*HOT_SPOT, 6): 2, geohash_encode(*QUIET_SPOT, 6): 1}
+
+@pytest.mark.asyncio
+async def test_recompute_publishes_surging_cells(engine, db_session: AsyncSession, redis_client):
+    rider = User(email="rider@surge.com", hashed_password="pw")
+    db_session.add(rider)
+    await db_session.commit()
+    def ride(point, **columns):
+        return Ride(rider_id=rider.id, source_lat=point[0], source_long=point[1], dest_lat=37.78, dest_long=-122.41, **columns)
+    db_session.add_all(
+        [ride(HOT_SPOT) for _ in range(6)]
+        + [ride(QUIET_SPOT) for _ in range(3)]
+        # Matched and old requests are not open demand
+        + [ride(HOT_SPOT, status=RideStatus.MATCHED) for _ in range(10)]
+        + [ride(HOT_SPOT, created_at=datetime.utcnow() - timedelta(hours=1)) for _ in range(10)]
+    )
+    await db_session.commit()
+
+    location_service = LocationService(redis_client)
+    availability = AvailabilityService(redis_client)
+    # Two available drivers at the hot spot, one busy; three at the quiet spot
+    await location_service.update_locations_bulk(
+        [(1, *HOT_SPOT), (2, *HOT_SPOT), (3, *HOT_SPOT), (4, *QUIET_SPOT), (5, *QUIET_SPOT), (6, *QUIET_SPOT)]
+    )
+    for driver_id in (1, 2, 4, 5, 6):
+        await availability.mirror(driver_id, True)
+
+    service = SurgePricingService(
+        redis_client,
+        location_service,
+        session_factory=sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+        center=HOT_SPOT,
+        radius_km=5.0,
+    )
+    surge_map = await service.recompute()
+
+    assert surge_map.multipliers == {geohash_encode(*HOT_SPOT, 6): 2.0}
+    assert await service.load() == surge_map
+
+@pytest.mark.asyncio
+async def test_supply_skips_drivers_who_stopped_pinging(redis_client):
+    location_service = LocationService(redis_client)
+    availability = AvailabilityService(redis_client)
+    await location_service.update_locations_bulk([(1, *HOT_SPOT), (2, *HOT_SPOT), (3, *QUIET_SPOT)])
+    for driver_id in (1, 2, 3):
+        await availability.mirror(driver_id, True)
+    # Driver 2's app crashed a minute ago, leaving them available
+    await redis_client.zadd("driver_locations:seen", {"2": time.time() - 60})
+
+    service = SurgePricingService(redis_client, location_service, center=HOT_SPOT, radius_km=5.0)
+    supply = await service.supply_histogram()
+
+    assert supply.sum() == 2
+    cells = {service.grid.cell(row, col): supply[row, col] for row, col in zip(*np.nonzero(supply))}
+    assert cells == {geohash_encode(*HOT_SPOT, 6): 1, geohash_encode(*QUIET_SPOT, 6): 1}
+
+@pytest.mark.asyncio
+async def test_fare_estimates_read_the_surge_map_from_memory(redis_client):
+    estimator = FareEstimator(CostGrid(center=HOT_SPOT, radius_km=5.0))
+    at = datetime(2024, 1, 1, 12)
+    base = estimator.estimate(HOT_SPOT, (37.80, -122.40), at)
+
+    surge_map = SurgeMap(6, {geohash_encode(*HOT_SPOT, 6): 1.5}, 0.0)
+    await redis_client.set("surge_map", surge_map.to_json())
+    updater = SurgeMapUpdater(
+        SurgePricingService(redis_client, LocationService(redis_client)), on_update=estimator.set_surge_map
+    )
+    await updater.update()
+
+    surged = estimator.estimate(HOT_SPOT, (37.80, -122.40), at)
+    assert surged.surge_multiplier == 1.5
+    assert surged.fare == pytest.approx(round(base.fare * 1.5, 2))
+    # Only the pickup cell surges
+    assert estimator.estimate(QUIET_SPOT, (37.80, -122.40), at).surge_multiplier == 1.0